@@ -0,0 +1,47 @@
+"""index coreiotdata by device and time
+
+Revision ID: 3f6b2c9d8e41
+Revises: cb8b5d6f7593
+Create Date: 2025-06-10 10:12:44.512230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6b2c9d8e41'
+down_revision = 'cb8b5d6f7593'
+branch_labels = None
+depends_on = None
+
+# The device every reading came from before devices were registered
+DEFAULT_DEVICE_ID = '6c1945c0-0555-11f0-a887-6d1a184f2bb5'
+
+
+def upgrade():
+    op.add_column('coreiotdata', sa.Column('device_id', sa.Uuid(), nullable=True))
+    # Every existing reading came from the single hardcoded device
+    op.execute(
+        sa.text("UPDATE coreiotdata SET device_id = :device_id WHERE device_id IS NULL")
+        .bindparams(device_id=DEFAULT_DEVICE_ID)
+    )
+    op.create_index(
+        'ix_coreiotdata_device_id_timestamp',
+        'coreiotdata',
+        ['device_id', 'timestamp'],
+        unique=False,
+    )
+    op.create_index(
+        'ix_coreiotdata_timestamp_brin',
+        'coreiotdata',
+        ['timestamp'],
+        unique=False,
+        postgresql_using='brin',
+    )
+
+
+def downgrade():
+    op.drop_index('ix_coreiotdata_timestamp_brin', table_name='coreiotdata')
+    op.drop_index('ix_coreiotdata_device_id_timestamp', table_name='coreiotdata')
+    op.drop_column('coreiotdata', 'device_id')
@@ -0,0 +1,30 @@
+"""record the inserting transaction of each notification
+
+Revision ID: 4c7e1a9b2d63
+Revises: b3e8d1f0c6a2
+Create Date: 2025-06-30 10:02:51.384417
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7e1a9b2d63'
+down_revision = 'b3e8d1f0c6a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled in by Postgres and not mapped on the model, the since-feed reads
+    # it to find the rows a client's snapshot did not see
+    op.execute(
+        'ALTER TABLE notification '
+        'ADD COLUMN xid xid8 NOT NULL DEFAULT pg_current_xact_id()'
+    )
+    op.create_index('ix_notification_user_id_xid', 'notification', ['user_id', 'xid'])
+
+
+def downgrade():
+    op.drop_index('ix_notification_user_id_xid', table_name='notification')
+    op.drop_column('notification', 'xid')
@@ -0,0 +1,63 @@
+"""add coreiot rollup table
+
+Revision ID: 7d2e5a1c9b30
+Revises: 3f6b2c9d8e41
+Create Date: 2025-06-11 09:41:27.118904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e5a1c9b30'
+down_revision = '3f6b2c9d8e41'
+branch_labels = None
+depends_on = None
+
+METRICS = ('temperature', 'humidity', 'light')
+RESOLUTIONS = {'1m': '1 minute', '15m': '15 minutes', '1h': '1 hour'}
+
+
+def upgrade():
+    metric_columns = []
+    for metric in METRICS:
+        metric_columns += [
+            sa.Column(f'{metric}_min', sa.Float(), nullable=False),
+            sa.Column(f'{metric}_max', sa.Float(), nullable=False),
+            sa.Column(f'{metric}_sum', sa.Float(), nullable=False),
+            sa.Column(f'{metric}_last', sa.Float(), nullable=False),
+        ]
+    op.create_table('coreiotrollup',
+    sa.Column('resolution', sqlmodel.sql.sqltypes.AutoString(length=8), nullable=False),
+    sa.Column('device_id', sa.Uuid(), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+    *metric_columns,
+    sa.PrimaryKeyConstraint('resolution', 'device_id', 'bucket')
+    )
+
+    # Backfill from the readings stored so far
+    aggregates = ', '.join(
+        f'min({m}), max({m}), sum({m}), (array_agg({m} ORDER BY timestamp DESC))[1]'
+        for m in METRICS
+    )
+    columns = ', '.join(f'{m}_min, {m}_max, {m}_sum, {m}_last' for m in METRICS)
+    for resolution, width in RESOLUTIONS.items():
+        op.execute(
+            f"""
+            INSERT INTO coreiotrollup (resolution, device_id, bucket, count, last_timestamp, {columns})
+            SELECT '{resolution}', device_id,
+                   date_bin('{width}', timestamp, TIMESTAMP '1970-01-01') AS bucket,
+                   count(*), max(timestamp), {aggregates}
+            FROM coreiotdata
+            WHERE device_id IS NOT NULL
+            GROUP BY device_id, bucket
+            """
+        )
+
+
+def downgrade():
+    op.drop_table('coreiotrollup')
@@ -0,0 +1,39 @@
+"""add forecast state, drop last_trained_at
+
+Revision ID: a6d40e9f7c21
+Revises: f3a9c6e1d2b7
+Create Date: 2025-06-23 09:12:37.508114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d40e9f7c21'
+down_revision = 'f3a9c6e1d2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('forecaststate',
+    sa.Column('device_id', sa.Uuid(), nullable=False),
+    sa.Column('metric', sqlmodel.sql.sqltypes.AutoString(length=16), nullable=False),
+    sa.Column('level', sa.Float(), nullable=False),
+    sa.Column('trend', sa.Float(), nullable=False),
+    sa.Column('variance', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['device_id'], ['device.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('device_id', 'metric')
+    )
+    # Forecasts are updated online, there is no training step to track
+    op.drop_column('user', 'last_trained_at')
+
+
+def downgrade():
+    op.add_column('user', sa.Column('last_trained_at', sa.DateTime(timezone=True), nullable=True))
+    op.drop_table('forecaststate')
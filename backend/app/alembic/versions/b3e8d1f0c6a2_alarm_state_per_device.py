@@ -0,0 +1,69 @@
+"""keep alarm evaluation state per device
+
+Revision ID: b3e8d1f0c6a2
+Revises: f1c7a9d3e5b2
+Create Date: 2025-06-27 09:18:44.702315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8d1f0c6a2'
+down_revision = 'f1c7a9d3e5b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('alarmdevicestate',
+    sa.Column('alarm_id', sa.Uuid(), nullable=False),
+    sa.Column('device_id', sa.Uuid(), nullable=False),
+    sa.Column('is_firing', sa.Boolean(), nullable=False),
+    sa.Column('pending_since', sa.DateTime(), nullable=True),
+    sa.Column('last_fired_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['alarm_id'], ['alarm.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['device_id'], ['device.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('alarm_id', 'device_id')
+    )
+    op.create_index(
+        'ix_alarmdevicestate_engaged',
+        'alarmdevicestate',
+        ['device_id', 'alarm_id'],
+        postgresql_where=sa.text('is_firing OR pending_since IS NOT NULL'),
+    )
+    # The shared state carries over to every device the alarm watches, so
+    # firing alarms do not fire again on upgrade
+    op.execute(
+        """
+        INSERT INTO alarmdevicestate (alarm_id, device_id, is_firing, pending_since, last_fired_at)
+        SELECT alarm.id, userdevicelink.device_id, alarm.is_firing, alarm.pending_since,
+               alarm.last_fired_at
+        FROM alarm JOIN userdevicelink ON userdevicelink.user_id = alarm.user_id
+        WHERE alarm.is_firing OR alarm.pending_since IS NOT NULL
+            OR alarm.last_fired_at IS NOT NULL
+        """
+    )
+    op.drop_index('ix_alarm_engaged', table_name='alarm')
+    op.drop_column('alarm', 'pending_since')
+
+
+def downgrade():
+    op.add_column('alarm', sa.Column('pending_since', sa.DateTime(), nullable=True))
+    op.execute(
+        """
+        UPDATE alarm SET pending_since = (
+            SELECT min(pending_since) FROM alarmdevicestate
+            WHERE alarmdevicestate.alarm_id = alarm.id
+        )
+        """
+    )
+    op.create_index(
+        'ix_alarm_engaged',
+        'alarm',
+        ['id'],
+        postgresql_where=sa.text('is_firing OR pending_since IS NOT NULL'),
+    )
+    op.drop_index('ix_alarmdevicestate_engaged', table_name='alarmdevicestate')
+    op.drop_table('alarmdevicestate')
@@ -0,0 +1,68 @@
+"""make coreiotdata (device_id, timestamp) unique
+
+Revision ID: b81c4e7f2a55
+Revises: 7d2e5a1c9b30
+Create Date: 2025-06-12 14:03:51.274416
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81c4e7f2a55'
+down_revision = '7d2e5a1c9b30'
+branch_labels = None
+depends_on = None
+
+METRICS = ('temperature', 'humidity', 'light')
+RESOLUTIONS = {'1m': '1 minute', '15m': '15 minutes', '1h': '1 hour'}
+
+
+def upgrade():
+    # Every dashboard poll used to store a row, even for an unchanged reading
+    op.execute(
+        """
+        DELETE FROM coreiotdata a
+        USING coreiotdata b
+        WHERE a.device_id = b.device_id
+          AND a.timestamp = b.timestamp
+          AND a.id > b.id
+        """
+    )
+    # The rollups backfilled by 7d2e5a1c9b30 counted the duplicates too, so
+    # rebuild them from the readings that are left
+    op.execute('DELETE FROM coreiotrollup')
+    aggregates = ', '.join(
+        f'min({m}), max({m}), sum({m}), (array_agg({m} ORDER BY timestamp DESC))[1]'
+        for m in METRICS
+    )
+    columns = ', '.join(f'{m}_min, {m}_max, {m}_sum, {m}_last' for m in METRICS)
+    for resolution, width in RESOLUTIONS.items():
+        op.execute(
+            f"""
+            INSERT INTO coreiotrollup (resolution, device_id, bucket, count, last_timestamp, {columns})
+            SELECT '{resolution}', device_id,
+                   date_bin('{width}', timestamp, TIMESTAMP '1970-01-01') AS bucket,
+                   count(*), max(timestamp), {aggregates}
+            FROM coreiotdata
+            WHERE device_id IS NOT NULL
+            GROUP BY device_id, bucket
+            """
+        )
+    op.drop_index('ix_coreiotdata_device_id_timestamp', table_name='coreiotdata')
+    op.create_index(
+        'ix_coreiotdata_device_id_timestamp',
+        'coreiotdata',
+        ['device_id', 'timestamp'],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_coreiotdata_device_id_timestamp', table_name='coreiotdata')
+    op.create_index(
+        'ix_coreiotdata_device_id_timestamp',
+        'coreiotdata',
+        ['device_id', 'timestamp'],
+        unique=False,
+    )
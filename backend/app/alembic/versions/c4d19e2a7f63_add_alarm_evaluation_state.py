@@ -0,0 +1,43 @@
+"""add alarm hysteresis, debounce and evaluation state
+
+Revision ID: c4d19e2a7f63
+Revises: b81c4e7f2a55
+Create Date: 2025-06-16 10:22:08.519304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d19e2a7f63'
+down_revision = 'b81c4e7f2a55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('alarm', sa.Column('hysteresis', sa.Float(), nullable=False, server_default='0'))
+    op.add_column('alarm', sa.Column('min_duration_seconds', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('alarm', sa.Column('cooldown_seconds', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('alarm', sa.Column('is_firing', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column('alarm', sa.Column('pending_since', sa.DateTime(), nullable=True))
+    op.add_column('alarm', sa.Column('last_fired_at', sa.DateTime(), nullable=True))
+    for column in ('hysteresis', 'min_duration_seconds', 'cooldown_seconds', 'is_firing'):
+        op.alter_column('alarm', column, server_default=None)
+    op.create_index(
+        'ix_alarm_engaged',
+        'alarm',
+        ['id'],
+        postgresql_where=sa.text('is_firing OR pending_since IS NOT NULL'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_alarm_engaged', table_name='alarm')
+    op.drop_column('alarm', 'last_fired_at')
+    op.drop_column('alarm', 'pending_since')
+    op.drop_column('alarm', 'is_firing')
+    op.drop_column('alarm', 'cooldown_seconds')
+    op.drop_column('alarm', 'min_duration_seconds')
+    op.drop_column('alarm', 'hysteresis')
@@ -0,0 +1,28 @@
+"""add tuned forecast parameters
+
+Revision ID: c81f5b2e9a64
+Revises: a6d40e9f7c21
+Create Date: 2025-06-24 14:03:51.219846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f5b2e9a64'
+down_revision = 'a6d40e9f7c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('forecaststate', sa.Column('alpha', sa.Float(), nullable=True))
+    op.add_column('forecaststate', sa.Column('beta', sa.Float(), nullable=True))
+    op.add_column('forecaststate', sa.Column('tuned_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('forecaststate', 'tuned_at')
+    op.drop_column('forecaststate', 'beta')
+    op.drop_column('forecaststate', 'alpha')
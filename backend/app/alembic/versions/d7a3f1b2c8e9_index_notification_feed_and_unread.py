@@ -0,0 +1,35 @@
+"""index notification feed and unread counter
+
+Revision ID: d7a3f1b2c8e9
+Revises: c4d19e2a7f63
+Create Date: 2025-06-17 09:41:27.106583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3f1b2c8e9'
+down_revision = 'c4d19e2a7f63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_notification_user_id_created_at',
+        'notification',
+        ['user_id', 'created_at', 'id'],
+    )
+    op.create_index(
+        'ix_notification_user_id_unread',
+        'notification',
+        ['user_id'],
+        postgresql_where=sa.text('NOT is_read'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_notification_user_id_unread', table_name='notification')
+    op.drop_index('ix_notification_user_id_created_at', table_name='notification')
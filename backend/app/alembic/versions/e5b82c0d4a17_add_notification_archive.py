@@ -0,0 +1,45 @@
+"""add notification archive and retention index
+
+Revision ID: e5b82c0d4a17
+Revises: d7a3f1b2c8e9
+Create Date: 2025-06-18 16:05:12.448913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b82c0d4a17'
+down_revision = 'd7a3f1b2c8e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notificationarchive',
+    sa.Column('message', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('is_read', sa.Boolean(), nullable=False),
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('alarm_id', sa.Uuid(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        op.f('ix_notificationarchive_user_id'), 'notificationarchive', ['user_id']
+    )
+    op.create_index(
+        'ix_notification_created_at_brin',
+        'notification',
+        ['created_at'],
+        postgresql_using='brin',
+    )
+
+
+def downgrade():
+    op.drop_index('ix_notification_created_at_brin', table_name='notification')
+    op.drop_index(op.f('ix_notificationarchive_user_id'), table_name='notificationarchive')
+    op.drop_table('notificationarchive')
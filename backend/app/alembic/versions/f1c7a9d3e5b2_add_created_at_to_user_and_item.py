@@ -0,0 +1,44 @@
+"""add created_at to user and item for keyset pagination
+
+Revision ID: f1c7a9d3e5b2
+Revises: c81f5b2e9a64
+Create Date: 2025-06-26 10:12:38.540217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c7a9d3e5b2'
+down_revision = 'c81f5b2e9a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('user', 'item'):
+        # Existing rows share the migration time and are ordered by id
+        op.add_column(
+            table,
+            sa.Column(
+                'created_at',
+                sa.DateTime(),
+                nullable=False,
+                server_default=sa.text("now() AT TIME ZONE 'UTC'"),
+            ),
+        )
+        op.alter_column(table, 'created_at', server_default=None)
+    op.create_index('ix_user_created_at', 'user', ['created_at', 'id'])
+    op.create_index(
+        'ix_item_owner_id_created_at', 'item', ['owner_id', 'created_at', 'id']
+    )
+    op.create_index('ix_item_created_at', 'item', ['created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_item_created_at', table_name='item')
+    op.drop_index('ix_item_owner_id_created_at', table_name='item')
+    op.drop_index('ix_user_created_at', table_name='user')
+    op.drop_column('item', 'created_at')
+    op.drop_column('user', 'created_at')
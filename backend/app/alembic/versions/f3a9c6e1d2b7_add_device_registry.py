@@ -0,0 +1,106 @@
+"""add device registry
+
+Revision ID: f3a9c6e1d2b7
+Revises: e5b82c0d4a17
+Create Date: 2025-06-20 10:27:44.912305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c6e1d2b7'
+down_revision = 'e5b82c0d4a17'
+branch_labels = None
+depends_on = None
+
+# The device every reading was stored for before devices were registered
+DEFAULT_DEVICE_ID = '6c1945c0-0555-11f0-a887-6d1a184f2bb5'
+
+
+def upgrade():
+    op.create_table('device',
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('userdevicelink',
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('device_id', sa.Uuid(), nullable=False),
+    sa.ForeignKeyConstraint(['device_id'], ['device.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'device_id')
+    )
+    op.create_index(
+        op.f('ix_userdevicelink_device_id'), 'userdevicelink', ['device_id']
+    )
+
+    # Register the default device and any device readings were ingested for
+    op.execute(
+        f"""
+        INSERT INTO device (id, name, created_at)
+        VALUES ('{DEFAULT_DEVICE_ID}', 'Smart Office', now() AT TIME ZONE 'UTC')
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO device (id, name, created_at)
+        SELECT device_id, 'Device ' || left(device_id::text, 8), now() AT TIME ZONE 'UTC'
+        FROM (
+            SELECT DISTINCT device_id FROM coreiotdata WHERE device_id IS NOT NULL
+            UNION
+            SELECT DISTINCT device_id FROM coreiotrollup
+        ) AS ingested
+        ON CONFLICT (id) DO NOTHING
+        """
+    )
+    # Readings without a device predate multi-device support, keep one per
+    # timestamp and attribute them to the default device
+    op.execute(
+        f"""
+        DELETE FROM coreiotdata a
+        WHERE a.device_id IS NULL
+          AND (
+            EXISTS (
+                SELECT 1 FROM coreiotdata b
+                WHERE b.device_id = '{DEFAULT_DEVICE_ID}' AND b.timestamp = a.timestamp
+            )
+            OR EXISTS (
+                SELECT 1 FROM coreiotdata b
+                WHERE b.device_id IS NULL AND b.timestamp = a.timestamp AND b.id < a.id
+            )
+          )
+        """
+    )
+    op.execute(
+        f"UPDATE coreiotdata SET device_id = '{DEFAULT_DEVICE_ID}' WHERE device_id IS NULL"
+    )
+    op.alter_column('coreiotdata', 'device_id', existing_type=sa.Uuid(), nullable=False)
+    op.create_foreign_key(
+        'coreiotdata_device_id_fkey', 'coreiotdata', 'device', ['device_id'], ['id'],
+        ondelete='CASCADE',
+    )
+    op.create_foreign_key(
+        'coreiotrollup_device_id_fkey', 'coreiotrollup', 'device', ['device_id'], ['id'],
+        ondelete='CASCADE',
+    )
+
+    # Every user could see every reading so far
+    op.execute(
+        """
+        INSERT INTO userdevicelink (user_id, device_id)
+        SELECT "user".id, device.id FROM "user" CROSS JOIN device
+        """
+    )
+
+
+def downgrade():
+    op.drop_constraint('coreiotrollup_device_id_fkey', 'coreiotrollup', type_='foreignkey')
+    op.drop_constraint('coreiotdata_device_id_fkey', 'coreiotdata', type_='foreignkey')
+    op.alter_column('coreiotdata', 'device_id', existing_type=sa.Uuid(), nullable=True)
+    op.drop_index(op.f('ix_userdevicelink_device_id'), table_name='userdevicelink')
+    op.drop_table('userdevicelink')
+    op.drop_table('device')
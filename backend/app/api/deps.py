@@ -1,17 +1,21 @@
-from collections.abc import Generator
+import uuid
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app import crud
 from app.core import security
+from app.core.cache import user_cache
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import USER_KEY, async_engine, db_router, engine
+from app.models import Device, TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -23,22 +27,32 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Not expiring on commit, async code cannot lazily reload attributes
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def _user_id_from_token(token: str) -> uuid.UUID:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
         token_data = TokenPayload(**payload)
-    except (InvalidTokenError, ValidationError):
+        return uuid.UUID(token_data.sub or "")
+    except (InvalidTokenError, ValidationError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+
+
+def _check_user(user: User | None) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,9 +60,117 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+def get_user_from_token(session: Session, token: str) -> User:
+    return _check_user(user_cache.get(session, _user_id_from_token(token)))
+
+
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    user = get_user_from_token(session, token)
+    # Their commits on this session send their reads to the primary for a
+    # while, see ReplicaRouter
+    session.info[USER_KEY] = user.id
+    return user
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
+async def get_current_user_async(session: AsyncSessionDep, token: TokenDep) -> User:
+    """
+    get_current_user for async routes, which must not block the event loop
+    on a sync session.
+    """
+    user = _check_user(await user_cache.get_async(session, _user_id_from_token(token)))
+    session.info[USER_KEY] = user.id
+    return user
+
+
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
+
+
+def get_read_db(current_user: CurrentUser) -> Generator[Session, None, None]:
+    """
+    A session for routes that only read, on a replica unless none is
+    configured, caught up, or the user wrote lately.
+    """
+    with Session(db_router.read_engine(current_user.id)) as session:
+        yield session
+
+
+async def get_async_read_db(
+    current_user: AsyncCurrentUser,
+) -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(
+        db_router.async_read_engine(current_user.id), expire_on_commit=False
+    ) as session:
+        yield session
+
+
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
+
+
+def get_stream_user(token: Annotated[str, Query()]) -> User:
+    """
+    Authenticate long-lived EventSource and WebSocket requests, which cannot
+    send an Authorization header, from a `token` query parameter. Uses its
+    own short session so no pooled connection is held for the stream.
+    """
+    with Session(engine) as session:
+        return get_user_from_token(session, token)
+
+
+StreamUser = Annotated[User, Depends(get_stream_user)]
+
+
+def get_user_device(
+    session: Session, user: User, device_id: uuid.UUID | None
+) -> Device:
+    if device_id is None:
+        device = crud.get_default_device(session, user_id=user.id)
+    elif user.is_superuser:
+        device = session.get(Device, device_id)
+    else:
+        device = crud.get_user_device(session, user_id=user.id, device_id=device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return device
+
+
+def get_current_device(
+    session: SessionDep, current_user: CurrentUser, device_id: uuid.UUID | None = None
+) -> Device:
+    """
+    The device named by the `device_id` query parameter, which must be linked
+    to the user unless they are a superuser, or the user's default device.
+    """
+    return get_user_device(session, current_user, device_id)
+
+
+CurrentDevice = Annotated[Device, Depends(get_current_device)]
+
+
+async def get_current_device_async(
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentUser,
+    device_id: uuid.UUID | None = None,
+) -> Device:
+    return await session.run_sync(get_user_device, current_user, device_id)
+
+
+AsyncCurrentDevice = Annotated[Device, Depends(get_current_device_async)]
+
+
+def get_stream_device(
+    current_user: StreamUser, device_id: uuid.UUID | None = None
+) -> Device:
+    with Session(engine) as session:
+        return get_user_device(session, current_user, device_id)
+
+
+StreamDevice = Annotated[Device, Depends(get_stream_device)]
+
+
 def get_current_active_superuser(current_user: CurrentUser) -> User:
     if not current_user.is_superuser:
         raise HTTPException(
@@ -1,6 +1,16 @@
 from fastapi import APIRouter
 
-from app.api.routes import items, login, private, users, utils, api_coreiot, alarms, notifications
+from app.api.routes import (
+    alarms,
+    api_coreiot,
+    devices,
+    items,
+    login,
+    notifications,
+    private,
+    users,
+    utils,
+)
 from app.core.config import settings
 
 api_router = APIRouter()
@@ -8,6 +18,7 @@ api_router.include_router(login.router)
 api_router.include_router(users.router)
 api_router.include_router(utils.router)
 api_router.include_router(items.router)
+api_router.include_router(devices.router)
 api_router.include_router(api_coreiot.router)
 api_router.include_router(alarms.router)
 api_router.include_router(notifications.router)
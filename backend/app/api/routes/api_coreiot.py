@@ -1,266 +1,416 @@
-import copy
-from typing import Any, List
 import logging
 from datetime import datetime, timedelta, timezone
-from sqlmodel import select
+from typing import Any, Literal
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-import requests
-from app.api.deps import CurrentUser, SessionDep
-from app.models import CoreIoTData, User, NotificationCreate
-
-import numpy as np
-from sklearn.linear_model import LinearRegression
-import joblib
-import os
-from app import crud
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlmodel import Session
 
-# Directory to save models
-MODEL_DIR = "models"
-ENTITY_TYPE = 'DEVICE'
-ENTITY_ID = '6c1945c0-0555-11f0-a887-6d1a184f2bb5'
-os.makedirs(MODEL_DIR, exist_ok=True)
-
+from app import crud
+from app.api.deps import (
+    AsyncCurrentDevice,
+    AsyncCurrentUser,
+    AsyncReadSessionDep,
+    AsyncSessionDep,
+    CurrentDevice,
+    SessionDep,
+    StreamDevice,
+)
+from app.core.cache import reading_cache
+from app.core.config import settings
+from app.core.coreiot import CoreIoTError, coreiot_client
+from app.core.db import engine
+from app.core.export import MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from app.core.export import WRITERS as EXPORT_WRITERS
+from app.core.export import arrow_available
+from app.core.forecast import forecaster
+from app.core.hub import reading_hub, sse_stream
+from app.core.ingest import (
+    ingestor,
+    parse_bulk_readings,
+    reading_json,
+    store_reading_arrays,
+    store_readings,
+)
+from app.core.rollups import (
+    EPOCH,
+    choose_resolution,
+    downsample,
+    from_epoch_ms,
+    get_rollup_points,
+    to_naive_utc,
+)
+from app.models import (
+    METRICS,
+    CoreIoTData,
+    CoreIoTForecast,
+    CoreIoTHistoryPage,
+    CoreIoTIngestResult,
+    CoreIoTMetricForecast,
+    CoreIoTReading,
+)
+from app.utils import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/coreiot", tags=["coreiot"])
 logger = logging.getLogger(__name__)
 
 
-def train_user_model(user_id, session, metric_type="temperature"):
-    logger.info(f"Training model for user {user_id} and metric {metric_type}")
-    # Fetch last N data points for this user
-    N = 20
-    statement = select(CoreIoTData).order_by(CoreIoTData.timestamp.desc()).limit(N)
-    result = session.exec(statement)
-    data = result.all()[::-1]  # oldest to newest
-    if len(data) < 2:
-        return
-    values = np.array([getattr(d, metric_type) for d in data]).reshape(-1, 1)
-    X = np.arange(len(values)).reshape(-1, 1)
-    y = values
-    model = LinearRegression()
-    model.fit(X, y)
-    # Save the model per user and metric
-    model_path = os.path.join(MODEL_DIR, f"user_{user_id}_{metric_type}.joblib")
-    joblib.dump(model, model_path)
-    logger.info(f"Model saved to {model_path}")
+async def fetch_latest_reading(device_id: str, access_token: str) -> CoreIoTData:
+    """
+    Fetch the latest reading from CoreIoT, bypassing the ingestor. Readings
+    are shared through the reading cache between users with the same token.
+    """
+    try:
+        return await reading_cache.get(
+            device_id,
+            access_token,
+            lambda: coreiot_client.get_latest_reading(
+                device_id, access_token=access_token
+            ),
+        )
+    except CoreIoTError as e:
+        logger.error(f"CoreIoT API error: {e.status_code} - {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+def store_reading(reading: CoreIoTData) -> None:
+    """
+    Persist a reading fetched on demand. Only used when the background
+    ingestor is disabled, otherwise it owns persistence.
+    """
+    with Session(engine) as session:
+        store_readings(session, [reading])
+        session.commit()
+
 
 @router.get("/coreiot-data", response_model=CoreIoTData)
-def get_coreiot_data(
-    session: SessionDep, current_user: CurrentUser, background_tasks: BackgroundTasks
+async def get_coreiot_data(
+    current_user: AsyncCurrentUser, device: AsyncCurrentDevice
 ) -> Any:
     """
-    Get latest sensor data from CoreIoT
+    Get latest sensor data of a device from CoreIoT
     """
-    if not current_user.coreiot_access_token:
-        logger.error("CoreIoT access token not set for user.")
-        raise HTTPException(status_code=400, detail="CoreIoT access token not set for user.")
-    headers = {
-        'X-Authorization': f'Bearer {current_user.coreiot_access_token}'
-    }
-    try:
-        api = f'/api/plugins/telemetry/{ENTITY_TYPE}/{ENTITY_ID}/values/timeseries?keys=humidity%2Ctemperature%2Clight&useStrictDataTypes=false'
-        url = f'https://app.coreiot.io{api}'
-        
-        logger.info(f"Fetching data from CoreIoT: {url}")   
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            data = response.json()
-            logger.info(f"Received data from CoreIoT: {data}")
-            
-            # Extract the latest values
-            if 'temperature' not in data or 'humidity' not in data:
-                logger.error(f"Missing temperature or humidity data in response: {data}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Invalid data format from CoreIoT"
-                )
-                
-            if not data['temperature'] or not data['humidity']:
-                logger.error("No temperature or humidity data available")
-                raise HTTPException(
-                    status_code=404,
-                    detail="No sensor data available"
-                )
-                
-            latest_data = CoreIoTData(
-                temperature=float(data['temperature'][-1]['value']),
-                humidity=float(data['humidity'][-1]['value']),
-                light=float(data['light'][-1]['value']),
-                timestamp=datetime.fromtimestamp(data['temperature'][-1]['ts'] / 1000, tz=timezone.utc)  # UTC-aware datetime
-            )
-
-            save_data = copy.deepcopy(latest_data)
-
-            session.add(latest_data)
-            session.commit()
-            session.refresh(latest_data)
-
-            # Check alarms for this user
-            alarms = crud.get_alarms_by_user(session, user_id=current_user.id)
-            notifications = []
-            for alarm in alarms:
-                if not alarm.is_active:
-                    continue
-                if alarm.type == "temperature":
-                    value = latest_data.temperature
-                elif alarm.type == "humidity":
-                    value = latest_data.humidity
-                elif alarm.type == "light":
-                    value = latest_data.light
-                else:
-                    continue
-                if alarm.threshold_type == "above" and value > alarm.value:
-                    msg = f"{alarm.type.title()} is above {alarm.value} (actual: {value})"
-                    notifications.append((msg, alarm.id))
-                elif alarm.threshold_type == "below" and value < alarm.value:
-                    msg = f"{alarm.type.title()} is below {alarm.value} (actual: {value})"
-                    notifications.append((msg, alarm.id))
-
-            # send notification to user
-            if notifications:
-                for note, alarm_id in notifications:
-                    logger.warning(f"[ALARM NOTIFICATION] User {current_user.id}: {note}")
-                    crud.create_notification(
-                        session=session,
-                        notification_create=NotificationCreate(
-                            message=note,
-                            user_id=current_user.id,
-                            alarm_id=alarm_id,
-                        ),
-                    )
-
-            # Check if at least 1 minute has passed since last training
-            user = session.get(User, current_user.id)
-            now = datetime.now(timezone.utc)
-            last_trained_at = user.last_trained_at
-            if last_trained_at is not None and last_trained_at.tzinfo is None:
-                # Make naive datetime UTC-aware
-                last_trained_at = last_trained_at.replace(tzinfo=timezone.utc)
-
-            if not last_trained_at or (now - last_trained_at) >= timedelta(minutes=1):
-                # Schedule background training for all metrics
-                def background_train():
-                    # Use a new session in the background task
-                    with session.bind.connect() as conn:
-                        with SessionDep.__origin__(conn) as bg_session:
-                            train_user_model(user.id, bg_session, "temperature")
-                            train_user_model(user.id, bg_session, "humidity")
-                            train_user_model(user.id, bg_session, "light")
-                            user.last_trained_at = now
-                            bg_session.add(user)
-                            bg_session.commit()
-                
-                logger.info(f"Scheduling background training for user {user.id}")
-                background_tasks.add_task(background_train)
-            
-            return save_data
-        else:
-            logger.error(f"CoreIoT API error: {response.status_code} - {response.text}")
+    device_id = str(device.id)
+    latest_data = ingestor.get_latest(device_id) if ingestor.running else None
+    if latest_data is None:
+        if not current_user.coreiot_access_token:
+            logger.error("CoreIoT access token not set for user.")
             raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Failed to fetch data from CoreIoT: {response.text}"
+                status_code=400, detail="CoreIoT access token not set for user."
             )
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Network error connecting to CoreIoT: {str(e)}")
+        latest_data = await fetch_latest_reading(
+            device_id, current_user.coreiot_access_token
+        )
+        is_new = ingestor.observe(device_id, latest_data)
+        # Only the leading ingestor buffers what it observes
+        if is_new and not ingestor.leading:
+            await run_in_threadpool(store_reading, latest_data)
+    return latest_data
+
+
+@router.get("/daily-data", response_model=list[CoreIoTReading])
+async def get_daily_data(
+    type: str,
+    session: AsyncReadSessionDep,
+    device: AsyncCurrentDevice,
+    days: int = Query(default=1, ge=1, le=366),
+    resolution: Literal["auto", "raw", "1m", "15m", "1h"] = "auto",
+    max_points: int = Query(default=1500, ge=3, le=20000),
+):
+    """
+    Get chart data of a device for a specific type (temperature, humidity, or
+    light) over the last `days` days.
+
+    With the default `auto` resolution the finest rollup that fits the window
+    in `max_points` buckets is used; `raw` reads individual readings. Either
+    way the series is downsampled with LTTB on `type` to at most `max_points`.
+    """
+    if type not in METRICS:
         raise HTTPException(
-            status_code=503,
-            detail=f"Error connecting to CoreIoT: {str(e)}"
+            status_code=400,
+            detail="Type must be either 'temperature', 'humidity', or 'light'",
+        )
+
+    now = to_naive_utc(datetime.now(timezone.utc))
+    start = now - timedelta(days=days)
+    if resolution == "auto":
+        resolution = choose_resolution(now - start, max_points)
+    if resolution == "raw":
+        # Ordered by timestamp ascending for proper chart display
+        readings = await session.run_sync(
+            crud.get_readings_between, device_id=device.id, start=start, end=now
+        )
+        points = [
+            CoreIoTReading.model_validate(r, from_attributes=True) for r in readings
+        ]
+    else:
+        points = await session.run_sync(
+            get_rollup_points,
+            device_id=device.id,
+            resolution=resolution,
+            start=start,
+            end=now,
+        )
+    return downsample(points, type, max_points)
+
+
+@router.get("/history", response_model=CoreIoTHistoryPage)
+async def get_history(
+    session: AsyncReadSessionDep,
+    device: AsyncCurrentDevice,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    metrics: list[Literal["temperature", "humidity", "light"]] = Query(
+        default=list(METRICS)
+    ),
+    cursor: str | None = None,
+    limit: int = Query(default=1000, ge=1, le=10000),
+) -> Any:
+    """
+    Page through the readings of a device between `start` (inclusive) and
+    `end` (exclusive), returning only the requested metrics. Pass the
+    returned `next_cursor` back as `cursor` to fetch the following page.
+    """
+    end = to_naive_utc(end or datetime.now(timezone.utc))
+    start = to_naive_utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    rows = await session.run_sync(
+        crud.get_readings_page,
+        device_id=device.id,
+        start=start,
+        end=end,
+        metrics=list(dict.fromkeys(metrics)),
+        after=after,
+        limit=limit + 1,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    for row in rows:
+        del row["id"]
+    return CoreIoTHistoryPage(data=rows, next_cursor=next_cursor)
+
+
+@router.post("/ingest", response_model=CoreIoTIngestResult)
+async def ingest_readings(
+    request: Request,
+    session: SessionDep,
+    device: CurrentDevice,
+) -> Any:
+    """
+    Bulk-ingest readings for a device, as a JSON array or as NDJSON
+    (`Content-Type: application/x-ndjson`). Each reading needs `temperature`,
+    `humidity`, `light` and either `ts` (epoch milliseconds) or an ISO 8601
+    `timestamp`. Readings already stored for the same timestamp are skipped,
+    so retrying a request is safe. Only the newest reading is checked
+    against alarms.
+    """
+    body = await request.body()
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    device_id = device.id
+
+    def ingest() -> CoreIoTIngestResult:
+        try:
+            ts_ms, values = parse_bulk_readings(
+                body, ndjson=ndjson, max_readings=settings.COREIOT_INGEST_MAX_READINGS
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        inserted = store_reading_arrays(
+            session, device_id, ts_ms, values, alarms_on_latest_only=True
         )
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        session.commit()
+        return CoreIoTIngestResult(received=len(ts_ms), inserted=inserted)
+
+    return await run_in_threadpool(ingest)
+
+
+EXPORT_BATCH_SIZE = 5000
+
+
+@router.get("/export", response_class=StreamingResponse)
+def export_readings(
+    device: CurrentDevice,
+    format: Literal["ndjson", "csv", "arrow"] = "ndjson",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    metrics: list[Literal["temperature", "humidity", "light"]] = Query(
+        default=list(METRICS)
+    ),
+) -> StreamingResponse:
+    """
+    Export the readings of a device between `start` and `end` (all stored
+    readings by default) as NDJSON, CSV or an Arrow IPC stream.
+    """
+    end = to_naive_utc(end or datetime.now(timezone.utc))
+    start = to_naive_utc(start or EPOCH)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if format == "arrow" and not arrow_available():
         raise HTTPException(
-            status_code=500,
-            detail=f"Internal server error: {str(e)}"
+            status_code=400, detail="Arrow export requires the pyarrow package"
         )
+    metric_list = list(dict.fromkeys(metrics))
+    device_id = device.id
 
-@router.get("/daily-data", response_model=List[CoreIoTData])
-def get_daily_data(
-    type: str,
-    session: SessionDep
-):
+    def generate():
+        # The request session is closed before the body is streamed, so the
+        # server-side cursor gets its own
+        with Session(engine) as session:
+            batches = crud.iter_readings(
+                session,
+                device_id=device_id,
+                start=start,
+                end=end,
+                metrics=metric_list,
+                batch_size=EXPORT_BATCH_SIZE,
+            )
+            yield from EXPORT_WRITERS[format](batches, metric_list)
+
+    filename = f"coreiot-{device_id}.{format}"
+    return StreamingResponse(
+        generate(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_readings(
+    device: StreamDevice,
+    request: Request,
+) -> StreamingResponse:
     """
-    Get daily data for a specific type (temperature, humidity, or light)
+    Server-Sent Events stream of a device's readings as the ingestor polls
+    them, starting with the latest one. Authenticates with a `token` query
+    parameter since EventSource cannot send headers.
     """
-    if type not in ["temperature", "humidity", "light"]:
-        raise HTTPException(status_code=400, detail="Type must be either 'temperature', 'humidity', or 'light'")
-    
-    statement = select(CoreIoTData).where(
-        CoreIoTData.timestamp >= datetime.now(timezone.utc) - timedelta(days=1)
-    ).where(
-        CoreIoTData.timestamp <= datetime.now(timezone.utc)
-    ).order_by(CoreIoTData.timestamp.asc())  # Order by timestamp ascending for proper chart display
-    
-    result = session.exec(statement)
-    return result.all()
+    device_id = str(device.id)
+    if not ingestor.running or not ingestor.polls(device_id):
+        raise HTTPException(status_code=503, detail="Live readings are not available")
+    latest = ingestor.get_latest(device_id)
+    body = sse_stream(
+        request,
+        reading_hub,
+        device_id,
+        event="reading",
+        heartbeat=settings.STREAM_HEARTBEAT_SECONDS,
+        initial=[reading_json(latest)] if latest is not None else [],
+    )
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 class FanControlRequest(BaseModel):
     turn_on: bool
 
+
 @router.post("/control-fan")
-def control_fan(
-    session: SessionDep,
-    current_user: CurrentUser,
-    req: FanControlRequest
+async def control_fan(
+    current_user: AsyncCurrentUser, device: AsyncCurrentDevice, req: FanControlRequest
 ):
     """
-    Control the fan
+    Control the fan of a device
     """
+    if not current_user.coreiot_access_token:
+        raise HTTPException(
+            status_code=400, detail="CoreIoT access token not set for user."
+        )
+    turn_on = req.turn_on
+    logger.info(f"Sending fan control command: {'on' if turn_on else 'off'}")
     try:
-        turn_on = req.turn_on
-        rpc_api = f'https://app.coreiot.io/api/rpc/oneway/{ENTITY_ID}'
-
-        headers = {
-            'X-Authorization': f'Bearer {current_user.coreiot_access_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        logger.info(f"Sending fan control command: {'on' if turn_on else 'off'}")
-        response = requests.post(
-            rpc_api, 
-            headers=headers, 
+        response = await coreiot_client.send_rpc(
+            str(device.id),
+            access_token=current_user.coreiot_access_token,
+            method="setFanState",
+            params=turn_on,
             timeout=1,
-            json={"method": "setFanState", "params": turn_on}
         )
+    except CoreIoTError as e:
+        return {"status": "error", "message": f"Failed to control fan: {e.detail}"}
+
+    if response.status_code == 200:
+        return {
+            "status": "success",
+            "message": f"Fan turned {'on' if turn_on else 'off'}",
+        }
+    else:
+        return {
+            "status": "error",
+            "message": f"Failed to control fan: {response.status_code} - {response.text}",
+        }
 
-        if response.status_code == 200:
-            return {"status": "success", "message": f"Fan turned {'on' if turn_on else 'off'}"}
-        else:
-            return {"status": "error", "message": f"Failed to control fan: {response.status_code} - {response.text}"}
-    except Exception as e:
-        logger.error(f"Unexpected error controlling fan: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Internal server error: {str(e)}"
-        )
 
 @router.get("/predict-next")
-def predict_next_metric(
+async def predict_next_metric(
     type: str,
-    session: SessionDep,
-    current_user: CurrentUser
+    session: AsyncSessionDep,
+    device: AsyncCurrentDevice,
 ):
     """
-    Predict the next value for a metric (temperature, humidity, or light) for the current user.
+    Predict the next value for a metric (temperature, humidity, or light) of a
+    device from its online Holt forecast, kept up to date as readings arrive.
     """
     if type not in ["temperature", "humidity", "light"]:
-        raise HTTPException(status_code=400, detail="Type must be either 'temperature', 'humidity', or 'light'")
-    # Load the model
-    model_path = os.path.join(MODEL_DIR, f"user_{current_user.id}_{type}.joblib")
-    if not os.path.exists(model_path):
-        raise HTTPException(status_code=404, detail="Model not trained yet. Please wait for more data.")
-    model = joblib.load(model_path)
-    # Fetch last N data points
-    N = 20
-    statement = select(CoreIoTData).order_by(CoreIoTData.timestamp.desc()).limit(N)
-    result = session.exec(statement)
-    data = result.all()[::-1]  # oldest to newest
-    if len(data) < 2:
+        raise HTTPException(
+            status_code=400,
+            detail="Type must be either 'temperature', 'humidity', or 'light'",
+        )
+    next_value = await session.run_sync(forecaster.predict, device.id, type)
+    if next_value is None:
+        raise HTTPException(status_code=400, detail="Not enough data to predict")
+    return {"predicted_next": next_value}
+
+
+@router.get("/forecast", response_model=CoreIoTForecast)
+async def forecast_metrics(
+    session: AsyncSessionDep,
+    device: AsyncCurrentDevice,
+    metrics: list[Literal["temperature", "humidity", "light"]] = Query(
+        default=list(METRICS)
+    ),
+    steps: int = Query(default=1, ge=1, le=100),
+    confidence: float = Query(default=0.95, gt=0, lt=1),
+) -> Any:
+    """
+    Forecast the next `steps` readings of every requested metric of a device
+    at once, each with a `confidence` prediction interval. Metrics without
+    enough readings yet are left out.
+    """
+    forecasts = await session.run_sync(
+        forecaster.forecast,
+        device.id,
+        list(dict.fromkeys(metrics)),
+        steps=steps,
+        confidence=confidence,
+    )
+    if not forecasts:
         raise HTTPException(status_code=400, detail="Not enough data to predict")
-    values = np.array([getattr(d, type) for d in data]).reshape(-1, 1)
-    next_x = np.array([[len(values)]])
-    next_value = model.predict(next_x)[0][0]
-    logger.info(f"Predicted next {type} value: {next_value}")
-    return {"predicted_next": next_value}
\ No newline at end of file
+    return CoreIoTForecast(
+        steps=steps,
+        confidence=confidence,
+        data=[
+            CoreIoTMetricForecast(
+                metric=metric,
+                count=state.count,
+                last_timestamp=from_epoch_ms(state.last_ts),
+                predicted=predicted,
+                lower=lower,
+                upper=upper,
+            )
+            for metric, (state, predicted, lower, upper) in forecasts.items()
+        ],
+    )
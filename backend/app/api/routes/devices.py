@@ -0,0 +1,103 @@
+import uuid
+from typing import Any
+
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import col, func, select
+
+from app import crud
+from app.api.deps import CurrentUser, SessionDep
+from app.core.coreiot import CoreIoTError, coreiot_client
+from app.models import (
+    Device,
+    DeviceCreate,
+    DevicePublic,
+    DevicesPublic,
+    DeviceUpdate,
+    Message,
+    UserDeviceLink,
+)
+
+router = APIRouter(prefix="/devices", tags=["devices"])
+
+
+@router.get("/", response_model=DevicesPublic)
+def read_devices(
+    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+) -> Any:
+    """
+    Retrieve the devices linked to the current user, or every device for
+    superusers.
+    """
+    count_statement = select(func.count()).select_from(Device)
+    statement = select(Device)
+    if not current_user.is_superuser:
+        count_statement = count_statement.join(UserDeviceLink).where(
+            UserDeviceLink.user_id == current_user.id
+        )
+        statement = statement.join(UserDeviceLink).where(
+            UserDeviceLink.user_id == current_user.id
+        )
+    count = session.exec(count_statement).one()
+    statement = statement.order_by(col(Device.created_at), col(Device.id))
+    devices = session.exec(statement.offset(skip).limit(limit)).all()
+    return DevicesPublic(data=devices, count=count)
+
+
+@router.post("/", response_model=DevicePublic)
+async def create_device(
+    *, session: SessionDep, current_user: CurrentUser, device_in: DeviceCreate
+) -> Any:
+    """
+    Register a CoreIoT device and link it to the current user. The user's
+    CoreIoT access token must be able to read the device.
+    """
+    if not current_user.is_superuser:
+        if not current_user.coreiot_access_token:
+            raise HTTPException(
+                status_code=400, detail="CoreIoT access token not set for user."
+            )
+        try:
+            await coreiot_client.get_telemetry(
+                str(device_in.id), access_token=current_user.coreiot_access_token
+            )
+        except CoreIoTError:
+            raise HTTPException(status_code=404, detail="Device not found in CoreIoT")
+    return await run_in_threadpool(
+        crud.create_device,
+        session=session,
+        device_in=device_in,
+        user_id=current_user.id,
+    )
+
+
+@router.patch("/{id}", response_model=DevicePublic)
+def update_device(
+    *,
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    device_in: DeviceUpdate,
+) -> Any:
+    """
+    Rename a device.
+    """
+    if current_user.is_superuser:
+        device = session.get(Device, id)
+    else:
+        device = crud.get_user_device(session, user_id=current_user.id, device_id=id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return crud.update_device(session=session, db_device=device, device_in=device_in)
+
+
+@router.delete("/{id}")
+def unlink_device(
+    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+) -> Message:
+    """
+    Unlink a device from the current user. Its readings are kept.
+    """
+    if not crud.unlink_device(session, user_id=current_user.id, device_id=id):
+        raise HTTPException(status_code=404, detail="Device not found")
+    return Message(message="Device unlinked successfully")
@@ -1,34 +1,146 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session
 import uuid
 
-from app.api.deps import SessionDep, CurrentUser
-from app.models import NotificationPublic, NotificationsPublic
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
 from app import crud
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncReadSessionDep,
+    AsyncSessionDep,
+    StreamUser,
+)
+from app.core.config import settings
+from app.core.hub import notification_hub, sse_stream
+from app.models import (
+    BulkResult,
+    NotificationIds,
+    NotificationPublic,
+    NotificationsPublic,
+    UnreadCount,
+)
+from app.utils import decode_snapshot_cursor, encode_snapshot_cursor, etag_response
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
+# Polled by every open dashboard, so the routes run the crud functions on the
+# async session's connection through run_sync instead of holding a
+# threadpool thread
+
+
 @router.get("/", response_model=NotificationsPublic)
-def list_notifications(session: SessionDep, current_user: CurrentUser):
-    notifications = crud.get_notifications_by_user(session, user_id=current_user.id)
-    return NotificationsPublic(data=notifications, count=len(notifications))
+async def list_notifications(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUser,
+    request: Request,
+    since: str | None = None,
+    limit: int = Query(default=50, ge=1, le=500),
+):
+    """
+    Latest notifications, newest first. Passing the returned `cursor` back as
+    `since` returns only the ones added since, oldest first, with their own
+    cursor. A client more than `limit` behind gets the latest `limit` of them.
+    """
+    snapshot = None
+    if since is not None:
+        snapshot = decode_snapshot_cursor(since)
+        if snapshot is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    notifications, read_in = await session.run_sync(
+        crud.get_notifications_by_user,
+        user_id=current_user.id,
+        since=snapshot,
+        limit=limit,
+    )
+    cursor = since if read_in is None else encode_snapshot_cursor(read_in)
+    return etag_response(
+        request,
+        NotificationsPublic(
+            data=notifications, count=len(notifications), cursor=cursor
+        ),
+    )
+
+
+@router.get("/unread-count", response_model=UnreadCount)
+async def unread_count(
+    session: AsyncReadSessionDep, current_user: AsyncCurrentUser, request: Request
+):
+    count = await session.run_sync(
+        crud.count_unread_notifications, user_id=current_user.id
+    )
+    return etag_response(request, UnreadCount(count=count))
+
+
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_notifications(current_user: StreamUser, request: Request):
+    """
+    Server-Sent Events stream of the user's new notifications. Authenticates
+    with a `token` query parameter since EventSource cannot send headers.
+    """
+    body = sse_stream(
+        request,
+        notification_hub,
+        str(current_user.id),
+        event="notification",
+        heartbeat=settings.STREAM_HEARTBEAT_SECONDS,
+    )
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @router.post("/{notification_id}/read", response_model=NotificationPublic)
-def mark_read(notification_id: uuid.UUID, session: SessionDep, current_user: CurrentUser):
-    notification = crud.mark_notification_read(session, notification_id)
-    if not notification or notification.user_id != current_user.id:
+async def mark_read(
+    notification_id: uuid.UUID, session: AsyncSessionDep, current_user: AsyncCurrentUser
+):
+    notification = await session.run_sync(
+        crud.mark_notification_read, notification_id, current_user.id
+    )
+    if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
     return notification
 
-@router.post("/read-all")
-def mark_all_read(session: SessionDep, current_user: CurrentUser):
-    crud.mark_all_notifications_read(session, current_user.id)
-    return {"message": "All notifications marked as read"}
+
+@router.post("/read", response_model=BulkResult)
+async def mark_many_read(
+    body: NotificationIds, session: AsyncSessionDep, current_user: AsyncCurrentUser
+):
+    """
+    Mark the given notifications of the user as read, returning how many
+    were unread. Unknown ids and other users' notifications are ignored.
+    """
+    count = await session.run_sync(
+        crud.mark_notifications_read, current_user.id, body.ids
+    )
+    return BulkResult(count=count)
+
+
+@router.post("/read-all", response_model=BulkResult)
+async def mark_all_read(session: AsyncSessionDep, current_user: AsyncCurrentUser):
+    count = await session.run_sync(crud.mark_all_notifications_read, current_user.id)
+    return BulkResult(count=count)
+
+
+@router.post("/delete", response_model=BulkResult)
+async def delete_many(
+    body: NotificationIds, session: AsyncSessionDep, current_user: AsyncCurrentUser
+):
+    """
+    Delete the given notifications of the user, returning how many were
+    deleted. Unknown ids and other users' notifications are ignored.
+    """
+    count = await session.run_sync(crud.delete_notifications, current_user.id, body.ids)
+    return BulkResult(count=count)
+
 
 @router.delete("/{notification_id}")
-def delete_notification(notification_id: uuid.UUID, session: SessionDep, current_user: CurrentUser):
-    notification = crud.get_notifications_by_user(session, user_id=current_user.id)
-    if not any(n.id == notification_id for n in notification):
+async def delete_notification(
+    notification_id: uuid.UUID, session: AsyncSessionDep, current_user: AsyncCurrentUser
+):
+    if not await session.run_sync(
+        crud.delete_notification, notification_id, current_user.id
+    ):
         raise HTTPException(status_code=404, detail="Notification not found")
-    crud.delete_notification(session, notification_id)
-    return {"message": "Notification deleted"} 
\ No newline at end of file
+    return {"message": "Notification deleted"}
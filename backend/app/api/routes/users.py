@@ -1,17 +1,19 @@
 import uuid
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import col, delete, func, select
 
 from app import crud
 from app.api.deps import (
     CurrentUser,
+    ReadSessionDep,
     SessionDep,
     get_current_active_superuser,
 )
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.security import PasswordHasherBusy, password_hasher
 from app.models import (
     Item,
     Message,
@@ -24,7 +26,12 @@ from app.models import (
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
+from app.utils import (
+    decode_cursor,
+    encode_cursor,
+    generate_new_account_email,
+    send_email,
+)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -34,18 +41,39 @@ router = APIRouter(prefix="/users", tags=["users"])
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1),
+    cursor: str | None = None,
+    estimate_count: bool = False,
+) -> Any:
     """
-    Retrieve users.
+    Retrieve users, in the order they signed up.
+
+    Pass the returned `next_cursor` back as `cursor` to fetch the following
+    page, as fast on page 1000 as on page 1, unlike `skip`. With
+    `estimate_count` the total is read from the table statistics instead of
+    counting every user.
     """
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    if estimate_count:
+        count = crud.estimate_count(session, User)
+    else:
+        count = session.exec(select(func.count()).select_from(User)).one()
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    users = crud.get_users_page(session, after=after, skip=skip, limit=limit + 1)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1].created_at, users[-1].id)
 
-    return UsersPublic(data=users, count=count)
+    return UsersPublic(data=users, count=count, next_cursor=next_cursor)
 
 
 @router.post(
@@ -98,22 +126,33 @@ def update_user_me(
 
 
 @router.patch("/me/password", response_model=Message)
-def update_password_me(
+async def update_password_me(
     *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
 ) -> Any:
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
-        raise HTTPException(status_code=400, detail="Incorrect password")
-    if body.current_password == body.new_password:
+    try:
+        verified, _ = await password_hasher.verify_and_update(
+            body.current_password, current_user.hashed_password
+        )
+        if not verified:
+            raise HTTPException(status_code=400, detail="Incorrect password")
+        if body.current_password == body.new_password:
+            raise HTTPException(
+                status_code=400,
+                detail="New password cannot be the same as the current one",
+            )
+        hashed_password = await password_hasher.hash(body.new_password)
+    except PasswordHasherBusy:
         raise HTTPException(
-            status_code=400, detail="New password cannot be the same as the current one"
+            status_code=503,
+            detail="Too many password changes, try again shortly",
+            headers={"Retry-After": "1"},
         )
-    hashed_password = get_password_hash(body.new_password)
-    current_user.hashed_password = hashed_password
-    session.add(current_user)
-    session.commit()
+    await run_in_threadpool(
+        crud.update_password_hash, session, current_user, hashed_password
+    )
     return Message(message="Password updated successfully")
 
 
@@ -140,18 +179,33 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
 
 
 @router.post("/signup", response_model=UserPublic)
-def register_user(session: SessionDep, user_in: UserRegister) -> Any:
+async def register_user(session: SessionDep, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
+    user = await run_in_threadpool(
+        crud.get_user_by_email, session=session, email=user_in.email
+    )
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system",
         )
+    try:
+        hashed_password = await password_hasher.hash(user_in.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many signups, try again shortly",
+            headers={"Retry-After": "1"},
+        )
     user_create = UserCreate.model_validate(user_in)
-    user = crud.create_user(session=session, user_create=user_create)
+    user = await run_in_threadpool(
+        crud.create_user,
+        session=session,
+        user_create=user_create,
+        hashed_password=hashed_password,
+    )
     return user
 
 
@@ -178,7 +232,7 @@ def read_user_by_id(
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UserPublic,
 )
-def update_user(
+async def update_user(
     *,
     session: SessionDep,
     user_id: uuid.UUID,
@@ -188,20 +242,38 @@ def update_user(
     Update a user.
     """
 
-    db_user = session.get(User, user_id)
+    db_user = await run_in_threadpool(session.get, User, user_id)
     if not db_user:
         raise HTTPException(
             status_code=404,
             detail="The user with this id does not exist in the system",
         )
     if user_in.email:
-        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
+        existing_user = await run_in_threadpool(
+            crud.get_user_by_email, session=session, email=user_in.email
+        )
         if existing_user and existing_user.id != user_id:
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
             )
+    hashed_password = None
+    if user_in.password:
+        try:
+            hashed_password = await password_hasher.hash(user_in.password)
+        except PasswordHasherBusy:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many password changes, try again shortly",
+                headers={"Retry-After": "1"},
+            )
 
-    db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    db_user = await run_in_threadpool(
+        crud.update_user,
+        session=session,
+        db_user=db_user,
+        user_in=user_in,
+        hashed_password=hashed_password,
+    )
     return db_user
 
 
@@ -228,7 +300,10 @@ def delete_user(
 
 @router.patch("/me/coreiot-token", response_model=UserPublic)
 def update_coreiot_token_me(
-    *, session: SessionDep, current_user: CurrentUser, coreiot_access_token: str = Body(..., embed=True)
+    *,
+    session: SessionDep,
+    current_user: CurrentUser,
+    coreiot_access_token: str = Body(..., embed=True),
 ) -> Any:
     """
     Update own CoreIoT access token.
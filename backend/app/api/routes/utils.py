@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.core.cache import reading_cache, user_cache
+from app.core.db import async_engine, db_router, engine, pool_stats
+from app.models import Message, Metrics
 from app.utils import generate_test_email, send_email
 
 router = APIRouter(prefix="/utils", tags=["utils"])
@@ -29,3 +31,17 @@ def test_email(email_to: EmailStr) -> Message:
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
+
+
+@router.get("/metrics/", dependencies=[Depends(get_current_active_superuser)])
+def get_metrics() -> Metrics:
+    """
+    Cache counters, database pool usage and replica lag for monitoring.
+    """
+    return Metrics(
+        coreiot_reading_cache=reading_cache.stats(),
+        auth_user_cache=user_cache.stats(),
+        db_pool=pool_stats(engine),
+        db_async_pool=pool_stats(async_engine),
+        db_replicas=db_router.stats(),
+    )
@@ -0,0 +1,395 @@
+import logging
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple
+
+import numpy as np
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, select
+
+from app.models import (
+    METRICS,
+    Alarm,
+    AlarmDeviceState,
+    CoreIoTData,
+    NotificationCreate,
+    UserDeviceLink,
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+logger = logging.getLogger(__name__)
+
+
+class AlarmRule(NamedTuple):
+    id: uuid.UUID
+    user_id: uuid.UUID
+    type: str
+    threshold_type: str
+    value: float
+    hysteresis: float = 0.0
+    min_duration_ms: int = 0
+    cooldown_ms: int = 0
+
+    @classmethod
+    def from_alarm(cls, alarm: Alarm) -> "AlarmRule":
+        return cls(
+            alarm.id,
+            alarm.user_id,
+            alarm.type,
+            alarm.threshold_type,
+            alarm.value,
+            alarm.hysteresis,
+            alarm.min_duration_seconds * 1000,
+            alarm.cooldown_seconds * 1000,
+        )
+
+    def breached(self, values: np.ndarray) -> np.ndarray:
+        if self.threshold_type == "above":
+            return values > self.value
+        return values < self.value
+
+    def cleared(self, values: np.ndarray) -> np.ndarray:
+        if self.threshold_type == "above":
+            return values <= self.value - self.hysteresis
+        return values >= self.value + self.hysteresis
+
+    def message(self, actual: float) -> str:
+        return f"{self.type.title()} is {self.threshold_type} {self.value} (actual: {actual})"
+
+    def notification(self, actual: float) -> NotificationCreate:
+        return NotificationCreate(
+            message=self.message(actual), user_id=self.user_id, alarm_id=self.id
+        )
+
+
+class AlarmState(NamedTuple):
+    # Epoch milliseconds, like the readings
+    is_firing: bool = False
+    pending_since: int | None = None
+    last_fired_at: int | None = None
+
+
+def _to_ms(timestamp: datetime | None) -> int | None:
+    if timestamp is None:
+        return None
+    return (timestamp.replace(tzinfo=None) - EPOCH) // timedelta(milliseconds=1)
+
+
+def _from_ms(ms: int | None) -> datetime | None:
+    return None if ms is None else EPOCH + timedelta(milliseconds=ms)
+
+
+def advance(
+    rule: AlarmRule, state: AlarmState, ts_ms: np.ndarray, series: np.ndarray
+) -> tuple[AlarmState, list[int]]:
+    """
+    Run the state machine of one alarm over readings ordered by time and
+    return its new state with the positions of the readings that fired it.
+
+    A cleared alarm becomes pending when its threshold is crossed and fires
+    once it has stayed crossed for `min_duration_ms`, unless it fired less
+    than `cooldown_ms` ago. A firing alarm only clears after the value moved
+    `hysteresis` back past the threshold.
+    """
+    breached = rule.breached(series).tolist()
+    cleared = rule.cleared(series).tolist()
+    is_firing, pending_since, last_fired_at = state
+    fired = []
+    for i, ts in enumerate(ts_ms.tolist()):
+        if last_fired_at is not None and ts <= last_fired_at:
+            # Older than the state, e.g. a late backfill
+            continue
+        if is_firing:
+            if cleared[i]:
+                is_firing = False
+            continue
+        if not breached[i]:
+            pending_since = None
+            continue
+        if pending_since is None:
+            pending_since = ts
+        if ts - pending_since >= rule.min_duration_ms and (
+            last_fired_at is None or ts - last_fired_at >= rule.cooldown_ms
+        ):
+            is_firing, pending_since, last_fired_at = True, None, ts
+            fired.append(i)
+    return AlarmState(is_firing, pending_since, last_fired_at), fired
+
+
+class _Thresholds:
+    """
+    Rules of one (metric, threshold_type), sorted by threshold value.
+    """
+
+    def __init__(self, rules: list[tuple[float, int]]) -> None:
+        rules.sort()
+        self.values = [value for value, _ in rules]
+        self.rules = [index for _, index in rules]
+        self.values_array = np.array(self.values, dtype=float)
+        self.rules_array = np.array(self.rules, dtype=np.int64)
+
+
+class TrippedAlarms(NamedTuple):
+    # Parallel arrays: reading position in the batch and tripped rule index
+    readings: np.ndarray
+    rules: np.ndarray
+
+
+class AlarmIndex:
+    """
+    Active alarms keyed by metric with thresholds kept sorted, so the alarms
+    tripped by a value are a contiguous slice found by bisection: "above"
+    alarms with a threshold below the value, "below" alarms with one above.
+    """
+
+    def __init__(self, rules: Iterable[AlarmRule]) -> None:
+        self.rules = list(rules)
+        self.positions = {rule.id: index for index, rule in enumerate(self.rules)}
+        grouped: dict[tuple[str, str], list[tuple[float, int]]] = {
+            (metric, kind): [] for metric in METRICS for kind in ("above", "below")
+        }
+        for index, rule in enumerate(self.rules):
+            key = (rule.type, rule.threshold_type)
+            if key in grouped:
+                grouped[key].append((rule.value, index))
+        self._thresholds = {key: _Thresholds(rules) for key, rules in grouped.items()}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def tripped(self, metric: str, value: float) -> list[AlarmRule]:
+        above = self._thresholds[(metric, "above")]
+        below = self._thresholds[(metric, "below")]
+        indices = above.rules[: bisect_left(above.values, value)]
+        indices += below.rules[bisect_right(below.values, value) :]
+        return [self.rules[i] for i in indices]
+
+    def evaluate(self, reading: CoreIoTData) -> list[tuple[AlarmRule, float]]:
+        tripped = []
+        for metric in METRICS:
+            value = getattr(reading, metric)
+            tripped += [(rule, value) for rule in self.tripped(metric, value)]
+        return tripped
+
+    def evaluate_batch(self, values: dict[str, np.ndarray]) -> TrippedAlarms:
+        """
+        Evaluate a batch of readings, given as one array per metric, against
+        every rule at once.
+        """
+        readings: list[np.ndarray] = []
+        rules: list[np.ndarray] = []
+        for metric in METRICS:
+            series = np.asarray(values[metric], dtype=float)
+            above = self._thresholds[(metric, "above")]
+            below = self._thresholds[(metric, "below")]
+            # Tripped "above" rules are the prefix [0, end) of the sorted list,
+            # tripped "below" rules the suffix [start, len)
+            above_end = np.searchsorted(above.values_array, series, side="left")
+            below_start = np.searchsorted(below.values_array, series, side="right")
+            for thresholds, starts, counts in (
+                (above, np.zeros_like(above_end), above_end),
+                (below, below_start, len(below.values) - below_start),
+            ):
+                total = int(counts.sum())
+                if not total:
+                    continue
+                offsets = np.arange(total) - np.repeat(
+                    np.cumsum(counts) - counts, counts
+                )
+                readings.append(np.repeat(np.arange(len(series)), counts))
+                rules.append(
+                    thresholds.rules_array[np.repeat(starts, counts) + offsets]
+                )
+        if not readings:
+            empty = np.empty(0, dtype=np.int64)
+            return TrippedAlarms(empty, empty)
+        return TrippedAlarms(np.concatenate(readings), np.concatenate(rules))
+
+
+class AlarmEngine:
+    """
+    Process-wide cache of the active alarms, indexed per device over the
+    alarms of the users linked to it.
+
+    Alarm and device link CRUD in this process calls `invalidate`. Changes
+    made by other processes are picked up through a cheap fingerprint query
+    (alarm count and latest update, link count) that is checked before each
+    evaluation.
+    """
+
+    def __init__(self) -> None:
+        self._rules: list[AlarmRule] | None = None
+        self._device_users: dict[uuid.UUID, set[uuid.UUID]] = {}
+        self._indexes: dict[uuid.UUID, AlarmIndex] = {}
+        self._fingerprint: Any = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._rules = None
+
+    def get_index(self, session: Session, device_id: uuid.UUID) -> AlarmIndex:
+        links = select(func.count()).select_from(UserDeviceLink).scalar_subquery()
+        fingerprint = tuple(
+            session.exec(select(func.count(), func.max(Alarm.updated_at), links)).one()
+        )
+        with self._lock:
+            if self._rules is None or fingerprint != self._fingerprint:
+                alarms = session.exec(select(Alarm).where(Alarm.is_active)).all()
+                self._rules = [AlarmRule.from_alarm(a) for a in alarms]
+                self._device_users = {}
+                for user_id, linked_device in session.exec(
+                    select(UserDeviceLink.user_id, UserDeviceLink.device_id)
+                ):
+                    self._device_users.setdefault(linked_device, set()).add(user_id)
+                self._indexes = {}
+                self._fingerprint = fingerprint
+                logger.info(f"Loaded {len(self._rules)} active alarms")
+            index = self._indexes.get(device_id)
+            if index is None:
+                users = self._device_users.get(device_id, set())
+                index = AlarmIndex(
+                    rule for rule in self._rules if rule.user_id in users
+                )
+                self._indexes[device_id] = index
+            return index
+
+    def evaluate(
+        self,
+        session: Session,
+        device_id: uuid.UUID,
+        ts_ms: np.ndarray,
+        values: dict[str, np.ndarray],
+    ) -> list[NotificationCreate]:
+        """
+        Advance the alarms a batch of readings of a device can affect, in
+        their state for that device: the ones it trips and the ones already
+        pending or firing on it. The state rows are locked in alarm id
+        order, so concurrent writers for the device evaluate them one after
+        the other, and only written back when they change. The caller owns
+        the transaction.
+        """
+        index = self.get_index(session, device_id)
+        if not len(index) or not len(ts_ms):
+            return []
+        order = np.argsort(ts_ms, kind="stable")
+        ts_ms = np.asarray(ts_ms)[order]
+        values = {
+            metric: np.asarray(values[metric], dtype=float)[order] for metric in METRICS
+        }
+
+        tripped = index.evaluate_batch(values)
+        tripped_ids = sorted(
+            index.rules[i].id for i in np.unique(tripped.rules).tolist()
+        )
+        # Alarms tripped for the first time on the device get a state row,
+        # so there is one to lock
+        for ids in _chunks(tripped_ids):
+            session.execute(
+                insert(AlarmDeviceState)
+                .values(
+                    [{"alarm_id": alarm_id, "device_id": device_id} for alarm_id in ids]
+                )
+                .on_conflict_do_nothing()
+            )
+        # Only the alarms of this device's index, never the whole table, so
+        # batches of other devices neither wait on nor add to the work
+        engaged: set[uuid.UUID] = set()
+        for ids in _chunks(sorted(index.positions)):
+            engaged.update(
+                session.exec(
+                    select(AlarmDeviceState.alarm_id)
+                    .where(AlarmDeviceState.device_id == device_id)
+                    .where(col(AlarmDeviceState.alarm_id).in_(ids))
+                    .where(
+                        col(AlarmDeviceState.is_firing)
+                        | col(AlarmDeviceState.pending_since).is_not(None)
+                    )
+                )
+            )
+        alarm_ids = sorted(engaged.union(tripped_ids))
+        rows = []
+        for ids in _chunks(alarm_ids):
+            statement = (
+                select(
+                    col(AlarmDeviceState.alarm_id),
+                    col(AlarmDeviceState.is_firing),
+                    col(AlarmDeviceState.pending_since),
+                    col(AlarmDeviceState.last_fired_at),
+                )
+                .where(AlarmDeviceState.device_id == device_id)
+                .where(col(AlarmDeviceState.alarm_id).in_(ids))
+                .order_by(col(AlarmDeviceState.alarm_id))
+                .with_for_update()
+            )
+            rows += session.exec(statement).all()
+
+        notifications = []
+        changes = []
+        summarized = []
+        for alarm_id, is_firing, pending_since, last_fired_at in rows:
+            rule = index.rules[index.positions[alarm_id]]
+            state = AlarmState(is_firing, _to_ms(pending_since), _to_ms(last_fired_at))
+            new_state, fired = advance(rule, state, ts_ms, values[rule.type])
+            notifications += [
+                rule.notification(float(values[rule.type][i])) for i in fired
+            ]
+            if new_state != state:
+                changes.append(
+                    {
+                        "alarm_id": alarm_id,
+                        "device_id": device_id,
+                        "is_firing": new_state.is_firing,
+                        "pending_since": _from_ms(new_state.pending_since),
+                        "last_fired_at": _from_ms(new_state.last_fired_at),
+                    }
+                )
+            if new_state.is_firing != state.is_firing or fired:
+                summarized.append(alarm_id)
+        if changes:
+            session.execute(update(AlarmDeviceState), changes)
+        if summarized:
+            update_summaries(session, summarized)
+        return notifications
+
+
+def _chunks(ids: list[uuid.UUID], size: int = 10_000) -> Iterator[list[uuid.UUID]]:
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
+
+
+def update_summaries(session: Session, alarm_ids: list[uuid.UUID]) -> None:
+    """
+    Recompute whether alarms fire on any device, and when they last fired,
+    from their device states.
+    """
+    # Alarm rows are locked after state rows and in id order, like every
+    # writer does, and the summary computed by a statement starting once
+    # they are, so it sees the states other devices committed meanwhile
+    session.exec(
+        select(Alarm.id)
+        .where(col(Alarm.id).in_(alarm_ids))
+        .order_by(col(Alarm.id))
+        .with_for_update()
+    ).all()
+    states = select(AlarmDeviceState).where(AlarmDeviceState.alarm_id == Alarm.id)
+    session.execute(
+        update(Alarm)
+        .where(col(Alarm.id).in_(alarm_ids))
+        .values(
+            is_firing=states.with_only_columns(
+                func.coalesce(func.bool_or(AlarmDeviceState.is_firing), False)
+            ).scalar_subquery(),
+            last_fired_at=states.with_only_columns(
+                func.max(AlarmDeviceState.last_fired_at)
+            ).scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+alarm_engine = AlarmEngine()
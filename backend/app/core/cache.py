@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Generic, Protocol, TypeVar
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import CacheStats, CoreIoTData, User
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Bounded mapping that evicts the least recently used entry and remembers
+    when each value was stored, leaving freshness decisions to the caller.
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> tuple[float, V] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: K, value: V, stored_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class CacheBackend(Protocol):
+    """
+    Optional second-level store shared between worker processes, such as
+    Redis, that ReadingCache can be given. Values are serialized strings
+    stamped with the wall-clock time they were fetched at, so every process
+    agrees on their age, and may be dropped once `ttl` seconds old.
+    """
+
+    async def get(self, key: str) -> tuple[float, str] | None: ...
+
+    async def set(self, key: str, value: str, stored_at: float, ttl: float) -> None: ...
+
+
+def token_scope(access_token: str) -> str:
+    # Readings are cached per token since tokens may see different devices,
+    # without keeping the tokens themselves around as keys
+    return hashlib.sha256(access_token.encode()).hexdigest()[:16]
+
+
+class ReadingCache:
+    """
+    Latest reading per (device, access token scope) fetched on demand from
+    CoreIoT.
+
+    A reading younger than `ttl` is served as is. An older one is still
+    served for up to `stale_ttl` more seconds if refreshing it takes longer
+    than `revalidate_timeout` or fails, while the refresh carries on in the
+    background. Concurrent misses for a key share one upstream request.
+    Must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float,
+        stale_ttl: float,
+        revalidate_timeout: float,
+        max_entries: int,
+        backend: CacheBackend | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.revalidate_timeout = revalidate_timeout
+        self.backend = backend
+        self.clock = clock
+        self._local: LRUCache[str, CoreIoTData] = LRUCache(max_entries)
+        self._inflight: dict[str, asyncio.Task[CoreIoTData]] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(device_id: str, access_token: str) -> str:
+        return f"coreiot:latest:{device_id}:{token_scope(access_token)}"
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._local),
+            hits=self.hits,
+            stale_hits=self.stale_hits,
+            misses=self.misses,
+            coalesced=self.coalesced,
+            errors=self.errors,
+        )
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    async def get(
+        self,
+        device_id: str,
+        access_token: str,
+        fetch: Callable[[], Awaitable[CoreIoTData]],
+    ) -> CoreIoTData:
+        key = self.key(device_id, access_token)
+        entry = self._local.get(key)
+        if entry is None and self.backend is not None:
+            entry = await self._get_shared(key)
+        if entry is not None:
+            stored_at, reading = entry
+            age = self.clock() - stored_at
+            if age < self.ttl:
+                self.hits += 1
+                return reading
+            if age < self.ttl + self.stale_ttl:
+                refresh = self._refresh(key, fetch)
+                try:
+                    return await asyncio.wait_for(
+                        asyncio.shield(refresh), self.revalidate_timeout
+                    )
+                except Exception:
+                    # Slow or failing upstream, the refresh keeps running
+                    self.stale_hits += 1
+                    return reading
+        self.misses += 1
+        return await asyncio.shield(self._refresh(key, fetch))
+
+    def _refresh(
+        self, key: str, fetch: Callable[[], Awaitable[CoreIoTData]]
+    ) -> asyncio.Task[CoreIoTData]:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.get_running_loop().create_task(self._fetch(key, fetch))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return task
+
+    def _finished(self, key: str, task: asyncio.Task[CoreIoTData]) -> None:
+        self._inflight.pop(key, None)
+        # Retrieve the error of refreshes nobody waited for until the end
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Refreshing {key} failed: {task.exception()!r}")
+
+    async def _fetch(
+        self, key: str, fetch: Callable[[], Awaitable[CoreIoTData]]
+    ) -> CoreIoTData:
+        try:
+            reading = await fetch()
+        except Exception:
+            self.errors += 1
+            raise
+        stored_at = self.clock()
+        self._local.set(key, reading, stored_at)
+        if self.backend is not None:
+            try:
+                await self.backend.set(
+                    key, reading.model_dump_json(), stored_at, self.ttl + self.stale_ttl
+                )
+            except Exception as e:
+                logger.warning(f"Could not write {key} to the cache backend: {e!r}")
+        return reading
+
+    async def _get_shared(self, key: str) -> tuple[float, CoreIoTData] | None:
+        assert self.backend is not None
+        try:
+            entry = await self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Could not read {key} from the cache backend: {e!r}")
+            return None
+        if entry is None:
+            return None
+        stored_at, value = entry
+        # Table models only validate through model_validate
+        reading = CoreIoTData.model_validate(json.loads(value))
+        self._local.set(key, reading, stored_at)
+        return stored_at, reading
+
+
+# Ids of users changed in other worker processes, over the notification
+# backplane
+USER_CHANNEL = "user_changed"
+_SESSION_KEY = "changed_users"
+
+
+class UserCache:
+    """
+    Authenticated users by id, so requests carrying a token skip the user
+    lookup. Entries are detached snapshots, merged into the request's
+    session without a query, and live at most `ttl` seconds.
+
+    Users are dropped once a transaction changing or deleting them commits,
+    in every worker when the notification backplane is enabled. Without it
+    other workers may see a change up to `ttl` seconds late.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float,
+        max_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: LRUCache[uuid.UUID, User] = LRUCache(max_entries)
+        # Bumped by every invalidation, so a user loaded before one is not
+        # cached after it
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session: Session, user_id: uuid.UUID) -> User | None:
+        """
+        The cached user attached to `session`, or the user loaded from the
+        database and cached, or None if there is no such user.
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None and self.clock() - entry[0] < self.ttl:
+            self.hits += 1
+            return session.merge(entry[1], load=False)
+        self.misses += 1
+        generation = self._generation
+        stored_at = self.clock()
+        user = session.get(User, user_id)
+        if user is not None:
+            # A copy of the loaded columns only, relationships stay lazy
+            snapshot = User(**user.model_dump())
+            make_transient_to_detached(snapshot)
+            if generation == self._generation:
+                self._entries.set(user_id, snapshot, stored_at)
+        return user
+
+    async def get_async(self, session: AsyncSession, user_id: uuid.UUID) -> User | None:
+        return await session.run_sync(self.get, user_id)
+
+    def invalidate(self, *user_ids: uuid.UUID) -> None:
+        self._generation += 1
+        for user_id in user_ids:
+            self._entries.pop(user_id)
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._entries),
+            hits=self.hits,
+            stale_hits=0,
+            misses=self.misses,
+            coalesced=0,
+            errors=0,
+        )
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _after_flush(session: OrmSession, _flush_context: object) -> None:
+    # Covers every change made through the ORM, crud.update_user, password
+    # changes and resets, deactivation and deletion alike
+    user_ids = [
+        obj.id
+        for obj in (*session.dirty, *session.deleted)
+        if isinstance(obj, User)
+        and (obj in session.deleted or session.is_modified(obj))
+    ]
+    if not user_ids:
+        return
+    session.info.setdefault(_SESSION_KEY, set()).update(user_ids)
+    if settings.NOTIFICATION_BACKPLANE_ENABLED:
+        session.connection().execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": USER_CHANNEL, "payload": "\n".join(map(str, user_ids))},
+        )
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session: OrmSession) -> None:
+    user_ids = session.info.pop(_SESSION_KEY, None)
+    if user_ids:
+        user_cache.invalidate(*user_ids)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _after_rollback(session: OrmSession) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+reading_cache = ReadingCache(
+    ttl=settings.COREIOT_CACHE_TTL_SECONDS,
+    stale_ttl=settings.COREIOT_CACHE_STALE_SECONDS,
+    revalidate_timeout=settings.COREIOT_CACHE_REVALIDATE_TIMEOUT_SECONDS,
+    max_entries=settings.COREIOT_CACHE_MAX_ENTRIES,
+)
+
+user_cache = UserCache(
+    ttl=settings.AUTH_USER_CACHE_TTL_SECONDS,
+    max_entries=settings.AUTH_USER_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,195 @@
+import asyncio
+import importlib.util
+import logging
+from datetime import datetime, timezone
+from typing import Any
+
+import httpx
+
+from app.core.config import settings
+from app.models import CoreIoTData
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_KEYS = "humidity,temperature,light"
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+class CoreIoTError(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def telemetry_path(device_id: str) -> str:
+    return (
+        f"/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries"
+        f"?keys={TELEMETRY_KEYS}&useStrictDataTypes=false"
+    )
+
+
+def parse_telemetry(data: dict[str, Any]) -> CoreIoTData:
+    """
+    Build a reading from a CoreIoT timeseries payload.
+    """
+    if "temperature" not in data or "humidity" not in data:
+        raise CoreIoTError(500, "Invalid data format from CoreIoT")
+    if not data["temperature"] or not data["humidity"]:
+        raise CoreIoTError(404, "No sensor data available")
+    light = data.get("light") or [{"value": 0.0}]
+    return CoreIoTData(
+        temperature=float(data["temperature"][-1]["value"]),
+        humidity=float(data["humidity"][-1]["value"]),
+        light=float(light[-1]["value"]),
+        timestamp=datetime.fromtimestamp(
+            data["temperature"][-1]["ts"] / 1000, tz=timezone.utc
+        ),
+    )
+
+
+class CoreIoTClient:
+    """
+    Shared async client for the CoreIoT REST API.
+
+    One pooled `httpx.AsyncClient` is kept per event loop so connections (and
+    their TLS sessions) are reused across requests. Calls are bounded by a
+    semaphore and retried with exponential backoff on transport errors and
+    gateway failures.
+    """
+
+    def __init__(
+        self,
+        *,
+        base_url: str,
+        timeout: float,
+        max_connections: int,
+        max_concurrency: int,
+        retries: int,
+        backoff: float,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_client(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._semaphore is None or self._loop is not loop:
+            # HTTP/2 needs the optional h2 package, fall back to keep-alive HTTP/1.1
+            http2 = importlib.util.find_spec("h2") is not None
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                transport=self.transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client, self._semaphore
+
+    async def aclose(self) -> None:
+        client, self._client = self._client, None
+        self._semaphore = None
+        self._loop = None
+        if client is not None:
+            await client.aclose()
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        access_token: str,
+        timeout: float | None = None,
+        retry_on_status: bool = True,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        client, semaphore = self._get_client()
+        headers = {"X-Authorization": f"Bearer {access_token}"}
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    response = await client.request(
+                        method,
+                        path,
+                        headers=headers,
+                        timeout=timeout if timeout is not None else self.timeout,
+                        **kwargs,
+                    )
+                if not (retry_on_status and response.status_code in RETRY_STATUS_CODES):
+                    return response
+                if attempt >= self.retries:
+                    return response
+            except httpx.TransportError as e:
+                if attempt >= self.retries:
+                    raise CoreIoTError(503, f"Error connecting to CoreIoT: {e!r}")
+                logger.warning(f"CoreIoT {method} {path} failed: {e!r}, retrying")
+            await asyncio.sleep(self.backoff * 2**attempt)
+            attempt += 1
+
+    async def get_telemetry(
+        self, device_id: str, *, access_token: str, timeout: float | None = None
+    ) -> dict[str, Any]:
+        response = await self.request(
+            "GET",
+            telemetry_path(device_id),
+            access_token=access_token,
+            timeout=timeout,
+        )
+        if response.status_code != 200:
+            raise CoreIoTError(
+                response.status_code,
+                f"Failed to fetch data from CoreIoT: {response.text}",
+            )
+        data: dict[str, Any] = response.json()
+        return data
+
+    async def get_latest_reading(
+        self, device_id: str, *, access_token: str, timeout: float | None = None
+    ) -> CoreIoTData:
+        data = await self.get_telemetry(
+            device_id, access_token=access_token, timeout=timeout
+        )
+        return parse_telemetry(data)
+
+    async def send_rpc(
+        self,
+        device_id: str,
+        *,
+        access_token: str,
+        method: str,
+        params: Any,
+        timeout: float | None = None,
+    ) -> httpx.Response:
+        # One-way RPCs are not idempotent in general, only retry transport errors
+        return await self.request(
+            "POST",
+            f"/api/rpc/oneway/{device_id}",
+            access_token=access_token,
+            timeout=timeout,
+            retry_on_status=False,
+            json={"method": method, "params": params},
+        )
+
+
+coreiot_client = CoreIoTClient(
+    base_url=settings.COREIOT_BASE_URL,
+    timeout=settings.COREIOT_TIMEOUT_SECONDS,
+    max_connections=settings.COREIOT_MAX_CONNECTIONS,
+    max_concurrency=settings.COREIOT_MAX_CONCURRENCY,
+    retries=settings.COREIOT_RETRIES,
+    backoff=settings.COREIOT_RETRY_BACKOFF_SECONDS,
+)
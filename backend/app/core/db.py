@@ -1,10 +1,203 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from sqlalchemy import Engine, event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session as OrmSession
 from sqlmodel import Session, create_engine, select
 
 from app import crud
+from app.core.cache import LRUCache
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.models import Device, PoolStats, ReplicaStats, User, UserCreate
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_options() -> dict[str, Any]:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), **_pool_options())
+# The same psycopg driver, in its async flavor, for async routes
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI), **_pool_options()
+)
+
+
+def pool_stats(db_engine: Any) -> PoolStats:
+    if isinstance(db_engine, AsyncEngine):
+        db_engine = db_engine.sync_engine
+    pool = db_engine.pool
+    return PoolStats(
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=max(pool.overflow(), 0),
+    )
+
+
+# Seconds the replica is behind the primary, 0 when it has replayed all it
+# received, so an idle primary does not make it look late, and when the
+# server is not a replica at all
+LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """
+)
+# Users who wrote recently, the least recently writing forgotten first
+STICKY_MAX_USERS = 100_000
+# Set on the primary session of authenticated requests by the user
+# dependencies, so their commits are attributed to the user
+USER_KEY = "user_id"
+
+
+class ReplicaRouter:
+    """
+    Picks the engine of read-only sessions: one of the streaming replicas at
+    `urls`, in turn, or the primary.
+
+    The lag of every replica is measured every `check_interval` seconds.
+    Replicas more than `max_lag` seconds behind, failing, or not measured
+    lately are skipped until they catch up, falling back to the primary.
+    Reads of a user who committed within `sticky_for` seconds go to the
+    primary as well, so they see their own writes. Writes are remembered
+    per worker process, another worker may serve a replica's older data.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        *,
+        max_lag: float,
+        check_interval: float,
+        sticky_for: float,
+        db_engine: Engine | None = None,
+        db_async_engine: AsyncEngine | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_for = sticky_for
+        self.engine = db_engine if db_engine is not None else engine
+        self.async_engine = (
+            db_async_engine if db_async_engine is not None else async_engine
+        )
+        self.clock = clock
+        self.replicas = [create_engine(url, **_pool_options()) for url in urls]
+        self.async_replicas = [
+            create_async_engine(url, **_pool_options()) for url in urls
+        ]
+        self._lags: list[float | None] = [None] * len(urls)
+        self._checked_at = [-math.inf] * len(urls)
+        self._turn = itertools.count()
+        self._writes: LRUCache[uuid.UUID, None] = LRUCache(STICKY_MAX_USERS)
+        self._task: asyncio.Task[None] | None = None
+
+    def wrote(self, user_id: uuid.UUID) -> None:
+        self._writes.set(user_id, None, self.clock())
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    def wrote_recently(self, user_id: uuid.UUID) -> bool:
+        entry = self._writes.get(user_id)
+        return entry is not None and self.clock() - entry[0] < self.sticky_for
+
+    def read_engine(self, user_id: uuid.UUID | None = None) -> Engine:
+        index = self._pick(user_id)
+        return self.engine if index is None else self.replicas[index]
+
+    def async_read_engine(self, user_id: uuid.UUID | None = None) -> AsyncEngine:
+        index = self._pick(user_id)
+        return self.async_engine if index is None else self.async_replicas[index]
+
+    def _usable(self, index: int) -> bool:
+        lag = self._lags[index]
+        # Measurements left unrefreshed for several checks mean the checks
+        # hang or stopped
+        return (
+            lag is not None
+            and lag <= self.max_lag
+            and self.clock() - self._checked_at[index] < 3 * self.check_interval
+        )
+
+    def _pick(self, user_id: uuid.UUID | None) -> int | None:
+        if not self.replicas:
+            return None
+        if user_id is not None and self.wrote_recently(user_id):
+            return None
+        usable = [i for i in range(len(self.replicas)) if self._usable(i)]
+        if not usable:
+            return None
+        return usable[next(self._turn) % len(usable)]
+
+    def refresh(self) -> None:
+        """
+        Measure the lag of every replica, None for replicas that cannot be
+        reached or have replayed nothing yet.
+        """
+        for index, replica in enumerate(self.replicas):
+            lag = None
+            try:
+                with replica.connect() as connection:
+                    lag = connection.execute(LAG_SQL).scalar()
+            except Exception as e:
+                logger.warning(f"Could not check replica {replica.url!r}: {e!r}")
+            self._lags[index] = None if lag is None else float(lag)
+            self._checked_at[index] = self.clock()
+
+    def stats(self) -> list[ReplicaStats]:
+        return [
+            ReplicaStats(
+                url=replica.url.render_as_string(hide_password=True),
+                lag_seconds=self._lags[index],
+                usable=self._usable(index),
+                pool=pool_stats(replica),
+                async_pool=pool_stats(self.async_replicas[index]),
+            )
+            for index, replica in enumerate(self.replicas)
+        ]
+
+    async def start(self) -> None:
+        if self._task is not None or not self.replicas:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._check_loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        # Their connections belong to this event loop
+        for replica in self.async_replicas:
+            await replica.dispose()
+
+    async def _check_loop(self) -> None:
+        while True:
+            await asyncio.to_thread(self.refresh)
+            await asyncio.sleep(self.check_interval)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session: OrmSession) -> None:
+    # Read-only requests do not commit, so any commit counts as a write
+    user_id = session.info.get(USER_KEY)
+    if user_id is not None:
+        db_router.wrote(user_id)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -21,6 +214,12 @@ def init_db(session: Session) -> None:
     # This works because the models are already imported and registered from app.models
     # SQLModel.metadata.create_all(engine)
 
+    # Register the configured devices so users are linked to them
+    for device_id in settings.COREIOT_DEVICE_IDS:
+        if session.get(Device, uuid.UUID(device_id)) is None:
+            session.add(Device(id=uuid.UUID(device_id), name=f"Device {device_id[:8]}"))
+    session.commit()
+
     user = session.exec(
         select(User).where(User.email == settings.FIRST_SUPERUSER)
     ).first()
@@ -31,3 +230,11 @@ def init_db(session: Session) -> None:
             is_superuser=True,
         )
         user = crud.create_user(session=session, user_create=user_in)
+
+
+db_router = ReplicaRouter(
+    settings.DB_REPLICA_URLS,
+    max_lag=settings.DB_REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.DB_REPLICA_CHECK_SECONDS,
+    sticky_for=settings.DB_READ_YOUR_WRITES_SECONDS,
+)
@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any
+
+try:
+    import pyarrow as pa  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+Batches = Iterable[Sequence[Any]]
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def _columns(metrics: list[str]) -> list[str]:
+    return ["timestamp", *metrics]
+
+
+def ndjson_chunks(batches: Batches, metrics: list[str]) -> Iterator[bytes]:
+    for batch in batches:
+        lines = [
+            json.dumps(
+                {
+                    "timestamp": timestamp.isoformat(),
+                    **dict(zip(metrics, values, strict=True)),
+                }
+            )
+            for timestamp, _id, *values in batch
+        ]
+        if lines:
+            yield ("\n".join(lines) + "\n").encode()
+
+
+def csv_chunks(batches: Batches, metrics: list[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(_columns(metrics))
+    for batch in batches:
+        writer.writerows(
+            (timestamp.isoformat(), *values) for timestamp, _id, *values in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def arrow_chunks(batches: Batches, metrics: list[str]) -> Iterator[bytes]:
+    """
+    Arrow IPC stream format, one record batch per database batch.
+    """
+    schema = pa.schema(
+        [("timestamp", pa.timestamp("us"))] + [(m, pa.float64()) for m in metrics]
+    )
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            columns = (
+                list(zip(*batch, strict=True)) if batch else [()] * (len(metrics) + 2)
+            )
+            arrays = [pa.array(columns[0], type=pa.timestamp("us"))] + [
+                pa.array(column, type=pa.float64()) for column in columns[2:]
+            ]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+WRITERS = {
+    "ndjson": ndjson_chunks,
+    "csv": csv_chunks,
+    "arrow": arrow_chunks,
+}
@@ -0,0 +1,445 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from statistics import NormalDist
+from typing import Any, NamedTuple
+
+import numpy as np
+from sqlalchemy import event, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.rollups import from_epoch_ms, to_epoch_ms, to_naive_utc
+from app.models import METRICS, ForecastState
+
+logger = logging.getLogger(__name__)
+
+_SESSION_KEY = "forecast_readings"
+# Weight of the latest squared one-step error in the error variance
+VARIANCE_SMOOTHING = 0.05
+
+
+class HoltState(NamedTuple):
+    level: float = 0.0
+    trend: float = 0.0
+    # Exponentially weighted variance of the one-step-ahead errors
+    variance: float = 0.0
+    count: int = 0
+    last_ts: int = -1
+
+    def forecast(self, steps: int = 1) -> float:
+        return self.level + steps * self.trend
+
+
+def holt_update(
+    state: HoltState,
+    ts_ms: np.ndarray,
+    series: np.ndarray,
+    *,
+    alpha: float,
+    beta: float,
+) -> HoltState:
+    """
+    Fold readings ordered by time into Holt's linear (double exponential)
+    smoothing state, one constant-time step per reading. Readings not newer
+    than the state are skipped.
+    """
+    level, trend, variance, count, last_ts = state
+    for ts, value in zip(ts_ms.tolist(), series.tolist(), strict=True):
+        if ts <= last_ts:
+            continue
+        last_ts = ts
+        if count == 0:
+            level, count = value, 1
+            continue
+        error = value - (level + trend)
+        variance = (
+            1 - VARIANCE_SMOOTHING
+        ) * variance + VARIANCE_SMOOTHING * error * error
+        previous = level
+        level = alpha * value + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous) + (1 - beta) * trend
+        count += 1
+    return HoltState(level, trend, variance, count, last_ts)
+
+
+def forecast_intervals(
+    states: list[HoltState],
+    steps: int,
+    *,
+    alpha: float | list[float],
+    beta: float | list[float],
+    confidence: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Forecasts of every state for 1 to `steps` readings ahead, with the
+    lower and upper bounds of their `confidence` prediction intervals, as
+    (states, steps) arrays computed in one pass. `alpha` and `beta` are
+    shared or given per state.
+
+    The interval widths use the h-step forecast variance of Holt's linear
+    method, sigma^2 * (1 + (h - 1) * (a^2 + a*b*h + b^2 * h * (2h - 1) / 6))
+    with b = alpha * beta, sigma^2 being the one-step error variance.
+    """
+    level, trend, variance = (
+        np.array([getattr(state, field) for state in states], dtype=float)[:, None]
+        for field in ("level", "trend", "variance")
+    )
+    alpha = np.asarray(alpha, dtype=float).reshape(-1, 1)
+    h = np.arange(1, steps + 1, dtype=float)
+    b = alpha * np.asarray(beta, dtype=float).reshape(-1, 1)
+    spread = 1 + (h - 1) * (alpha**2 + alpha * b * h + b**2 * h * (2 * h - 1) / 6)
+    predicted = level + h * trend
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    margin = z * np.sqrt(variance * spread)
+    return predicted, predicted - margin, predicted + margin
+
+
+class _Model:
+    __slots__ = ("states", "params", "version", "checked_at")
+
+    def __init__(
+        self,
+        states: dict[str, HoltState],
+        params: dict[str, tuple[float, float]],
+        version: datetime | None,
+        checked_at: float,
+    ) -> None:
+        self.states = states
+        # (alpha, beta) of each metric
+        self.params = params
+        # updated_at of the persisted rows the states were loaded from or
+        # last written to
+        self.version = version
+        self.checked_at = checked_at
+
+
+class Forecaster:
+    """
+    Holt forecasts of every device metric, updated as readings are stored.
+
+    States live in memory and are updated once the transaction storing the
+    readings commits. Dirty states are persisted every `persist_interval`
+    seconds, compactly as one row per (device, metric), and on shutdown. A
+    state missing from memory is loaded from that row and caught up on the
+    readings stored since, or warmed up from the latest readings.
+
+    Predictions are served from memory. At most once per `persist_interval`
+    a device's persisted version is compared with the one in memory and the
+    state reloaded when another process wrote a newer one, which keeps
+    workers that do not ingest the readings up to date. At most
+    `max_devices` clean states are kept, least recently used first out.
+
+    Each state is smoothed with the parameters tuned for it, see
+    `app.core.tuning`, or `alpha` and `beta` until it has been tuned.
+    """
+
+    def __init__(
+        self,
+        *,
+        alpha: float,
+        beta: float,
+        warmup: int,
+        persist_interval: float,
+        max_devices: int,
+        db_engine: Any = None,
+    ) -> None:
+        self.alpha = alpha
+        self.beta = beta
+        self.warmup = warmup
+        self.persist_interval = persist_interval
+        self.max_devices = max_devices
+        self.engine = db_engine if db_engine is not None else engine
+        self._models: OrderedDict[uuid.UUID, _Model] = OrderedDict()
+        # Readings of devices whose state is not loaded yet
+        self._pending: dict[
+            uuid.UUID, list[tuple[np.ndarray, dict[str, np.ndarray]]]
+        ] = {}
+        self._dirty: set[uuid.UUID] = set()
+        self._lock = threading.Lock()
+        self._task: asyncio.Task[None] | None = None
+
+    def update(
+        self, device_id: uuid.UUID, ts_ms: np.ndarray, values: dict[str, np.ndarray]
+    ) -> None:
+        order = np.argsort(ts_ms, kind="stable")
+        ts_ms = np.asarray(ts_ms)[order]
+        values = {
+            metric: np.asarray(values[metric], dtype=float)[order] for metric in METRICS
+        }
+        with self._lock:
+            model = self._models.get(device_id)
+            if model is None:
+                self._pending.setdefault(device_id, []).append((ts_ms, values))
+            else:
+                self._apply(model.states, model.params, ts_ms, values)
+            self._dirty.add(device_id)
+
+    def predict(
+        self, session: Session, device_id: uuid.UUID, metric: str, steps: int = 1
+    ) -> float | None:
+        state = self.get_states(session, device_id)[metric]
+        if state.count < 2:
+            return None
+        return state.forecast(steps)
+
+    def forecast(
+        self,
+        session: Session,
+        device_id: uuid.UUID,
+        metrics: list[str],
+        *,
+        steps: int,
+        confidence: float,
+    ) -> dict[str, tuple[HoltState, list[float], list[float], list[float]]]:
+        """
+        Forecasts of the metrics that have enough readings, with their
+        prediction intervals, keyed by metric.
+        """
+        model = self._get_model(session, device_id)
+        states = model.states
+        metrics = [metric for metric in metrics if states[metric].count >= 2]
+        if not metrics:
+            return {}
+        predicted, lower, upper = forecast_intervals(
+            [states[metric] for metric in metrics],
+            steps,
+            alpha=[model.params[metric][0] for metric in metrics],
+            beta=[model.params[metric][1] for metric in metrics],
+            confidence=confidence,
+        )
+        return {
+            metric: (
+                states[metric],
+                predicted[i].tolist(),
+                lower[i].tolist(),
+                upper[i].tolist(),
+            )
+            for i, metric in enumerate(metrics)
+        }
+
+    def get_states(
+        self, session: Session, device_id: uuid.UUID
+    ) -> dict[str, HoltState]:
+        return self._get_model(session, device_id).states
+
+    def get_params(
+        self, session: Session, device_id: uuid.UUID
+    ) -> dict[str, tuple[float, float]]:
+        return self._get_model(session, device_id).params
+
+    def _get_model(self, session: Session, device_id: uuid.UUID) -> _Model:
+        now = time.monotonic()
+        with self._lock:
+            model = self._models.get(device_id)
+            if model is not None:
+                self._models.move_to_end(device_id)
+                if now - model.checked_at < self.persist_interval:
+                    return model
+        if model is not None:
+            if self._version(session, device_id) == model.version:
+                model.checked_at = now
+                return model
+            # Written by another process since, the reload catches up on
+            # readings the persisted state had not seen yet
+            with self._lock:
+                if self._models.get(device_id) is model:
+                    del self._models[device_id]
+        return self._load(session, device_id)
+
+    def _version(self, session: Session, device_id: uuid.UUID) -> datetime | None:
+        return session.exec(
+            select(func.max(ForecastState.updated_at)).where(
+                ForecastState.device_id == device_id
+            )
+        ).one()
+
+    def _apply(
+        self,
+        states: dict[str, HoltState],
+        params: dict[str, tuple[float, float]],
+        ts_ms: np.ndarray,
+        values: dict[str, np.ndarray],
+    ) -> None:
+        for metric in METRICS:
+            alpha, beta = params[metric]
+            states[metric] = holt_update(
+                states[metric], ts_ms, values[metric], alpha=alpha, beta=beta
+            )
+
+    def _load(self, session: Session, device_id: uuid.UUID) -> _Model:
+        rows = session.exec(
+            select(ForecastState).where(ForecastState.device_id == device_id)
+        ).all()
+        states = {metric: HoltState() for metric in METRICS}
+        params = dict.fromkeys(METRICS, (self.alpha, self.beta))
+        version = max((row.updated_at for row in rows), default=None)
+        for row in rows:
+            states[row.metric] = HoltState(
+                row.level,
+                row.trend,
+                row.variance,
+                row.count,
+                to_epoch_ms(row.last_timestamp),
+            )
+            if row.alpha is not None and row.beta is not None:
+                params[row.metric] = (row.alpha, row.beta)
+        # Catch up on readings stored after the states were last persisted
+        since = min(state.last_ts for state in states.values())
+        readings = crud.get_latest_readings(
+            session,
+            device_id=device_id,
+            limit=self.warmup,
+            after=to_naive_utc(from_epoch_ms(since)) if since >= 0 else None,
+        )
+        if readings:
+            ts_ms = np.array([to_epoch_ms(r.timestamp) for r in readings])
+            values = {
+                metric: np.array([getattr(r, metric) for r in readings], dtype=float)
+                for metric in METRICS
+            }
+            self._apply(states, params, ts_ms, values)
+        with self._lock:
+            if device_id in self._models:
+                return self._models[device_id]
+            for ts_ms, values in self._pending.pop(device_id, []):
+                self._apply(states, params, ts_ms, values)
+            model = _Model(states, params, version, time.monotonic())
+            self._models[device_id] = model
+            self._evict()
+        return model
+
+    def _evict(self) -> None:
+        excess = len(self._models) - self.max_devices
+        for device_id in list(self._models):
+            if excess <= 0:
+                break
+            # Dirty states stay until they are persisted
+            if device_id not in self._dirty:
+                del self._models[device_id]
+                excess -= 1
+
+    def flush(self) -> int:
+        """
+        Persist the states updated since the last flush, keeping whichever
+        of the stored and the new state saw the latest reading. Tuned
+        parameters are left as stored.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+        try:
+            with Session(self.engine) as session:
+                rows = []
+                now = datetime.utcnow()
+                for device_id in dirty:
+                    for metric, state in self.get_states(session, device_id).items():
+                        if state.count:
+                            rows.append(
+                                {
+                                    "device_id": device_id,
+                                    "metric": metric,
+                                    "level": state.level,
+                                    "trend": state.trend,
+                                    "variance": state.variance,
+                                    "count": state.count,
+                                    "last_timestamp": to_naive_utc(
+                                        from_epoch_ms(state.last_ts)
+                                    ),
+                                    "updated_at": now,
+                                }
+                            )
+                if rows:
+                    table = ForecastState.__table__  # type: ignore[attr-defined]
+                    statement = insert(table).values(rows)
+                    excluded = statement.excluded
+                    statement = statement.on_conflict_do_update(
+                        index_elements=["device_id", "metric"],
+                        set_={
+                            column: excluded[column]
+                            for column in (
+                                "level",
+                                "trend",
+                                "variance",
+                                "count",
+                                "last_timestamp",
+                                "updated_at",
+                            )
+                        },
+                        where=excluded.last_timestamp > table.c.last_timestamp,
+                    )
+                    session.execute(statement)
+                    session.commit()
+                with self._lock:
+                    for device_id in dirty:
+                        model = self._models.get(device_id)
+                        if model is not None:
+                            model.version = now
+        except Exception:
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        return len(rows)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as e:
+            logger.error(f"Failed to persist forecast states: {e}")
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Failed to persist forecast states: {e}")
+
+
+def update_after_commit(
+    session: Session,
+    device_id: uuid.UUID,
+    ts_ms: np.ndarray,
+    values: dict[str, np.ndarray],
+) -> None:
+    """
+    Feed readings to the forecaster once the session's transaction commits.
+    """
+    session.info.setdefault(_SESSION_KEY, []).append((device_id, ts_ms, values))
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session: OrmSession) -> None:
+    for device_id, ts_ms, values in session.info.pop(_SESSION_KEY, ()):
+        forecaster.update(device_id, ts_ms, values)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _after_rollback(session: OrmSession) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+forecaster = Forecaster(
+    alpha=settings.FORECAST_ALPHA,
+    beta=settings.FORECAST_BETA,
+    warmup=settings.FORECAST_WARMUP_READINGS,
+    persist_interval=settings.FORECAST_PERSIST_SECONDS,
+    max_devices=settings.FORECAST_MAX_DEVICES,
+)
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Hashable, Iterable
+
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, hub: "Hub", topic: Hashable, max_queue: int) -> None:
+        self.hub = hub
+        self.topic = topic
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def put(self, message: str) -> None:
+        if self.queue.full():
+            # A slow client loses its oldest messages instead of holding
+            # up the publisher or growing without bound
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self) -> str:
+        return await self.queue.get()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            yield await self.queue.get()
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+class Hub:
+    """
+    In-process fan-out of messages to every subscriber of a topic.
+
+    Messages are strings so a publisher serializes once however many
+    subscribers there are. Subscribing and `publish` happen on the event
+    loop, other threads use `publish_threadsafe`. A full subscriber queue
+    drops its oldest message.
+    """
+
+    def __init__(self, *, max_queue: int = 16) -> None:
+        self.max_queue = max_queue
+        self._subscribers: dict[Hashable, set[Subscription]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def subscribe(self, topic: Hashable) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self, topic, self.max_queue)
+        self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.topic]
+
+    def has_subscribers(self, topic: Hashable) -> bool:
+        return topic in self._subscribers
+
+    def subscriber_count(self, topic: Hashable | None = None) -> int:
+        if topic is not None:
+            return len(self._subscribers.get(topic, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, topic: Hashable, message: str) -> int:
+        subscribers = self._subscribers.get(topic, ())
+        for subscription in subscribers:
+            subscription.put(message)
+        return len(subscribers)
+
+    def publish_threadsafe(self, topic: Hashable, message: str) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self.has_subscribers(topic):
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.publish(topic, message)
+        else:
+            loop.call_soon_threadsafe(self.publish, topic, message)
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def sse_stream(
+    request: Request,
+    hub: Hub,
+    topic: Hashable,
+    *,
+    event: str,
+    heartbeat: float,
+    initial: Iterable[str] = (),
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events body relaying a hub topic until the client goes away.
+    """
+    with hub.subscribe(topic) as subscription:
+        for message in initial:
+            yield sse_event(event, message)
+        while not await request.is_disconnected():
+            try:
+                message = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": ping\n\n"
+                continue
+            yield sse_event(event, message)
+
+
+# Latest readings, by CoreIoT device id
+reading_hub = Hub()
+# New notifications, by user id
+notification_hub = Hub(max_queue=64)
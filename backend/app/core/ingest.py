@@ -0,0 +1,492 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections.abc import Callable, Sequence
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+from sqlalchemy import Connection, text
+from sqlmodel import Session
+
+from app import crud
+from app.core.alarm_engine import alarm_engine
+from app.core.config import settings
+from app.core.coreiot import CoreIoTClient, coreiot_client
+from app.core.db import engine
+from app.core.forecast import update_after_commit
+from app.core.hub import reading_hub
+from app.core.notifications import enqueue_after_commit
+from app.core.pubsub import notification_listener, split_payloads
+from app.core.rollups import aggregate_arrays, to_epoch_ms, upsert_rollups
+from app.models import METRICS, CoreIoTData
+
+logger = logging.getLogger(__name__)
+
+# Only the process holding this advisory lock polls CoreIoT and persists
+# readings, so running several web workers multiplies neither the upstream
+# requests nor the rows written per poll.
+INGEST_LOCK_KEY = 0x636F7265  # "core"
+LEADER_CHECK_SECONDS = 5.0
+# The leader relays the readings it polls to the other workers' streams on
+# this backplane channel
+READING_CHANNEL = "reading_observed"
+TOKEN_REFRESH_SECONDS = 30.0
+DEVICE_REFRESH_SECONDS = 60.0
+MAX_CLOCK_SKEW_MS = 5 * 60 * 1000
+
+
+def reading_json(reading: CoreIoTData) -> str:
+    return reading.model_dump_json(include={"timestamp", *METRICS})
+
+
+def parse_bulk_readings(
+    body: bytes, *, ndjson: bool, max_readings: int
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """
+    Parse and validate a JSON array (or NDJSON stream) of readings into
+    epoch-millisecond timestamps and one float array per metric. Each reading
+    carries `ts` in epoch milliseconds, as CoreIoT reports it, or an ISO 8601
+    `timestamp`. Raises ValueError describing the first invalid reading.
+    """
+    if ndjson:
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        items = json.loads(body)
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of readings")
+    if len(items) > max_readings:
+        raise ValueError(f"At most {max_readings} readings are accepted per request")
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"Reading {i} is not an object")
+
+    values = {}
+    for metric in METRICS:
+        try:
+            column = np.array([item.get(metric) for item in items], dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError(f"{metric} must be numeric")
+        bad = np.flatnonzero(~np.isfinite(column))
+        if len(bad):
+            raise ValueError(f"Reading {bad[0]} has a missing or invalid {metric}")
+        values[metric] = column
+    bad = np.flatnonzero((values["humidity"] < 0) | (values["humidity"] > 100))
+    if len(bad):
+        raise ValueError(f"Reading {bad[0]} has humidity outside 0-100")
+    bad = np.flatnonzero(values["light"] < 0)
+    if len(bad):
+        raise ValueError(f"Reading {bad[0]} has negative light")
+
+    try:
+        ts = np.array(
+            [
+                item["ts"]
+                if "ts" in item
+                else to_epoch_ms(datetime.fromisoformat(item["timestamp"]))
+                for item in items
+            ],
+            dtype=float,
+        )
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Every reading needs a numeric ts or an ISO 8601 timestamp")
+    now_ms = to_epoch_ms(datetime.now(timezone.utc))
+    bad = np.flatnonzero(
+        ~np.isfinite(ts) | (ts <= 0) | (ts > now_ms + MAX_CLOCK_SKEW_MS)
+    )
+    if len(bad):
+        raise ValueError(f"Reading {bad[0]} has a timestamp out of range")
+    return ts.astype(np.int64), values
+
+
+def evaluate_alarms(
+    session: Session,
+    device_id: uuid.UUID,
+    ts_ms: np.ndarray,
+    values: dict[str, np.ndarray],
+) -> None:
+    notifications = alarm_engine.evaluate(session, device_id, ts_ms, values)
+    for note in notifications:
+        logger.warning(f"[ALARM NOTIFICATION] User {note.user_id}: {note.message}")
+    enqueue_after_commit(session, notifications)
+
+
+def store_reading_arrays(
+    session: Session,
+    device_id: uuid.UUID,
+    ts_ms: np.ndarray,
+    values: dict[str, np.ndarray],
+    *,
+    alarms_on_latest_only: bool = False,
+) -> int:
+    """
+    Insert readings of one device, skipping ones already stored, fold the new
+    ones into the rollups and forecasts and evaluate the alarms of the users
+    linked to the device against them. Backfills pass `alarms_on_latest_only` so historic
+    readings do not raise notifications. The caller owns the transaction.
+    """
+    rows = zip(
+        ts_ms.tolist(), *(values[metric].tolist() for metric in METRICS), strict=True
+    )
+    inserted = crud.bulk_insert_readings(session, device_id=device_id, rows=rows)
+    if not inserted:
+        return 0
+    columns = np.array(inserted, dtype=float)
+    inserted_ts = columns[:, 0].astype(np.int64)
+    inserted_values = {metric: columns[:, i + 1] for i, metric in enumerate(METRICS)}
+    upsert_rollups(session, aggregate_arrays(device_id, inserted_ts, inserted_values))
+    update_after_commit(session, device_id, inserted_ts, inserted_values)
+    if alarms_on_latest_only:
+        latest = [int(np.argmax(inserted_ts))]
+        inserted_ts = inserted_ts[latest]
+        inserted_values = {
+            metric: series[latest] for metric, series in inserted_values.items()
+        }
+    evaluate_alarms(session, device_id, inserted_ts, inserted_values)
+    return len(inserted)
+
+
+def store_readings(session: Session, readings: Sequence[CoreIoTData]) -> int:
+    by_device: dict[uuid.UUID, list[CoreIoTData]] = {}
+    for reading in readings:
+        if reading.device_id is not None:
+            by_device.setdefault(reading.device_id, []).append(reading)
+    stored = 0
+    for device_id, device_readings in by_device.items():
+        ts_ms = np.array([to_epoch_ms(r.timestamp) for r in device_readings])
+        values = {
+            metric: np.array([getattr(r, metric) for r in device_readings], dtype=float)
+            for metric in METRICS
+        }
+        stored += store_reading_arrays(session, device_id, ts_ms, values)
+    return stored
+
+
+class CoreIoTIngestor:
+    """
+    Polls CoreIoT telemetry for every device on a fixed schedule, keeps the
+    latest reading per device in memory and writes readings to the database
+    in batches, evaluating alarms once per batch. With a `device_provider`
+    the polled devices follow the device registry.
+
+    Of the processes running it, only the one holding the ingest advisory
+    lock polls and writes; the others keep trying to take the lock over.
+    With `relay` the leader NOTIFYs every new reading on READING_CHANNEL
+    and the others serve it from `relayed`, so their streams and latest
+    readings cost no upstream requests either. Without it only the leader
+    has live readings.
+    """
+
+    def __init__(
+        self,
+        *,
+        client: CoreIoTClient,
+        device_ids: list[str],
+        poll_interval: float,
+        batch_size: int,
+        flush_interval: float,
+        access_token: str | None = None,
+        token_provider: Callable[[], dict[str, tuple[uuid.UUID, str]]] | None = None,
+        device_provider: Callable[[], list[str]] | None = None,
+        relay: bool = False,
+        db_engine: Any = None,
+    ) -> None:
+        self.client = client
+        self.device_ids = device_ids
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.access_token = access_token
+        self.token_provider = token_provider
+        self.device_provider = device_provider
+        self.relay = relay
+        self.engine = db_engine if db_engine is not None else engine
+        self.latest: dict[str, CoreIoTData] = {}
+        self._buffer: list[CoreIoTData] = []
+        self._last_ts: dict[str, datetime] = {}
+        # Tokens by user, and the user whose token polls each device
+        self._tokens: dict[uuid.UUID, str] = {}
+        self._device_users: dict[str, uuid.UUID] = {}
+        self._tokens_task: asyncio.Task[None] | None = None
+        self._tokens_loaded_at = 0.0
+        self._tasks: list[asyncio.Task[None]] = []
+        self._pollers: dict[str, asyncio.Task[None]] = {}
+        self._relay_lines: list[str] = []
+        self._relay_ready: asyncio.Event | None = None
+        self._flush_lock: asyncio.Lock | None = None
+        # Holds the advisory lock for as long as this process leads
+        self._lock_conn: Connection | None = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def leading(self) -> bool:
+        return self._lock_conn is not None
+
+    def polls(self, device_id: str) -> bool:
+        """
+        Whether this process gets live readings of the device, by polling
+        it or from the leader's relay.
+        """
+        if self.relay and self.running:
+            return device_id in self.device_ids
+        return device_id in self._pollers
+
+    def get_latest(self, device_id: str) -> CoreIoTData | None:
+        return self.latest.get(device_id)
+
+    def observe(self, device_id: str, reading: CoreIoTData) -> bool:
+        """
+        Record a reading in the cache and push it to stream subscribers,
+        queueing it for persistence if new.
+        """
+        reading.device_id = uuid.UUID(device_id)
+        last_ts = self._last_ts.get(device_id)
+        if last_ts is not None and reading.timestamp <= last_ts:
+            return False
+        self._last_ts[device_id] = reading.timestamp
+        self.latest[device_id] = reading
+        if reading_hub.has_subscribers(device_id):
+            reading_hub.publish(device_id, reading_json(reading))
+        if self.leading:
+            self._buffer.append(reading)
+            if self._relay_ready is not None:
+                self._relay_lines.append(f"{device_id} {reading_json(reading)}")
+                self._relay_ready.set()
+        return True
+
+    def relayed(self, payload: str) -> None:
+        """
+        Observe the "<device id> <reading json>" lines the leader relayed,
+        its own included, which are no longer new to it.
+        """
+        for line in payload.splitlines():
+            device_id, message = line.split(" ", 1)
+            # Table models only validate through model_validate
+            self.observe(device_id, CoreIoTData.model_validate(json.loads(message)))
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._flush_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._leader_loop()),
+            loop.create_task(self._flush_loop()),
+        ]
+        if self.device_provider is not None:
+            self._tasks.append(loop.create_task(self._devices_loop()))
+        if self.relay:
+            self._relay_ready = asyncio.Event()
+            self._tasks.append(loop.create_task(self._relay_loop()))
+
+    async def stop(self) -> None:
+        tasks = self._tasks + list(self._pollers.values())
+        self._tasks, self._pollers = [], {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._buffer:
+            await self._flush(self._buffer)
+            self._buffer = []
+        await asyncio.to_thread(self._release_leadership)
+        self._relay_ready, self._relay_lines = None, []
+
+    async def poll_device(self, device_id: str) -> CoreIoTData | None:
+        token = await self._get_token(device_id)
+        if not token:
+            return None
+        reading = await self.client.get_latest_reading(device_id, access_token=token)
+        if not self.observe(device_id, reading):
+            return None
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        return reading
+
+    async def flush(self) -> int:
+        if self._flush_lock is None:
+            return 0
+        async with self._flush_lock:
+            batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            return await self._flush(batch)
+
+    async def _flush(self, batch: list[CoreIoTData]) -> int:
+        try:
+            return await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"Failed to persist {len(batch)} CoreIoT readings: {e}")
+            return 0
+
+    async def _poll_loop(self, device_id: str) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                await self.poll_device(device_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"CoreIoT poll failed for device {device_id}: {e}")
+            elapsed = loop.time() - started
+            await asyncio.sleep(max(self.poll_interval - elapsed, 0))
+
+    def _poll(self, device_ids: list[str]) -> None:
+        self.device_ids = list(device_ids)
+        if not self.leading:
+            device_ids = []
+        loop = asyncio.get_running_loop()
+        for device_id in self._pollers.keys() - set(device_ids):
+            self._pollers.pop(device_id).cancel()
+        for device_id in device_ids:
+            if device_id not in self._pollers:
+                self._pollers[device_id] = loop.create_task(self._poll_loop(device_id))
+
+    async def _leader_loop(self) -> None:
+        while True:
+            was_leading = self.leading
+            try:
+                await asyncio.to_thread(self._check_leadership)
+            except Exception as e:
+                logger.warning(f"Could not check the CoreIoT ingest lock: {e}")
+            if self.leading and not was_leading:
+                logger.info(f"Leading CoreIoT ingestion for devices {self.device_ids}")
+            elif was_leading and not self.leading:
+                logger.warning("Lost the CoreIoT ingest lock, stopped polling")
+            self._poll(self.device_ids)
+            await asyncio.sleep(LEADER_CHECK_SECONDS)
+
+    async def _devices_loop(self) -> None:
+        assert self.device_provider is not None
+        while True:
+            try:
+                device_ids = await asyncio.to_thread(self.device_provider)
+            except Exception as e:
+                logger.warning(f"Could not load the CoreIoT devices: {e}")
+            else:
+                if set(device_ids) != set(self.device_ids):
+                    logger.info(f"Polling CoreIoT devices {device_ids}")
+                self._poll(device_ids)
+            await asyncio.sleep(DEVICE_REFRESH_SECONDS)
+
+    async def _relay_loop(self) -> None:
+        assert self._relay_ready is not None
+        while True:
+            await self._relay_ready.wait()
+            self._relay_ready.clear()
+            lines, self._relay_lines = self._relay_lines, []
+            try:
+                await asyncio.to_thread(self._notify, lines)
+            except Exception as e:
+                logger.warning(f"Could not relay {len(lines)} CoreIoT readings: {e}")
+
+    def _notify(self, lines: list[str]) -> None:
+        with self.engine.begin() as conn:
+            for payload in split_payloads(lines):
+                conn.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": READING_CHANNEL, "payload": payload},
+                )
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _get_token(self, device_id: str) -> str | None:
+        if self.access_token or self.token_provider is None:
+            return self.access_token
+        loop = asyncio.get_running_loop()
+        if (
+            self._tokens_task is None
+            or loop.time() - self._tokens_loaded_at >= TOKEN_REFRESH_SECONDS
+        ):
+            # One load for all the pollers asking at the same time
+            self._tokens_loaded_at = loop.time()
+            self._tokens_task = loop.create_task(self._load_tokens())
+        # Shielded, a poller being cancelled must not cancel the others' load
+        await asyncio.shield(self._tokens_task)
+        user_id = self._device_users.get(device_id)
+        return None if user_id is None else self._tokens.get(user_id)
+
+    async def _load_tokens(self) -> None:
+        assert self.token_provider is not None
+        try:
+            owners = await asyncio.to_thread(self.token_provider)
+        except Exception as e:
+            logger.warning(f"Could not load the CoreIoT access tokens: {e}")
+            return
+        self._device_users = {
+            device_id: user_id for device_id, (user_id, _) in owners.items()
+        }
+        self._tokens = dict(owners.values())
+
+    def _check_leadership(self) -> None:
+        """
+        Take the ingest lock if it is free, or check that the connection
+        holding it is still alive. The session-level lock is taken once and
+        kept on its own connection, which is dropped if it fails.
+        """
+        conn = self._lock_conn
+        try:
+            if conn is not None:
+                conn.execute(text("SELECT 1"))
+                conn.commit()
+                return
+            conn = self.engine.connect()
+            acquired = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": INGEST_LOCK_KEY}
+            ).scalar()
+            conn.commit()
+        except Exception:
+            self._lock_conn = None
+            if conn is not None:
+                conn.invalidate()
+            raise
+        if acquired:
+            self._lock_conn = conn
+        else:
+            conn.close()
+
+    def _release_leadership(self) -> None:
+        conn, self._lock_conn = self._lock_conn, None
+        if conn is not None:
+            # Closing the DBAPI connection ends the session and its lock, a
+            # connection returned to the pool would keep holding it
+            conn.invalidate()
+
+    def _write_batch(self, batch: list[CoreIoTData]) -> int:
+        if not self.leading:
+            return 0
+        with Session(self.engine) as session:
+            stored = store_readings(session, batch)
+            session.commit()
+        return stored
+
+
+def _default_token_provider() -> dict[str, tuple[uuid.UUID, str]]:
+    with Session(engine) as session:
+        return crud.get_device_token_owners(session)
+
+
+def _default_device_provider() -> list[str]:
+    with Session(engine) as session:
+        return crud.get_device_ids(session)
+
+
+ingestor = CoreIoTIngestor(
+    client=coreiot_client,
+    device_ids=list(settings.COREIOT_DEVICE_IDS),
+    poll_interval=settings.COREIOT_POLL_INTERVAL_SECONDS,
+    batch_size=settings.COREIOT_INGEST_BATCH_SIZE,
+    flush_interval=settings.COREIOT_INGEST_FLUSH_SECONDS,
+    access_token=settings.COREIOT_ACCESS_TOKEN,
+    token_provider=_default_token_provider,
+    device_provider=_default_device_provider,
+    relay=settings.NOTIFICATION_BACKPLANE_ENABLED,
+)
+notification_listener.on(READING_CHANNEL, ingestor.relayed)
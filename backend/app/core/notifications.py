@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import threading
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import NotificationCreate
+
+logger = logging.getLogger(__name__)
+
+_SESSION_KEY = "pending_notifications"
+RETENTION_LOCK_KEY = 0x72657465  # "rete"
+
+
+class NotificationQueue:
+    """
+    Write-behind queue for notifications raised by alarm evaluation. They
+    are written in batches with one INSERT per flush, every `flush_interval`
+    seconds or as soon as `batch_size` are waiting. Without the background
+    flusher running (scripts, tests) every `put` is written right away.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int,
+        flush_interval: float,
+        max_pending: int,
+        db_engine: Any = None,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.engine = db_engine if db_engine is not None else engine
+        self._pending: list[NotificationCreate] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, notifications: Sequence[NotificationCreate]) -> None:
+        if not notifications:
+            return
+        with self._lock:
+            self._pending.extend(notifications)
+            full = len(self._pending) >= self.batch_size
+        if full or not self.running:
+            self.flush()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                with Session(self.engine) as session:
+                    crud.create_notifications(session=session, notifications=batch)
+                    session.commit()
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} notifications: {e}")
+                with self._lock:
+                    # Retry with the next flush, dropping the oldest if the
+                    # database stays unavailable
+                    self._pending[:0] = batch
+                    dropped = len(self._pending) - self.max_pending
+                    if dropped > 0:
+                        del self._pending[:dropped]
+                        logger.error(f"Dropped {dropped} notifications")
+                return 0
+            return len(batch)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await asyncio.to_thread(self.flush)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+
+class RetentionJob:
+    """
+    Periodically prunes, or archives, notifications older than
+    `retention_days` in batches of `batch_size`, one transaction each, so
+    no long lock or huge transaction is held. Every worker runs the job but
+    a batch only proceeds while its process holds the transaction-level
+    advisory lock, so they do not compete for the same rows.
+    """
+
+    def __init__(
+        self,
+        *,
+        retention_days: int,
+        batch_size: int,
+        interval: float,
+        archive: bool,
+        db_engine: Any = None,
+    ) -> None:
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.archive = archive
+        self.engine = db_engine if db_engine is not None else engine
+        self._task: asyncio.Task[None] | None = None
+
+    def run_once(self, now: datetime | None = None) -> int:
+        before = (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+        removed = 0
+        while True:
+            with Session(self.engine) as session:
+                locked = session.execute(
+                    text("SELECT pg_try_advisory_xact_lock(:key)"),
+                    {"key": RETENTION_LOCK_KEY},
+                ).scalar()
+                if not locked:
+                    break
+                batch = crud.prune_notifications(
+                    session,
+                    before=before,
+                    batch_size=self.batch_size,
+                    archive=self.archive,
+                )
+                session.commit()
+            removed += batch
+            if batch < self.batch_size:
+                break
+        if removed:
+            action = "Archived" if self.archive else "Deleted"
+            logger.info(f"{action} {removed} notifications older than {before}")
+        return removed
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"Notification retention failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+def enqueue_after_commit(
+    session: Session, notifications: Sequence[NotificationCreate]
+) -> None:
+    """
+    Queue notifications once the session's transaction commits, so rolled
+    back alarm state changes do not notify.
+    """
+    session.info.setdefault(_SESSION_KEY, []).extend(notifications)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session: OrmSession) -> None:
+    notifications = session.info.pop(_SESSION_KEY, None)
+    if notifications:
+        notification_queue.put(notifications)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _after_rollback(session: OrmSession) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+notification_queue = NotificationQueue(
+    batch_size=settings.NOTIFICATION_BATCH_SIZE,
+    flush_interval=settings.NOTIFICATION_FLUSH_SECONDS,
+    max_pending=settings.NOTIFICATION_MAX_PENDING,
+)
+
+retention_job = (
+    RetentionJob(
+        retention_days=settings.NOTIFICATION_RETENTION_DAYS,
+        batch_size=settings.NOTIFICATION_RETENTION_BATCH_SIZE,
+        interval=settings.NOTIFICATION_RETENTION_INTERVAL_SECONDS,
+        archive=settings.NOTIFICATION_ARCHIVE_ENABLED,
+    )
+    if settings.NOTIFICATION_RETENTION_DAYS is not None
+    else None
+)
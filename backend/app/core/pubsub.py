@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import uuid
+from collections.abc import Callable, Iterator, Sequence
+from typing import Any
+
+import psycopg
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+
+from app.core.cache import USER_CHANNEL, user_cache
+from app.core.config import settings
+from app.core.hub import Hub, notification_hub
+from app.models import NotificationPublic
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "notification_created"
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD_BYTES = 7900
+RECONNECT_SECONDS = 2.0
+
+_SESSION_KEY = "published_notifications"
+
+
+def split_payloads(lines: list[str]) -> Iterator[str]:
+    chunk: list[str] = []
+    size = 0
+    for line in lines:
+        line_size = len(line.encode()) + 1
+        if chunk and size + line_size > MAX_PAYLOAD_BYTES:
+            yield "\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += line_size
+    if chunk:
+        yield "\n".join(chunk)
+
+
+def deliver(payload: str, hub: Hub = notification_hub) -> None:
+    """
+    Hand "<user id> <notification json>" lines to the local subscribers.
+    """
+    for line in payload.splitlines():
+        user_id, message = line.split(" ", 1)
+        hub.publish_threadsafe(user_id, message)
+
+
+def publish_notifications(session: Session, notifications: Sequence[Any]) -> None:
+    """
+    Push new notifications to their users' open streams once the session
+    commits, and not at all if it rolls back.
+
+    With the backplane enabled this is a NOTIFY in the same transaction,
+    which Postgres delivers to the listener of every worker process on
+    commit. Otherwise only this process's subscribers are reached.
+    """
+    lines = []
+    for notification in notifications:
+        public = NotificationPublic.model_validate(notification)
+        lines.append(f"{public.user_id} {public.model_dump_json()}")
+    if not lines:
+        return
+    if settings.NOTIFICATION_BACKPLANE_ENABLED:
+        for payload in split_payloads(lines):
+            session.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": payload},
+            )
+    else:
+        session.info.setdefault(_SESSION_KEY, []).extend(lines)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session: OrmSession) -> None:
+    lines = session.info.pop(_SESSION_KEY, None)
+    if lines:
+        deliver("\n".join(lines))
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _after_rollback(session: OrmSession) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+class NotificationListener:
+    """
+    LISTENs on the backplane channel and relays what other workers (and
+    this one) publish to the local hub. Also drops the users other workers
+    changed from the local user cache, and hands the payloads of the
+    channels registered with `on` to their handlers. Notifications sent
+    while the connection is down are not replayed; clients catch up through
+    the since-cursor feed.
+    """
+
+    def __init__(self, conninfo: str, hub: Hub = notification_hub) -> None:
+        self.conninfo = conninfo
+        self.hub = hub
+        self._handlers: dict[str, Callable[[str], None]] = {}
+        self._task: asyncio.Task[None] | None = None
+
+    def on(self, channel: str, handler: Callable[[str], None]) -> None:
+        """
+        Call `handler` on the event loop with every payload sent to
+        `channel`. Register before starting.
+        """
+        self._handlers[channel] = handler
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    self.conninfo, autocommit=True
+                ) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    await conn.execute(f"LISTEN {USER_CHANNEL}")
+                    for channel in self._handlers:
+                        await conn.execute(f"LISTEN {channel}")
+                    # Changes made while disconnected were missed
+                    user_cache.clear()
+                    logger.info(f"Listening for notifications on {CHANNEL}")
+                    async for notify in conn.notifies():
+                        if notify.channel == USER_CHANNEL:
+                            user_cache.invalidate(
+                                *map(uuid.UUID, notify.payload.splitlines())
+                            )
+                        elif notify.channel in self._handlers:
+                            self._handlers[notify.channel](notify.payload)
+                        else:
+                            deliver(notify.payload, self.hub)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Notification backplane connection lost: {e}")
+                await asyncio.sleep(RECONNECT_SECONDS)
+
+
+notification_listener = NotificationListener(
+    str(settings.SQLALCHEMY_DATABASE_URI).replace("postgresql+psycopg", "postgresql", 1)
+)
@@ -0,0 +1,226 @@
+import uuid
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import numpy as np
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, select
+
+from app.models import METRICS, CoreIoTData, CoreIoTReading, CoreIoTRollup
+
+# Ordered finest first, the keys are the public `resolution` values
+RESOLUTIONS: dict[str, timedelta] = {
+    "1m": timedelta(minutes=1),
+    "15m": timedelta(minutes=15),
+    "1h": timedelta(hours=1),
+}
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Seventeen bind parameters per row, below the 65535 Postgres accepts
+ROLLUP_UPSERT_CHUNK = 3000
+
+
+def to_epoch_ms(timestamp: datetime) -> int:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return (timestamp - EPOCH) // timedelta(milliseconds=1)
+
+
+def from_epoch_ms(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+def to_naive_utc(timestamp: datetime) -> datetime:
+    """
+    The naive UTC datetime the timestamp columns store, naive timestamps
+    being taken as UTC already.
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def bucket_start(timestamp: datetime, width: timedelta) -> datetime:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp - (timestamp - EPOCH) % width
+
+
+def aggregate_arrays(
+    device_id: uuid.UUID, ts_ms: np.ndarray, values: dict[str, np.ndarray]
+) -> list[dict[str, Any]]:
+    """
+    Fold readings of one device, given as parallel arrays of epoch
+    milliseconds and metric values, into one partial rollup row per
+    (resolution, bucket).
+    """
+    if not len(ts_ms):
+        return []
+    order = np.argsort(ts_ms, kind="stable")
+    ts_ms = np.asarray(ts_ms, dtype=np.int64)[order]
+    values = {
+        metric: np.asarray(values[metric], dtype=float)[order] for metric in METRICS
+    }
+    rows = []
+    for resolution, width in RESOLUTIONS.items():
+        width_ms = width // timedelta(milliseconds=1)
+        buckets = ts_ms // width_ms
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)]
+        columns: dict[str, Any] = {
+            "bucket": buckets[starts] * width_ms,
+            "count": ends - starts,
+            "last_timestamp": ts_ms[ends - 1],
+        }
+        for metric, series in values.items():
+            columns[f"{metric}_min"] = np.minimum.reduceat(series, starts)
+            columns[f"{metric}_max"] = np.maximum.reduceat(series, starts)
+            columns[f"{metric}_sum"] = np.add.reduceat(series, starts)
+            columns[f"{metric}_last"] = series[ends - 1]
+        for i in range(len(starts)):
+            row = {name: column[i].item() for name, column in columns.items()}
+            row["bucket"] = to_naive_utc(from_epoch_ms(row["bucket"]))
+            row["last_timestamp"] = to_naive_utc(from_epoch_ms(row["last_timestamp"]))
+            row["resolution"] = resolution
+            row["device_id"] = device_id
+            rows.append(row)
+    return rows
+
+
+def aggregate(readings: Sequence[CoreIoTData]) -> list[dict[str, Any]]:
+    by_device: dict[uuid.UUID, list[CoreIoTData]] = {}
+    for reading in readings:
+        if reading.device_id is not None:
+            by_device.setdefault(reading.device_id, []).append(reading)
+    rows = []
+    for device_id, device_readings in by_device.items():
+        ts_ms = np.array([to_epoch_ms(r.timestamp) for r in device_readings])
+        values = {
+            metric: np.array([getattr(r, metric) for r in device_readings])
+            for metric in METRICS
+        }
+        rows += aggregate_arrays(device_id, ts_ms, values)
+    return rows
+
+
+def apply_rollups(session: Session, readings: Sequence[CoreIoTData]) -> None:
+    """
+    Merge a batch of readings into the rollup table with a single upsert.
+    The caller owns the transaction.
+    """
+    upsert_rollups(session, aggregate(readings))
+
+
+def upsert_rollups(session: Session, rows: list[dict[str, Any]]) -> None:
+    """
+    Merge partial rollup rows into the table, with one upsert per
+    `ROLLUP_UPSERT_CHUNK` rows.
+    """
+    for start in range(0, len(rows), ROLLUP_UPSERT_CHUNK):
+        _upsert_rollup_chunk(session, rows[start : start + ROLLUP_UPSERT_CHUNK])
+
+
+def _upsert_rollup_chunk(session: Session, rows: list[dict[str, Any]]) -> None:
+    table = CoreIoTRollup.__table__  # type: ignore[attr-defined]
+    statement = insert(table).values(rows)
+    excluded = statement.excluded
+    is_newer = excluded.last_timestamp >= table.c.last_timestamp
+    updates: dict[str, Any] = {
+        "count": table.c.count + excluded.count,
+        "last_timestamp": func.greatest(
+            table.c.last_timestamp, excluded.last_timestamp
+        ),
+    }
+    for metric in METRICS:
+        updates[f"{metric}_min"] = func.least(
+            table.c[f"{metric}_min"], excluded[f"{metric}_min"]
+        )
+        updates[f"{metric}_max"] = func.greatest(
+            table.c[f"{metric}_max"], excluded[f"{metric}_max"]
+        )
+        updates[f"{metric}_sum"] = table.c[f"{metric}_sum"] + excluded[f"{metric}_sum"]
+        updates[f"{metric}_last"] = case(
+            (is_newer, excluded[f"{metric}_last"]), else_=table.c[f"{metric}_last"]
+        )
+    statement = statement.on_conflict_do_update(
+        index_elements=["resolution", "device_id", "bucket"], set_=updates
+    )
+    session.execute(statement)
+
+
+def choose_resolution(span: timedelta, max_points: int) -> str:
+    """
+    Finest rollup that fits the window in `max_points` buckets, or the
+    coarsest one if none does.
+    """
+    for resolution, width in RESOLUTIONS.items():
+        if span / width <= max_points:
+            return resolution
+    return list(RESOLUTIONS)[-1]
+
+
+def get_rollup_points(
+    session: Session,
+    *,
+    device_id: uuid.UUID,
+    resolution: str,
+    start: datetime,
+    end: datetime,
+) -> list[CoreIoTReading]:
+    statement = (
+        select(CoreIoTRollup)
+        .where(CoreIoTRollup.resolution == resolution)
+        .where(CoreIoTRollup.device_id == device_id)
+        .where(
+            CoreIoTRollup.bucket
+            >= to_naive_utc(bucket_start(start, RESOLUTIONS[resolution]))
+        )
+        .where(CoreIoTRollup.bucket <= to_naive_utc(end))
+        .order_by(col(CoreIoTRollup.bucket).asc())
+    )
+    return [
+        CoreIoTReading(
+            timestamp=rollup.bucket,
+            temperature=rollup.temperature_sum / rollup.count,
+            humidity=rollup.humidity_sum / rollup.count,
+            light=rollup.light_sum / rollup.count,
+        )
+        for rollup in session.exec(statement)
+    ]
+
+
+def lttb_indices(values: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points that keep
+    the visual shape of the series (x is taken as the sample index).
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float)
+    y = np.asarray(values, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean() if next_hi > hi else x[-1]
+        avg_y = y[hi:next_hi].mean() if next_hi > hi else y[-1]
+        areas = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(
+    points: list[CoreIoTReading], metric: str, max_points: int
+) -> list[CoreIoTReading]:
+    if len(points) <= max_points:
+        return points
+    values = np.fromiter((getattr(p, metric) for p in points), dtype=float)
+    return [points[i] for i in lttb_indices(values, max_points)]
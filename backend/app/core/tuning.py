@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any
+
+import numpy as np
+from sqlalchemy import text, update
+from sqlmodel import Session, col, or_, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import ForecastState
+
+logger = logging.getLogger(__name__)
+
+ALPHAS = np.round(np.arange(0.05, 1.0, 0.05), 2)
+BETAS = np.array([0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5])
+# Fewer readings than this do not say much about the best parameters
+MIN_READINGS = 50
+# One-step errors left out of the fit while the trend settles
+BURN_IN = 10
+
+LOCK_SQL = text("SELECT pg_try_advisory_xact_lock(hashtextextended(:name, 0))")
+
+
+def fit_parameters(series: np.ndarray) -> tuple[float, float] | None:
+    """
+    The (alpha, beta) of the grid whose Holt smoothing of the readings has
+    the least squared one-step-ahead error, every grid point being smoothed
+    at once. None when there are too few readings.
+    """
+    if len(series) < MIN_READINGS:
+        return None
+    alpha, beta = (grid.ravel() for grid in np.meshgrid(ALPHAS, BETAS))
+    level = np.full(alpha.shape, float(series[0]))
+    trend = np.zeros_like(level)
+    sse = np.zeros_like(level)
+    for i, value in enumerate(series[1:].tolist(), start=1):
+        error = value - (level + trend)
+        if i > BURN_IN:
+            sse += error * error
+        previous = level
+        level = alpha * value + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous) + (1 - beta) * trend
+    best = int(np.argmin(sse))
+    return float(alpha[best]), float(beta[best])
+
+
+class ForecastTuner:
+    """
+    Tunes the smoothing parameters of every (device, metric) forecast once
+    per `interval`, by grid search over its latest `window` readings.
+
+    The fits are CPU bound and run in a pool of `max_workers` processes so
+    they never hold an API worker's GIL, at most `max_workers` at a time.
+    A forecast is queued at most once, and a transaction-scoped advisory
+    lock plus the persisted `tuned_at` make sure only one of the web
+    workers tunes it per interval. Forecasters pick up the new parameters
+    when they see the persisted state's version change.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float,
+        window: int,
+        max_workers: int,
+        max_queue: int,
+        db_engine: Any = None,
+    ) -> None:
+        self.interval = interval
+        self.window = window
+        self.max_workers = max_workers
+        self.engine = db_engine if db_engine is not None else engine
+        self._queue: asyncio.Queue[tuple[uuid.UUID, str]] = asyncio.Queue(max_queue)
+        self._queued: set[tuple[uuid.UUID, str]] = set()
+        self._pool: ProcessPoolExecutor | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+
+    def submit(self, device_id: uuid.UUID, metric: str) -> bool:
+        """
+        Queue a forecast for tuning, unless it already is or the queue is
+        full.
+        """
+        key = (device_id, metric)
+        if key in self._queued or self._queue.full():
+            return False
+        self._queued.add(key)
+        self._queue.put_nowait(key)
+        return True
+
+    def tune(self, device_id: uuid.UUID, metric: str) -> tuple[float, float] | None:
+        """
+        Fit and store the parameters of a forecast, returning them, unless
+        another process is tuning it or it was tuned within the interval.
+
+        The forecast is claimed by setting its `tuned_at` under the advisory
+        lock in a short transaction, so the fit runs with no transaction or
+        lock held, and the parameters are then stored only if the claim was
+        not taken over meanwhile.
+        """
+        with Session(self.engine) as session:
+            if not session.execute(
+                LOCK_SQL, {"name": f"forecast:{device_id}:{metric}"}
+            ).scalar():
+                return None
+            state = session.get(ForecastState, (device_id, metric))
+            claimed_at = datetime.utcnow()
+            if state is None or (
+                state.tuned_at is not None
+                and claimed_at - state.tuned_at < timedelta(seconds=self.interval)
+            ):
+                return None
+            readings = crud.get_latest_readings(
+                session, device_id=device_id, limit=self.window
+            )
+            series = np.array([getattr(r, metric) for r in readings], dtype=float)
+            state.tuned_at = claimed_at
+            session.add(state)
+            session.commit()
+
+        if self._pool is not None:
+            params = self._pool.submit(fit_parameters, series).result()
+        else:
+            params = fit_parameters(series)
+        if params is None:
+            return None
+
+        alpha, beta = params
+        with Session(self.engine) as session:
+            stored = session.execute(
+                update(ForecastState)
+                .where(col(ForecastState.device_id) == device_id)
+                .where(col(ForecastState.metric) == metric)
+                .where(col(ForecastState.tuned_at) == claimed_at)
+                .values(alpha=alpha, beta=beta, updated_at=datetime.utcnow())
+            ).rowcount
+            session.commit()
+        if not stored:
+            return None
+        logger.info(f"Tuned the {metric} forecast of device {device_id} to {params}")
+        return params
+
+    def _due(self) -> list[tuple[uuid.UUID, str]]:
+        tuned_before = datetime.utcnow() - timedelta(seconds=self.interval)
+        with Session(self.engine) as session:
+            rows = session.exec(
+                select(ForecastState.device_id, ForecastState.metric)
+                .where(
+                    or_(
+                        col(ForecastState.tuned_at).is_(None),
+                        col(ForecastState.tuned_at) < tuned_before,
+                    )
+                )
+                .limit(self._queue.maxsize)
+            ).all()
+        return list(rows)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        # Spawned rather than forked, the web worker has threads and open
+        # connections a fork would copy
+        self._pool = ProcessPoolExecutor(
+            self.max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._schedule_loop())] + [
+            loop.create_task(self._worker()) for _ in range(self.max_workers)
+        ]
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _schedule_loop(self) -> None:
+        while True:
+            try:
+                for device_id, metric in await asyncio.to_thread(self._due):
+                    self.submit(device_id, metric)
+            except Exception as e:
+                logger.error(f"Failed to schedule forecast tuning: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                await asyncio.to_thread(self.tune, *key)
+            except Exception as e:
+                logger.error(f"Failed to tune the forecast {key}: {e}")
+            finally:
+                self._queued.discard(key)
+
+
+forecast_tuner = ForecastTuner(
+    interval=settings.FORECAST_TUNING_INTERVAL_SECONDS,
+    window=settings.FORECAST_TUNING_WINDOW,
+    max_workers=settings.FORECAST_TUNING_WORKERS,
+    max_queue=settings.FORECAST_TUNING_MAX_QUEUE,
+)
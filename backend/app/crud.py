@@ -1,28 +1,79 @@
+import asyncio
 import uuid
+from collections.abc import Iterable, Iterator, Sequence
+from datetime import datetime
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy import Row, String, cast, delete, func, insert, text, tuple_, update
+from sqlmodel import Session, col, select
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate, Alarm, AlarmCreate, AlarmUpdate, Notification, NotificationCreate
+from app.core.alarm_engine import alarm_engine
+from app.core.config import settings
+from app.core.pubsub import publish_notifications
+from app.core.security import (
+    get_password_hash,
+    password_hasher,
+    verify_and_update_password,
+)
+from app.models import (
+    Alarm,
+    AlarmCreate,
+    AlarmDeviceState,
+    AlarmUpdate,
+    CoreIoTData,
+    Device,
+    DeviceCreate,
+    DeviceUpdate,
+    Item,
+    ItemCreate,
+    Notification,
+    NotificationCreate,
+    User,
+    UserCreate,
+    UserDeviceLink,
+    UserUpdate,
+)
 
 
-def create_user(*, session: Session, user_create: UserCreate) -> User:
+def create_user(
+    *, session: Session, user_create: UserCreate, hashed_password: str | None = None
+) -> User:
+    """
+    Create a user, hashing their password unless the caller already did.
+    """
+    if hashed_password is None:
+        hashed_password = get_password_hash(user_create.password)
     db_obj = User.model_validate(
-        user_create, update={"hashed_password": get_password_hash(user_create.password)}
+        user_create, update={"hashed_password": hashed_password}
+    )
+    # New users see the shared devices, like every user did before devices
+    # were registered
+    default_ids = [uuid.UUID(device_id) for device_id in settings.COREIOT_DEVICE_IDS]
+    db_obj.devices = list(
+        session.exec(select(Device).where(col(Device.id).in_(default_ids)))
     )
     session.add(db_obj)
     session.commit()
     session.refresh(db_obj)
+    alarm_engine.invalidate()
     return db_obj
 
 
-def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
+def update_user(
+    *,
+    session: Session,
+    db_user: User,
+    user_in: UserUpdate,
+    hashed_password: str | None = None,
+) -> Any:
+    """
+    Update a user, hashing a new password unless the caller already did.
+    """
     user_data = user_in.model_dump(exclude_unset=True)
     extra_data = {}
     if "password" in user_data:
-        password = user_data["password"]
-        hashed_password = get_password_hash(password)
+        if hashed_password is None:
+            hashed_password = get_password_hash(user_data["password"])
         extra_data["hashed_password"] = hashed_password
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
@@ -39,13 +90,120 @@ def get_user_by_email(*, session: Session, email: str) -> User | None:
 
 def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
-    if not db_user:
+    verified, updated_hash = verify_and_update_password(
+        password, db_user.hashed_password if db_user else None
+    )
+    if not db_user or not verified:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    if updated_hash:
+        update_password_hash(session, db_user, updated_hash)
+    return db_user
+
+
+async def authenticate_async(
+    *, session: Session, email: str, password: str
+) -> User | None:
+    """
+    Like authenticate, checking the password in the password hasher's
+    processes. Raises PasswordHasherBusy when too many checks are pending.
+    """
+    db_user = await asyncio.to_thread(get_user_by_email, session=session, email=email)
+    verified, updated_hash = await password_hasher.verify_and_update(
+        password, db_user.hashed_password if db_user else None
+    )
+    if not db_user or not verified:
         return None
+    if updated_hash:
+        await asyncio.to_thread(update_password_hash, session, db_user, updated_hash)
     return db_user
 
 
+def update_password_hash(session: Session, db_user: User, hashed_password: str) -> None:
+    db_user.hashed_password = hashed_password
+    session.add(db_user)
+    session.commit()
+    session.refresh(db_user)
+
+
+# The planner's row count of a table as of its last VACUUM or ANALYZE, -1
+# when it was never analyzed
+ESTIMATE_COUNT_SQL = text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(quote_ident(:table))"
+)
+
+
+def estimate_count(session: Session, model: type[User] | type[Item]) -> int:
+    """
+    Estimated number of rows of a table, read from the statistics in
+    constant time instead of counting them. Exact for tables never analyzed.
+    """
+    estimate = session.execute(
+        ESTIMATE_COUNT_SQL, {"table": model.__tablename__}
+    ).scalar()
+    if estimate is None or estimate < 0:
+        return session.exec(select(func.count()).select_from(model)).one()
+    return int(estimate)
+
+
+def _keyset_page(
+    statement: Any,
+    model: type[User] | type[Item],
+    after: tuple[datetime, uuid.UUID] | None,
+    skip: int,
+    limit: int,
+) -> Any:
+    # Starts at the position in the (created_at, id) index, however deep,
+    # where an offset alone reads and drops every row before it
+    if after is not None:
+        statement = statement.where(col(model.created_at) >= after[0]).where(
+            tuple_(model.created_at, model.id) > tuple_(*after)
+        )
+    return (
+        statement.order_by(col(model.created_at).asc(), col(model.id).asc())
+        .offset(skip)
+        .limit(limit)
+    )
+
+
+def get_users_page(
+    session: Session,
+    *,
+    after: tuple[datetime, uuid.UUID] | None = None,
+    skip: int = 0,
+    limit: int,
+) -> Sequence[User]:
+    """
+    Users in the order they signed up, skipping `skip` of them after the
+    `after` position, or from the first one.
+    """
+    return session.exec(_keyset_page(select(User), User, after, skip, limit)).all()
+
+
+def get_items_page(
+    session: Session,
+    *,
+    owner_id: uuid.UUID | None = None,
+    after: tuple[datetime, uuid.UUID] | None = None,
+    skip: int = 0,
+    limit: int,
+) -> Sequence[Item]:
+    """
+    Items of `owner_id`, or of every user, in the order they were created,
+    paged like get_users_page.
+    """
+    statement = select(Item)
+    if owner_id is not None:
+        statement = statement.where(Item.owner_id == owner_id)
+    return session.exec(_keyset_page(statement, Item, after, skip, limit)).all()
+
+
+def count_items(session: Session, *, owner_id: uuid.UUID | None = None) -> int:
+    statement = select(func.count()).select_from(Item)
+    if owner_id is not None:
+        statement = statement.where(Item.owner_id == owner_id)
+    return session.exec(statement).one()
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
@@ -54,11 +212,226 @@ def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -
     return db_item
 
 
-def create_alarm(*, session: Session, alarm_create: AlarmCreate, user_id: uuid.UUID) -> Alarm:
+def create_device(
+    *, session: Session, device_in: DeviceCreate, user_id: uuid.UUID
+) -> Device:
+    """
+    Register a device and link it to a user, or only link it if another user
+    registered it already.
+    """
+    db_device = session.get(Device, device_in.id)
+    if db_device is None:
+        db_device = Device.model_validate(device_in)
+        session.add(db_device)
+    session.merge(UserDeviceLink(user_id=user_id, device_id=device_in.id))
+    session.commit()
+    session.refresh(db_device)
+    alarm_engine.invalidate()
+    return db_device
+
+
+def update_device(
+    *, session: Session, db_device: Device, device_in: DeviceUpdate
+) -> Device:
+    db_device.sqlmodel_update(device_in.model_dump(exclude_unset=True))
+    session.add(db_device)
+    session.commit()
+    session.refresh(db_device)
+    return db_device
+
+
+def get_user_device(
+    session: Session, *, user_id: uuid.UUID, device_id: uuid.UUID
+) -> Device | None:
+    statement = (
+        select(Device)
+        .join(UserDeviceLink)
+        .where(UserDeviceLink.user_id == user_id)
+        .where(UserDeviceLink.device_id == device_id)
+    )
+    return session.exec(statement).first()
+
+
+def get_default_device(session: Session, *, user_id: uuid.UUID) -> Device | None:
+    """
+    The device a user's requests go to when they do not name one: the
+    first one linked to them.
+    """
+    statement = (
+        select(Device)
+        .join(UserDeviceLink)
+        .where(UserDeviceLink.user_id == user_id)
+        .order_by(col(Device.created_at), col(Device.id))
+        .limit(1)
+    )
+    return session.exec(statement).first()
+
+
+def unlink_device(
+    session: Session, *, user_id: uuid.UUID, device_id: uuid.UUID
+) -> bool:
+    statement = (
+        delete(UserDeviceLink)
+        .where(col(UserDeviceLink.user_id) == user_id)
+        .where(col(UserDeviceLink.device_id) == device_id)
+    )
+    deleted = session.execute(statement).rowcount
+    session.commit()
+    alarm_engine.invalidate()
+    return bool(deleted)
+
+
+def get_device_ids(session: Session) -> list[str]:
+    return [str(device_id) for device_id in session.exec(select(Device.id))]
+
+
+def get_readings_between(
+    session: Session, *, device_id: uuid.UUID, start: datetime, end: datetime
+) -> list[CoreIoTData]:
+    statement = (
+        select(CoreIoTData)
+        .where(CoreIoTData.device_id == device_id)
+        .where(CoreIoTData.timestamp >= start)
+        .where(CoreIoTData.timestamp <= end)
+        .order_by(CoreIoTData.timestamp.asc())
+    )
+    return session.exec(statement).all()
+
+
+def get_latest_readings(
+    session: Session,
+    *,
+    device_id: uuid.UUID,
+    limit: int,
+    after: datetime | None = None,
+) -> list[CoreIoTData]:
+    """
+    Return the last `limit` readings of a device, oldest first, optionally
+    only among the ones newer than `after`.
+    """
+    statement = select(CoreIoTData).where(CoreIoTData.device_id == device_id)
+    if after is not None:
+        statement = statement.where(CoreIoTData.timestamp > after)
+    statement = statement.order_by(CoreIoTData.timestamp.desc()).limit(limit)
+    return session.exec(statement).all()[::-1]
+
+
+def _readings_statement(
+    *, device_id: uuid.UUID, start: datetime, end: datetime, metrics: list[str]
+) -> Any:
+    columns = [col(CoreIoTData.timestamp), col(CoreIoTData.id)] + [
+        getattr(CoreIoTData, metric) for metric in metrics
+    ]
+    return (
+        select(*columns)
+        .where(CoreIoTData.device_id == device_id)
+        .where(CoreIoTData.timestamp >= start)
+        .where(CoreIoTData.timestamp < end)
+    )
+
+
+def get_readings_page(
+    session: Session,
+    *,
+    device_id: uuid.UUID,
+    start: datetime,
+    end: datetime,
+    metrics: list[str],
+    after: tuple[datetime, uuid.UUID] | None,
+    limit: int,
+) -> list[dict[str, Any]]:
+    """
+    Keyset-paginated readings in [start, end), ordered by (timestamp, id) and
+    projected to the requested metric columns only.
+    """
+    statement = _readings_statement(
+        device_id=device_id, start=start, end=end, metrics=metrics
+    )
+    if after is not None:
+        statement = statement.where(CoreIoTData.timestamp >= after[0]).where(
+            tuple_(CoreIoTData.timestamp, CoreIoTData.id) > tuple_(*after)
+        )
+    statement = statement.order_by(
+        col(CoreIoTData.timestamp).asc(), col(CoreIoTData.id).asc()
+    ).limit(limit)
+    return [dict(row._mapping) for row in session.exec(statement)]
+
+
+def iter_readings(
+    session: Session,
+    *,
+    device_id: uuid.UUID,
+    start: datetime,
+    end: datetime,
+    metrics: list[str],
+    batch_size: int,
+) -> Iterator[Sequence[Row[Any]]]:
+    """
+    Stream readings in [start, end) in batches of rows of (timestamp, id,
+    *metrics), through a server-side cursor so memory use stays constant.
+    """
+    statement = _readings_statement(
+        device_id=device_id, start=start, end=end, metrics=metrics
+    ).order_by(col(CoreIoTData.timestamp).asc())
+    result = session.exec(statement.execution_options(yield_per=batch_size))
+    yield from result.partitions()
+
+
+def bulk_insert_readings(
+    session: Session,
+    *,
+    device_id: uuid.UUID,
+    rows: Iterable[tuple[int, float, float, float]],
+) -> list[tuple[int, float, float, float]]:
+    """
+    COPY (epoch_ms, temperature, humidity, light) rows of one device into a
+    temp table and move them into coreiotdata, skipping readings already
+    stored for the same (device_id, timestamp). Returns the rows actually
+    inserted. The caller owns the transaction.
+    """
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS coreiotdata_staging "
+            "(ts_ms bigint, temperature float8, humidity float8, light float8) "
+            "ON COMMIT DELETE ROWS"
+        )
+        with cursor.copy(
+            "COPY coreiotdata_staging (ts_ms, temperature, humidity, light) FROM STDIN"
+        ) as copy:
+            for row in rows:
+                copy.write_row(row)
+        cursor.execute(
+            """
+            INSERT INTO coreiotdata (id, device_id, timestamp, temperature, humidity, light)
+            SELECT gen_random_uuid(), %(device_id)s,
+                   to_timestamp(ts_ms / 1000.0) AT TIME ZONE 'UTC',
+                   temperature, humidity, light
+            FROM coreiotdata_staging
+            ON CONFLICT (device_id, timestamp) DO NOTHING
+            RETURNING (extract(epoch FROM timestamp) * 1000)::bigint,
+                      temperature, humidity, light
+            """,
+            {"device_id": device_id},
+        )
+        inserted = cursor.fetchall()
+        cursor.execute("TRUNCATE coreiotdata_staging")
+    finally:
+        cursor.close()
+    return inserted
+
+
+ALARM_CONDITION_FIELDS = ("type", "threshold_type", "value", "is_active")
+
+
+def create_alarm(
+    *, session: Session, alarm_create: AlarmCreate, user_id: uuid.UUID
+) -> Alarm:
     db_obj = Alarm.model_validate(alarm_create, update={"user_id": user_id})
     session.add(db_obj)
     session.commit()
     session.refresh(db_obj)
+    alarm_engine.invalidate()
     return db_obj
 
 
@@ -71,53 +444,241 @@ def get_alarms_by_user(session: Session, user_id: uuid.UUID) -> list[Alarm]:
     return session.exec(statement).all()
 
 
+def get_device_token_owners(session: Session) -> dict[str, tuple[uuid.UUID, str]]:
+    """
+    For every device, an active user linked to it who has a CoreIoT access
+    token, with that token, so the device is polled with credentials of its
+    own tenant.
+    """
+    statement = (
+        select(UserDeviceLink.device_id, User.id, User.coreiot_access_token)
+        .join(User, col(User.id) == UserDeviceLink.user_id)
+        .where(User.is_active)
+        .where(col(User.coreiot_access_token).is_not(None))
+        .order_by(col(UserDeviceLink.device_id), col(User.id))
+    )
+    owners: dict[str, tuple[uuid.UUID, str]] = {}
+    for device_id, user_id, token in session.exec(statement):
+        owners.setdefault(str(device_id), (user_id, token))
+    return owners
+
+
 def update_alarm(*, session: Session, db_alarm: Alarm, alarm_in: AlarmUpdate) -> Alarm:
     alarm_data = alarm_in.model_dump(exclude_unset=True)
-    db_alarm.sqlmodel_update(alarm_data)
+    # updated_at is also what other workers use to notice the change
+    extra_data: dict[str, Any] = {"updated_at": datetime.utcnow()}
+    if any(
+        key in alarm_data and alarm_data[key] != getattr(db_alarm, key)
+        for key in ALARM_CONDITION_FIELDS
+    ):
+        # A different condition starts from a cleared state on every device,
+        # the state rows locked before the alarm row like evaluation does
+        session.execute(
+            update(AlarmDeviceState)
+            .where(col(AlarmDeviceState.alarm_id) == db_alarm.id)
+            .values(is_firing=False, pending_since=None)
+        )
+        extra_data.update(is_firing=False)
+    db_alarm.sqlmodel_update(alarm_data, update=extra_data)
     session.add(db_alarm)
     session.commit()
     session.refresh(db_alarm)
+    alarm_engine.invalidate()
     return db_alarm
 
 
 def delete_alarm(session: Session, db_alarm: Alarm) -> None:
+    # The cascade would lock the alarm row before its state rows
+    session.execute(
+        delete(AlarmDeviceState).where(col(AlarmDeviceState.alarm_id) == db_alarm.id)
+    )
     session.delete(db_alarm)
     session.commit()
+    alarm_engine.invalidate()
 
 
-def create_notification(*, session: Session, notification_create: NotificationCreate) -> Notification:
+def create_notification(
+    *, session: Session, notification_create: NotificationCreate
+) -> Notification:
     db_obj = Notification.model_validate(notification_create)
     session.add(db_obj)
+    publish_notifications(session, [db_obj])
     session.commit()
     session.refresh(db_obj)
     return db_obj
 
 
-def get_notifications_by_user(session: Session, user_id: uuid.UUID) -> list[Notification]:
-    statement = select(Notification).where(Notification.user_id == user_id).order_by(Notification.created_at.desc())
-    return session.exec(statement).all()
+# Six bind parameters per row, well below the 65535 Postgres accepts
+NOTIFICATION_INSERT_CHUNK = 5000
+
+
+def create_notifications(
+    *, session: Session, notifications: Sequence[NotificationCreate]
+) -> list[uuid.UUID]:
+    """
+    Insert notifications with one multi-row INSERT ... RETURNING per
+    `NOTIFICATION_INSERT_CHUNK` rows, publish them to their users' streams
+    and return their ids. The caller owns the transaction.
+    """
+    ids: list[uuid.UUID] = []
+    for start in range(0, len(notifications), NOTIFICATION_INSERT_CHUNK):
+        rows = [
+            Notification.model_validate(n).model_dump()
+            for n in notifications[start : start + NOTIFICATION_INSERT_CHUNK]
+        ]
+        statement = insert(Notification).values(rows).returning(col(Notification.id))
+        ids += session.execute(statement).scalars()
+        publish_notifications(session, rows)
+    return ids
+
 
+def get_notification(
+    session: Session, notification_id: uuid.UUID
+) -> Notification | None:
+    return session.get(Notification, notification_id)
 
-def mark_notification_read(session: Session, notification_id: uuid.UUID) -> Notification | None:
-    notification = session.get(Notification, notification_id)
-    if notification:
-        notification.is_read = True
-        session.add(notification)
-        session.commit()
-        session.refresh(notification)
+
+def get_notifications_by_user(
+    session: Session,
+    user_id: uuid.UUID,
+    *,
+    since: str | None = None,
+    limit: int | None = None,
+) -> tuple[list[Notification], str | None]:
+    """
+    The user's latest notifications newest first or, with a `since` snapshot,
+    the latest ones whose transaction it did not see, oldest first. Returns
+    them with the snapshot they were read in, None when there are none.
+
+    Keyed on the inserting transaction instead of created_at, which is set
+    before the insert commits, so a late commit is not skipped and an
+    unchanged feed returns no rows.
+    """
+    statement = (
+        select(Notification, cast(func.pg_current_snapshot(), String))
+        .where(Notification.user_id == user_id)
+        .order_by(col(Notification.created_at).desc(), col(Notification.id).desc())
+    )
+    if since is not None:
+        statement = statement.where(
+            text(
+                "notification.xid >= pg_snapshot_xmin(CAST(:since AS pg_snapshot)) "
+                "AND NOT pg_visible_in_snapshot(notification.xid, CAST(:since AS pg_snapshot))"
+            ).bindparams(since=since)
+        )
+    if limit is not None:
+        statement = statement.limit(limit)
+    rows = session.exec(statement).all()
+    if not rows:
+        return [], None
+    notifications = [notification for notification, _ in rows]
+    if since is not None:
+        notifications.reverse()
+    return notifications, rows[0][1]
+
+
+def count_unread_notifications(session: Session, user_id: uuid.UUID) -> int:
+    statement = (
+        select(func.count())
+        .select_from(Notification)
+        .where(Notification.user_id == user_id)
+        .where(~col(Notification.is_read))
+    )
+    return session.exec(statement).one()
+
+
+def mark_notification_read(
+    session: Session, notification_id: uuid.UUID, user_id: uuid.UUID
+) -> Notification | None:
+    statement = (
+        update(Notification)
+        .where(col(Notification.id) == notification_id)
+        .where(col(Notification.user_id) == user_id)
+        .values(is_read=True)
+        .returning(Notification)
+    )
+    notification = session.scalars(statement).one_or_none()
+    session.commit()
     return notification
 
 
-def mark_all_notifications_read(session: Session, user_id: uuid.UUID) -> None:
-    statement = select(Notification).where(Notification.user_id == user_id)
-    notifications = session.exec(statement).all()
-    for notification in notifications:
-        notification.is_read = True
-        session.add(notification)
+def mark_notifications_read(
+    session: Session, user_id: uuid.UUID, notification_ids: Sequence[uuid.UUID]
+) -> int:
+    statement = (
+        update(Notification)
+        .where(col(Notification.user_id) == user_id)
+        .where(col(Notification.id).in_(notification_ids))
+        .where(~col(Notification.is_read))
+        .values(is_read=True)
+    )
+    updated = session.execute(statement).rowcount
+    session.commit()
+    return updated
+
+
+def mark_all_notifications_read(session: Session, user_id: uuid.UUID) -> int:
+    statement = (
+        update(Notification)
+        .where(col(Notification.user_id) == user_id)
+        .where(~col(Notification.is_read))
+        .values(is_read=True)
+    )
+    updated = session.execute(statement).rowcount
     session.commit()
+    return updated
+
+
+def delete_notification(
+    session: Session, notification_id: uuid.UUID, user_id: uuid.UUID
+) -> bool:
+    return delete_notifications(session, user_id, [notification_id]) > 0
+
+
+def delete_notifications(
+    session: Session, user_id: uuid.UUID, notification_ids: Sequence[uuid.UUID]
+) -> int:
+    statement = (
+        delete(Notification)
+        .where(col(Notification.user_id) == user_id)
+        .where(col(Notification.id).in_(notification_ids))
+    )
+    deleted = session.execute(statement).rowcount
+    session.commit()
+    return deleted
+
 
-def delete_notification(session: Session, notification_id: uuid.UUID) -> None:
-    notification = session.get(Notification, notification_id)
-    if notification:
-        session.delete(notification)
-        session.commit()
+def prune_notifications(
+    session: Session, *, before: datetime, batch_size: int, archive: bool
+) -> int:
+    """
+    Delete, or move to the archive table, one batch of at most `batch_size`
+    notifications created before `before`, skipping rows locked by
+    concurrent writers. Returns the number of rows removed, less than
+    `batch_size` once nothing is left. The caller owns the transaction.
+    """
+    params = {"before": before, "batch_size": batch_size}
+    batch = """
+        DELETE FROM notification
+        WHERE id IN (
+            SELECT id FROM notification
+            WHERE created_at < :before
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, user_id, alarm_id, message, is_read, created_at
+    """
+    if archive:
+        statement = text(
+            f"""
+            WITH moved AS ({batch})
+            INSERT INTO notificationarchive
+                (id, user_id, alarm_id, message, is_read, created_at, archived_at)
+            SELECT id, user_id, alarm_id, message, is_read, created_at,
+                   now() AT TIME ZONE 'UTC'
+            FROM moved
+            """
+        )
+    else:
+        statement = text(batch)
+    return session.execute(statement, params).rowcount
@@ -1,3 +1,6 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
@@ -5,6 +8,14 @@ from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.coreiot import coreiot_client
+from app.core.db import async_engine, db_router
+from app.core.forecast import forecaster
+from app.core.ingest import ingestor
+from app.core.notifications import notification_queue, retention_job
+from app.core.pubsub import notification_listener
+from app.core.security import password_hasher
+from app.core.tuning import forecast_tuner
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,10 +25,42 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    await db_router.start()
+    if settings.NOTIFICATION_BACKPLANE_ENABLED:
+        await notification_listener.start()
+    await password_hasher.start()
+    await notification_queue.start()
+    await forecaster.start()
+    if settings.FORECAST_TUNING_ENABLED:
+        await forecast_tuner.start()
+    if retention_job is not None:
+        await retention_job.start()
+    if settings.COREIOT_INGEST_ENABLED:
+        await ingestor.start()
+    yield
+    await ingestor.stop()
+    # After the ingestor so its last readings are persisted
+    await forecaster.stop()
+    await forecast_tuner.stop()
+    if retention_job is not None:
+        await retention_job.stop()
+    await notification_queue.stop()
+    await notification_listener.stop()
+    await coreiot_client.aclose()
+    await password_hasher.stop()
+    await db_router.stop()
+    # Its connections belong to this event loop
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -1,7 +1,9 @@
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Any
 
 from pydantic import EmailStr
+from sqlalchemy import Index, text
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -43,13 +45,29 @@ class UpdatePassword(SQLModel):
     new_password: str = Field(min_length=8, max_length=40)
 
 
+# Devices a user can read and control
+class UserDeviceLink(SQLModel, table=True):
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", primary_key=True, ondelete="CASCADE"
+    )
+    device_id: uuid.UUID = Field(
+        foreign_key="device.id", primary_key=True, index=True, ondelete="CASCADE"
+    )
+
+
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
+    # Keyset pagination of the user list
+    __table_args__ = (Index("ix_user_created_at", "created_at", "id"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
     items: list["Item"] = Relationship(back_populates="owner", cascade_delete=True)
+    devices: list["Device"] = Relationship(
+        back_populates="users", link_model=UserDeviceLink
+    )
     coreiot_access_token: str | None = None
-    last_trained_at: datetime | None = Field(default=None, nullable=True)  # Track last model training time
 
 
 # Properties to return via API, id is always required
@@ -61,6 +79,7 @@ class UserPublic(UserBase):
 class UsersPublic(SQLModel):
     data: list[UserPublic]
     count: int
+    next_cursor: str | None = None
 
 
 # Shared properties
@@ -81,10 +100,18 @@ class ItemUpdate(ItemBase):
 
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    __table_args__ = (
+        # A user's items page by page, and the cascade when deleting the user
+        Index("ix_item_owner_id_created_at", "owner_id", "created_at", "id"),
+        # Every item page by page, for superusers
+        Index("ix_item_created_at", "created_at", "id"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     owner_id: uuid.UUID = Field(
         foreign_key="user.id", nullable=False, ondelete="CASCADE"
     )
+    created_at: datetime = Field(default_factory=datetime.utcnow)
     owner: User | None = Relationship(back_populates="items")
 
 
@@ -97,6 +124,7 @@ class ItemPublic(ItemBase):
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
     count: int
+    next_cursor: str | None = None
 
 
 # Generic message
@@ -104,6 +132,40 @@ class Message(SQLModel):
     message: str
 
 
+class CacheStats(SQLModel):
+    size: int
+    hits: int
+    stale_hits: int
+    misses: int
+    coalesced: int
+    errors: int
+
+
+# Connections of a database engine's pool in this worker process
+class PoolStats(SQLModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+
+
+class ReplicaStats(SQLModel):
+    url: str
+    # None when it cannot be reached or has replayed nothing yet
+    lag_seconds: float | None
+    usable: bool
+    pool: PoolStats
+    async_pool: PoolStats
+
+
+class Metrics(SQLModel):
+    coreiot_reading_cache: CacheStats
+    auth_user_cache: CacheStats
+    db_pool: PoolStats
+    db_async_pool: PoolStats
+    db_replicas: list[ReplicaStats]
+
+
 # JSON payload containing access token
 class Token(SQLModel):
     access_token: str
@@ -120,19 +182,158 @@ class NewPassword(SQLModel):
     new_password: str = Field(min_length=8, max_length=40)
 
 
+class DeviceBase(SQLModel):
+    name: str = Field(min_length=1, max_length=255)
+
+
+# The id is the CoreIoT entity id of the device
+class DeviceCreate(DeviceBase):
+    id: uuid.UUID
+
+
+class DeviceUpdate(SQLModel):
+    name: str | None = Field(default=None, min_length=1, max_length=255)
+
+
+class Device(DeviceBase, table=True):
+    id: uuid.UUID = Field(primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    users: list[User] = Relationship(
+        back_populates="devices", link_model=UserDeviceLink
+    )
+
+
+class DevicePublic(DeviceBase):
+    id: uuid.UUID
+    created_at: datetime
+
+
+class DevicesPublic(SQLModel):
+    data: list[DevicePublic]
+    count: int
+
+
 class CoreIoTData(SQLModel, table=True):
+    __table_args__ = (
+        # Serves "latest N" and windowed reads for a device without sorting,
+        # and makes re-ingesting a reading idempotent
+        Index(
+            "ix_coreiotdata_device_id_timestamp", "device_id", "timestamp", unique=True
+        ),
+        # Tiny append-only index for time range scans across devices
+        Index("ix_coreiotdata_timestamp_brin", "timestamp", postgresql_using="brin"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # Only unset on readings just fetched from CoreIoT
+    device_id: uuid.UUID | None = Field(
+        default=None, foreign_key="device.id", nullable=False, ondelete="CASCADE"
+    )
+    temperature: float
+    humidity: float
+    light: float
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+METRICS = ("temperature", "humidity", "light")
+
+
+# A single point of a sensor chart, either a raw reading or a rollup bucket
+class CoreIoTReading(SQLModel):
+    timestamp: datetime
     temperature: float
     humidity: float
     light: float
-    timestamp: datetime = Field(default_factory=lambda: datetime.now)
+
+
+# A page of readings restricted to the requested metrics
+class CoreIoTHistoryPage(SQLModel):
+    data: list[dict[str, Any]]
+    next_cursor: str | None = None
+
+
+# Forecasts of one metric for the next readings, with prediction intervals
+class CoreIoTMetricForecast(SQLModel):
+    metric: str
+    # Readings the forecast has seen
+    count: int
+    last_timestamp: datetime
+    predicted: list[float]
+    lower: list[float]
+    upper: list[float]
+
+
+class CoreIoTForecast(SQLModel):
+    steps: int
+    confidence: float
+    data: list[CoreIoTMetricForecast]
+
+
+# Outcome of a bulk ingest request
+class CoreIoTIngestResult(SQLModel):
+    received: int
+    inserted: int
+
+
+# Aggregates of the readings of one device over a fixed-width time bucket
+class CoreIoTRollup(SQLModel, table=True):
+    resolution: str = Field(primary_key=True, max_length=8)
+    device_id: uuid.UUID = Field(
+        primary_key=True, foreign_key="device.id", ondelete="CASCADE"
+    )
+    bucket: datetime = Field(primary_key=True)
+    count: int = 0
+    last_timestamp: datetime
+    temperature_min: float
+    temperature_max: float
+    temperature_sum: float
+    temperature_last: float
+    humidity_min: float
+    humidity_max: float
+    humidity_sum: float
+    humidity_last: float
+    light_min: float
+    light_max: float
+    light_sum: float
+    light_last: float
+
+
+# Persisted Holt forecasting state of one device metric
+class ForecastState(SQLModel, table=True):
+    device_id: uuid.UUID = Field(
+        primary_key=True, foreign_key="device.id", ondelete="CASCADE"
+    )
+    metric: str = Field(primary_key=True, max_length=16)
+    level: float
+    trend: float
+    variance: float
+    count: int
+    last_timestamp: datetime
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Smoothing parameters tuned for the metric, the defaults apply until set
+    alpha: float | None = None
+    beta: float | None = None
+    tuned_at: datetime | None = None
 
 
 class AlarmBase(SQLModel):
-    type: str = Field(description="Type of alarm: 'temperature' or 'humidity' or 'light'")
+    type: str = Field(
+        description="Type of alarm: 'temperature' or 'humidity' or 'light'"
+    )
     threshold_type: str = Field(description="'above' or 'below'")
     value: float = Field(description="Threshold value")
     is_active: bool = Field(default=True)
+    hysteresis: float = Field(
+        default=0, ge=0, description="How far back past the threshold clears the alarm"
+    )
+    min_duration_seconds: int = Field(
+        default=0,
+        ge=0,
+        description="How long the threshold must be crossed before firing",
+    )
+    cooldown_seconds: int = Field(
+        default=0, ge=0, description="Minimum time between two notifications"
+    )
 
 
 class AlarmCreate(AlarmBase):
@@ -144,6 +345,9 @@ class AlarmUpdate(SQLModel):
     threshold_type: str | None = None
     value: float | None = None
     is_active: bool | None = None
+    hysteresis: float | None = Field(default=None, ge=0)
+    min_duration_seconds: int | None = Field(default=None, ge=0)
+    cooldown_seconds: int | None = Field(default=None, ge=0)
 
 
 class Alarm(AlarmBase, table=True):
@@ -152,6 +356,35 @@ class Alarm(AlarmBase, table=True):
     user: User | None = Relationship()
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Summary of the AlarmDeviceState rows for display: firing on any device
+    # and when it last fired on one, written when they fire or clear
+    is_firing: bool = False
+    last_fired_at: datetime | None = None
+
+
+# Evaluation state of an alarm against the readings of one of the devices it
+# watches, so readings of one device do not clear or restart the excursion
+# of another. Only written when it changes
+class AlarmDeviceState(SQLModel, table=True):
+    __table_args__ = (
+        # Pending or firing states, which evaluation revisits on every batch
+        Index(
+            "ix_alarmdevicestate_engaged",
+            "device_id",
+            "alarm_id",
+            postgresql_where=text("is_firing OR pending_since IS NOT NULL"),
+        ),
+    )
+
+    alarm_id: uuid.UUID = Field(
+        foreign_key="alarm.id", primary_key=True, ondelete="CASCADE"
+    )
+    device_id: uuid.UUID = Field(
+        foreign_key="device.id", primary_key=True, ondelete="CASCADE"
+    )
+    is_firing: bool = False
+    pending_since: datetime | None = None
+    last_fired_at: datetime | None = None
 
 
 class AlarmPublic(AlarmBase):
@@ -159,6 +392,8 @@ class AlarmPublic(AlarmBase):
     user_id: uuid.UUID
     created_at: datetime
     updated_at: datetime
+    is_firing: bool
+    last_fired_at: datetime | None
 
 
 class AlarmsPublic(SQLModel):
@@ -177,13 +412,47 @@ class NotificationCreate(NotificationBase):
     alarm_id: uuid.UUID | None = None
 
 
+# The table also has an `xid` column, the inserting transaction's id, filled
+# in by Postgres and indexed on (user_id, xid) for the since-feed, which reads
+# it in SQL only; it is left off the model so inserts never send it
 class Notification(NotificationBase, table=True):
+    __table_args__ = (
+        # Newest-first feed for a user
+        Index("ix_notification_user_id_created_at", "user_id", "created_at", "id"),
+        # Unread counter, only covers the rows it counts
+        Index(
+            "ix_notification_user_id_unread",
+            "user_id",
+            postgresql_where=text("NOT is_read"),
+        ),
+        # Retention deletes by age across users
+        Index("ix_notification_created_at_brin", "created_at", postgresql_using="brin"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID = Field(foreign_key="user.id", nullable=False)
     alarm_id: uuid.UUID | None = Field(default=None, foreign_key="alarm.id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+# Notifications moved out by the retention job, kept without foreign keys so
+# users and alarms can still be deleted
+class NotificationArchive(NotificationBase, table=True):
+    id: uuid.UUID = Field(primary_key=True)
+    user_id: uuid.UUID = Field(index=True)
+    alarm_id: uuid.UUID | None = None
+    created_at: datetime
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class NotificationIds(SQLModel):
+    ids: list[uuid.UUID] = Field(min_length=1, max_length=1000)
+
+
+class BulkResult(SQLModel):
+    count: int
+
+
 class NotificationPublic(NotificationBase):
     id: uuid.UUID
     user_id: uuid.UUID
@@ -193,4 +462,10 @@ class NotificationPublic(NotificationBase):
 
 class NotificationsPublic(SQLModel):
     data: list[NotificationPublic]
-    count: int
\ No newline at end of file
+    count: int
+    # Pass back as `since` to get only newer notifications
+    cursor: str | None = None
+
+
+class UnreadCount(SQLModel):
+    count: int
@@ -0,0 +1,393 @@
+import json
+import uuid
+from collections.abc import Generator
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import crud
+from app.core.config import settings
+from app.core.rollups import ROLLUP_UPSERT_CHUNK, apply_rollups
+from app.models import CoreIoTData, CoreIoTRollup, Device
+from app.tests.utils.device import create_random_device, delete_device
+
+
+@pytest.fixture
+def device(
+    db: Session,
+    normal_user_token_headers: dict[str, str],  # noqa: ARG001
+) -> Generator[Device, None, None]:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user is not None
+    device = create_random_device(db, user_id=user.id)
+    yield device
+    delete_device(db, device.id)
+
+
+def test_daily_data_reads_rollups(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    device: Device,
+) -> None:
+    start = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(
+        hours=2
+    )
+    readings = [
+        CoreIoTData(
+            device_id=device.id,
+            temperature=20 + i % 2,
+            humidity=50,
+            light=100,
+            timestamp=start + timedelta(seconds=10 * i),
+        )
+        for i in range(60)
+    ]
+    db.add_all(readings)
+    apply_rollups(db, readings)
+    db.commit()
+
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/daily-data",
+        headers=normal_user_token_headers,
+        params={"type": "temperature", "resolution": "1m", "device_id": str(device.id)},
+    )
+    assert r.status_code == 200
+    points = [
+        p
+        for p in r.json()
+        if start.replace(tzinfo=None).isoformat()
+        <= p["timestamp"][:19]
+        < (start + timedelta(minutes=10)).replace(tzinfo=None).isoformat()
+    ]
+    # Six readings per minute, averaged into one point per bucket
+    assert len(points) == 10
+    assert all(p["temperature"] == 20.5 for p in points)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/daily-data",
+        headers=normal_user_token_headers,
+        params={
+            "type": "temperature",
+            "resolution": "raw",
+            "max_points": 10,
+            "device_id": str(device.id),
+        },
+    )
+    assert r.status_code == 200
+    assert len(r.json()) <= 10
+
+    # The raw window covers every reading of the last two hours
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/daily-data",
+        headers=normal_user_token_headers,
+        params={
+            "type": "temperature",
+            "resolution": "raw",
+            "device_id": str(device.id),
+        },
+    )
+    assert r.status_code == 200
+    assert len(r.json()) == len(readings)
+
+
+def test_daily_data_rejects_unknown_type(
+    client: TestClient, normal_user_token_headers: dict[str, str], device: Device
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/daily-data",
+        headers=normal_user_token_headers,
+        params={"type": "pressure", "device_id": str(device.id)},
+    )
+    assert r.status_code == 400
+
+
+def test_endpoints_are_scoped_to_linked_devices(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    other = create_random_device(db)
+    try:
+        for path in ("daily-data", "history", "predict-next"):
+            r = client.get(
+                f"{settings.API_V1_STR}/coreiot/{path}",
+                headers=normal_user_token_headers,
+                params={"type": "temperature", "device_id": str(other.id)},
+            )
+            assert r.status_code == 404
+        r = client.post(
+            f"{settings.API_V1_STR}/coreiot/control-fan",
+            headers=normal_user_token_headers,
+            params={"device_id": str(other.id)},
+            json={"turn_on": True},
+        )
+        assert r.status_code == 404
+    finally:
+        delete_device(db, other.id)
+
+
+def test_history_pages_with_cursor(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    device: Device,
+) -> None:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db.add_all(
+        CoreIoTData(
+            device_id=device.id,
+            temperature=i,
+            humidity=50,
+            light=100,
+            timestamp=start + timedelta(minutes=i),
+        )
+        for i in range(25)
+    )
+    db.commit()
+
+    params: dict[str, str | int] = {
+        "start": start.isoformat(),
+        "end": (start + timedelta(hours=1)).isoformat(),
+        "metrics": "temperature",
+        "limit": 10,
+        "device_id": str(device.id),
+    }
+    seen = []
+    pages = 0
+    while True:
+        r = client.get(
+            f"{settings.API_V1_STR}/coreiot/history",
+            headers=normal_user_token_headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        page = r.json()
+        pages += 1
+        seen += [row["temperature"] for row in page["data"]]
+        assert all(set(row) == {"timestamp", "temperature"} for row in page["data"])
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert pages == 3
+    assert seen == list(range(25))
+
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/history",
+        headers=normal_user_token_headers,
+        params={"cursor": "not-a-cursor", "device_id": str(device.id)},
+    )
+    assert r.status_code == 400
+
+
+def test_history_takes_naive_bounds_as_utc(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    device: Device,
+) -> None:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db.add(
+        CoreIoTData(
+            device_id=device.id,
+            temperature=21,
+            humidity=50,
+            light=100,
+            timestamp=start + timedelta(minutes=1),
+        )
+    )
+    db.commit()
+
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/history",
+        headers=normal_user_token_headers,
+        params={"start": "2024-01-01T00:00:00", "device_id": str(device.id)},
+    )
+    assert r.status_code == 200
+    assert [row["temperature"] for row in r.json()["data"]] == [21]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/history",
+        headers=normal_user_token_headers,
+        params={
+            "start": "2024-01-01T00:00:00",
+            "end": "2024-01-01T01:00:00+01:00",
+            "device_id": str(device.id),
+        },
+    )
+    assert r.status_code == 400
+
+
+def test_export_takes_naive_bounds_as_utc(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    device: Device,
+) -> None:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db.add(
+        CoreIoTData(
+            device_id=device.id,
+            temperature=21,
+            humidity=50,
+            light=100,
+            timestamp=start + timedelta(minutes=1),
+        )
+    )
+    db.commit()
+
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/export",
+        headers=normal_user_token_headers,
+        params={
+            "start": "2024-01-01T00:00:00",
+            "metrics": "temperature",
+            "device_id": str(device.id),
+        },
+    )
+    assert r.status_code == 200
+    assert [json.loads(line)["temperature"] for line in r.text.splitlines()] == [21]
+
+
+def test_ingest_is_idempotent(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    device: Device,
+) -> None:
+    base = 1_600_000_000_000
+    readings = [
+        {"ts": base + i * 1000, "temperature": 20, "humidity": 40, "light": 10}
+        for i in range(100)
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/coreiot/ingest",
+        headers=normal_user_token_headers,
+        params={"device_id": str(device.id)},
+        json=readings,
+    )
+    assert r.status_code == 200
+    assert r.json() == {"received": 100, "inserted": 100}
+
+    ndjson = "\n".join(
+        json.dumps(reading)
+        for reading in readings[50:]
+        + [{"ts": base + 100_000, "temperature": 21, "humidity": 41, "light": 11}]
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/coreiot/ingest",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        params={"device_id": str(device.id)},
+        content=ndjson,
+    )
+    assert r.status_code == 200
+    assert r.json() == {"received": 51, "inserted": 1}
+
+    rollup = db.exec(
+        select(CoreIoTRollup)
+        .where(CoreIoTRollup.device_id == device.id)
+        .where(CoreIoTRollup.resolution == "1h")
+    ).one()
+    assert rollup.count == 101
+    assert rollup.temperature_last == 21
+
+
+def test_ingest_backfill_upserts_rollups_in_chunks(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    device: Device,
+) -> None:
+    # One 1m rollup per reading, more rows than fit in one upsert
+    size = ROLLUP_UPSERT_CHUNK + 1000
+    base = 1_600_000_000_000
+    readings = [
+        {"ts": base + i * 60_000, "temperature": i, "humidity": 40, "light": 10}
+        for i in range(size)
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/coreiot/ingest",
+        headers=normal_user_token_headers,
+        params={"device_id": str(device.id)},
+        json=readings,
+    )
+    assert r.status_code == 200
+    assert r.json() == {"received": size, "inserted": size}
+
+    for resolution in ("1m", "1h"):
+        counts = db.exec(
+            select(CoreIoTRollup.count)
+            .where(CoreIoTRollup.device_id == device.id)
+            .where(CoreIoTRollup.resolution == resolution)
+        ).all()
+        assert sum(counts) == size
+    assert len(counts) < size
+
+
+def test_ingest_rejects_invalid_readings(
+    client: TestClient, normal_user_token_headers: dict[str, str], device: Device
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/coreiot/ingest",
+        headers=normal_user_token_headers,
+        params={"device_id": str(device.id)},
+        json=[
+            {"ts": 1_600_000_000_000, "temperature": 20, "humidity": 140, "light": 1}
+        ],
+    )
+    assert r.status_code == 422
+    assert "humidity" in r.json()["detail"]
+
+
+def test_stream_requires_token_and_linked_device(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/coreiot/stream")
+    assert r.status_code == 422
+    token = normal_user_token_headers["Authorization"].removeprefix("Bearer ")
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/stream",
+        params={"token": token, "device_id": str(uuid.uuid4())},
+    )
+    assert r.status_code == 404
+
+
+def test_forecast_returns_every_metric(
+    client: TestClient, normal_user_token_headers: dict[str, str], device: Device
+) -> None:
+    base = 1_650_000_000_000
+    r = client.post(
+        f"{settings.API_V1_STR}/coreiot/ingest",
+        headers=normal_user_token_headers,
+        params={"device_id": str(device.id)},
+        json=[
+            {"ts": base + i * 1000, "temperature": 20 + i, "humidity": 40, "light": 10}
+            for i in range(30)
+        ],
+    )
+    assert r.status_code == 200
+
+    r = client.get(
+        f"{settings.API_V1_STR}/coreiot/forecast",
+        headers=normal_user_token_headers,
+        params={"device_id": str(device.id), "steps": 3},
+    )
+    assert r.status_code == 200
+    forecast = r.json()
+    assert [f["metric"] for f in forecast["data"]] == [
+        "temperature",
+        "humidity",
+        "light",
+    ]
+    temperature = forecast["data"][0]
+    assert temperature["count"] == 30
+    assert len(temperature["predicted"]) == 3
+    assert all(
+        lower <= predicted <= upper
+        for lower, predicted, upper in zip(
+            temperature["lower"],
+            temperature["predicted"],
+            temperature["upper"],
+            strict=True,
+        )
+    )
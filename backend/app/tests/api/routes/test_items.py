@@ -3,7 +3,9 @@ import uuid
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
+from app import crud
 from app.core.config import settings
+from app.models import ItemCreate
 from app.tests.utils.item import create_random_item
 
 
@@ -79,6 +81,50 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
+def test_read_items_pages_with_cursor(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user is not None
+    for i in range(5):
+        crud.create_item(
+            session=db, item_in=ItemCreate(title=f"Page {i}"), owner_id=user.id
+        )
+    total = crud.count_items(db, owner_id=user.id)
+
+    ids: list[str] = []
+    cursor = None
+    while True:
+        params = {"limit": 2} | ({"cursor": cursor} if cursor else {})
+        r = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        page = r.json()
+        assert page["count"] == total
+        ids += [item["id"] for item in page["data"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(ids) == len(set(ids)) == total
+    # The same order as the offset pages
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"skip": 2, "limit": 2},
+    )
+    assert [item["id"] for item in r.json()["data"]] == ids[2:4]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"cursor": "bogus"},
+    )
+    assert r.status_code == 400
+
+
 def test_update_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -4,8 +4,8 @@ from fastapi.testclient import TestClient
 from sqlmodel import Session
 
 from app.core.config import settings
-from app.core.security import verify_password
-from app.crud import create_user
+from app.core.security import password_hasher, pwd_context, verify_password
+from app.crud import create_user, get_user_by_email
 from app.models import UserCreate
 from app.tests.utils.user import user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
@@ -33,6 +33,47 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+def test_get_access_token_unknown_email(client: TestClient) -> None:
+    login_data = {"username": random_email(), "password": random_lower_string()}
+    r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Incorrect email or password"
+
+
+def test_get_access_token_rehashes_weaker_hashes(
+    client: TestClient, db: Session
+) -> None:
+    email = random_email()
+    password = random_lower_string()
+    weak_hash = pwd_context.hash(password, rounds=4)
+    create_user(
+        session=db,
+        user_create=UserCreate(email=email, password=password),
+        hashed_password=weak_hash,
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": email, "password": password},
+    )
+    assert r.status_code == 200
+    db.expire_all()
+    user = get_user_by_email(session=db, email=email)
+    assert user is not None
+    assert user.hashed_password != weak_hash
+    assert verify_password(password, user.hashed_password)
+
+
+def test_get_access_token_when_hashing_is_saturated(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with patch.object(password_hasher, "max_pending", 0):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
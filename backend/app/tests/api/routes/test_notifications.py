@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, delete
+
+from app import crud
+from app.core.config import settings
+from app.models import Notification, NotificationCreate, User
+
+
+def create_notifications(db: Session, user: User, count: int) -> None:
+    start = datetime.utcnow() - timedelta(minutes=count)
+    for i in range(count):
+        note = Notification.model_validate(
+            NotificationCreate(message=f"note {i}", user_id=user.id),
+            update={"created_at": start + timedelta(minutes=i)},
+        )
+        db.add(note)
+    db.commit()
+
+
+def test_notifications_feed_and_unread_count(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    db.exec(delete(Notification).where(Notification.user_id == user.id))  # type: ignore
+    create_notifications(db, user, 3)
+    url = f"{settings.API_V1_STR}/notifications/"
+
+    r = client.get(url, headers=normal_user_token_headers, params={"limit": 2})
+    assert r.status_code == 200
+    page = r.json()
+    assert [n["message"] for n in page["data"]] == ["note 2", "note 1"]
+
+    # Nothing newer: an empty page, and a 304 once the client has seen it
+    r = client.get(
+        url, headers=normal_user_token_headers, params={"since": page["cursor"]}
+    )
+    assert r.json()["data"] == [] and r.json()["cursor"] == page["cursor"]
+    headers = {**normal_user_token_headers, "If-None-Match": r.headers["ETag"]}
+    r = client.get(url, headers=headers, params={"since": page["cursor"]})
+    assert r.status_code == 304 and r.content == b""
+
+    r = client.get(f"{url}unread-count", headers=normal_user_token_headers)
+    assert r.json() == {"count": 3}
+    etag = r.headers["ETag"]
+
+    create_notifications(db, user, 1)
+    r = client.get(
+        url, headers=normal_user_token_headers, params={"since": page["cursor"]}
+    )
+    assert [n["message"] for n in r.json()["data"]] == ["note 0"]
+    headers = {**normal_user_token_headers, "If-None-Match": etag}
+    r = client.get(f"{url}unread-count", headers=headers)
+    assert r.status_code == 200 and r.json() == {"count": 4}
+
+    r = client.get(url, headers=normal_user_token_headers, params={"since": "bogus"})
+    assert r.status_code == 400
+    db.exec(delete(Notification).where(Notification.user_id == user.id))  # type: ignore
+    db.commit()
+
+
+def test_since_feed_picks_up_late_commits(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    db.exec(delete(Notification).where(Notification.user_id == user.id))  # type: ignore
+    create_notifications(db, user, 1)
+    url = f"{settings.API_V1_STR}/notifications/"
+    cursor = client.get(url, headers=normal_user_token_headers).json()["cursor"]
+
+    # Created before the newest one the client has, but committed after it
+    late = Notification.model_validate(
+        NotificationCreate(message="late", user_id=user.id),
+        update={"created_at": datetime.utcnow() - timedelta(minutes=1, seconds=1)},
+    )
+    db.add(late)
+    db.commit()
+
+    r = client.get(url, headers=normal_user_token_headers, params={"since": cursor})
+    page = r.json()
+    assert [n["message"] for n in page["data"]] == ["late"]
+    r = client.get(
+        url, headers=normal_user_token_headers, params={"since": page["cursor"]}
+    )
+    assert r.json()["data"] == []
+    db.exec(delete(Notification).where(Notification.user_id == user.id))  # type: ignore
+    db.commit()
@@ -6,7 +6,7 @@ from sqlmodel import Session, select
 
 from app import crud
 from app.core.config import settings
-from app.core.security import verify_password
+from app.core.security import password_hasher, verify_password
 from app.models import User, UserCreate
 from app.tests.utils.utils import random_email, random_lower_string
 
@@ -168,6 +168,41 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_with_cursor_and_estimated_count(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 2, "estimate_count": True},
+    )
+    assert r.status_code == 200
+    first = r.json()
+    assert len(first["data"]) == 2
+    assert first["count"] >= 0
+    assert first["next_cursor"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 2, "cursor": first["next_cursor"]},
+    )
+    second = r.json()
+    assert second["count"] > 3
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 4},
+    )
+    assert [u["id"] for u in first["data"] + second["data"]] == [
+        u["id"] for u in r.json()["data"]
+    ]
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -245,6 +280,23 @@ def test_update_password_me_incorrect_password(
     assert updated_user["detail"] == "Incorrect password"
 
 
+def test_update_password_me_when_hashing_is_saturated(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = {
+        "current_password": settings.FIRST_SUPERUSER_PASSWORD,
+        "new_password": random_lower_string(),
+    }
+    with patch.object(password_hasher, "max_pending", 0):
+        r = client.patch(
+            f"{settings.API_V1_STR}/users/me/password",
+            headers=superuser_token_headers,
+            json=data,
+        )
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+
 def test_update_user_me_email_exists(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_metrics_report_pools(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+) -> None:
+    # Served on the async engine
+    r = client.get(f"{settings.API_V1_STR}/alarms/", headers=normal_user_token_headers)
+    assert r.status_code == 200
+
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    metrics = r.json()
+    for pool in ("db_pool", "db_async_pool"):
+        assert metrics[pool]["size"] == settings.DB_POOL_SIZE
+        assert metrics[pool]["checked_out"] >= 0
+    assert metrics["db_async_pool"]["checked_in"] >= 1
+    assert metrics["db_replicas"] == []
+
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=normal_user_token_headers
+    )
+    assert r.status_code == 403
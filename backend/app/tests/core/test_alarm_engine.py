@@ -0,0 +1,121 @@
+import random
+import uuid
+
+import numpy as np
+
+from app.core.alarm_engine import AlarmIndex, AlarmRule, AlarmState, advance
+from app.models import METRICS
+
+
+def make_rules(count: int) -> list[AlarmRule]:
+    rng = random.Random(1)
+    return [
+        AlarmRule(
+            uuid.uuid4(),
+            uuid.uuid4(),
+            rng.choice(METRICS),
+            rng.choice(["above", "below"]),
+            float(rng.randint(0, 10)),
+        )
+        for _ in range(count)
+    ]
+
+
+def scan(rules: list[AlarmRule], metric: str, value: float) -> set[uuid.UUID]:
+    return {
+        rule.id
+        for rule in rules
+        if rule.type == metric
+        and (
+            (rule.threshold_type == "above" and value > rule.value)
+            or (rule.threshold_type == "below" and value < rule.value)
+        )
+    }
+
+
+def test_tripped_matches_linear_scan() -> None:
+    rules = make_rules(200)
+    index = AlarmIndex(rules)
+    # Integer values hit thresholds exactly, which must not trip
+    for value in [-1.0, 0.0, 3.0, 4.5, 10.0, 11.0]:
+        for metric in METRICS:
+            tripped = {rule.id for rule in index.tripped(metric, value)}
+            assert tripped == scan(rules, metric, value)
+
+
+def test_evaluate_batch_matches_linear_scan() -> None:
+    rules = make_rules(200)
+    index = AlarmIndex(rules)
+    values = {metric: np.array([-1.0, 2.0, 5.0, 5.5, 12.0]) for metric in METRICS}
+    tripped = index.evaluate_batch(values)
+    pairs = {
+        (reading, index.rules[rule].id)
+        for reading, rule in zip(
+            tripped.readings.tolist(), tripped.rules.tolist(), strict=True
+        )
+    }
+    assert len(pairs) == len(tripped.rules)
+    expected = {
+        (i, rule_id)
+        for metric in METRICS
+        for i, value in enumerate(values[metric])
+        for rule_id in scan(rules, metric, value)
+    }
+    assert pairs == expected
+
+
+def test_evaluate_batch_without_rules() -> None:
+    index = AlarmIndex([])
+    tripped = index.evaluate_batch({metric: np.array([1.0]) for metric in METRICS})
+    assert len(tripped.readings) == 0
+
+
+def run(rule: AlarmRule, values: list[float], state: AlarmState = AlarmState()):  # type: ignore[no-untyped-def]
+    ts_ms = np.arange(len(values), dtype=np.int64) * 1000
+    return advance(rule, state, ts_ms, np.array(values))
+
+
+def test_advance_fires_once_per_excursion() -> None:
+    rule = AlarmRule(uuid.uuid4(), uuid.uuid4(), "temperature", "above", 30.0)
+    state, fired = run(rule, [29, 31, 32, 33, 29, 31])
+    assert fired == [1, 5]
+    assert state == AlarmState(True, None, 5000)
+
+
+def test_advance_hysteresis_keeps_alarm_firing() -> None:
+    rule = AlarmRule(
+        uuid.uuid4(), uuid.uuid4(), "temperature", "above", 30.0, hysteresis=2
+    )
+    state, fired = run(rule, [31, 29, 31, 27.5, 31])
+    assert fired == [0, 4]
+    state, fired = run(rule, [31, 29.5, 31])
+    assert fired == [0]
+    assert state.is_firing
+
+
+def test_advance_min_duration_and_cooldown() -> None:
+    rule = AlarmRule(
+        uuid.uuid4(),
+        uuid.uuid4(),
+        "humidity",
+        "below",
+        40.0,
+        min_duration_ms=2000,
+        cooldown_ms=5000,
+    )
+    # Breach at 1s is too short, the one from 3s lasts long enough at 5s
+    state, fired = run(rule, [50, 30, 50, 30, 30, 30, 50, 30, 30, 30, 30, 30])
+    # The second one is long enough at 9s but cooling down until 10s
+    assert fired == [5, 10]
+    assert state == AlarmState(True, None, 10000)
+
+
+def test_advance_pending_state_carries_over_batches() -> None:
+    rule = AlarmRule(
+        uuid.uuid4(), uuid.uuid4(), "light", "above", 100.0, min_duration_ms=3000
+    )
+    state, fired = run(rule, [150, 150])
+    assert fired == [] and state == AlarmState(False, 0, None)
+    ts_ms = np.array([2000, 3000], dtype=np.int64)
+    state, fired = advance(rule, state, ts_ms, np.array([150.0, 150.0]))
+    assert fired == [1]
@@ -0,0 +1,198 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlmodel import Session
+
+from app import crud
+from app.core.cache import CacheBackend, LRUCache, ReadingCache, UserCache, user_cache
+from app.core.coreiot import CoreIoTError
+from app.core.db import engine
+from app.models import CoreIoTData, User, UserUpdate
+from app.tests.utils.user import create_random_user
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Upstream:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self) -> CoreIoTData:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise CoreIoTError(503, "unavailable")
+        return CoreIoTData(
+            temperature=float(self.calls),
+            humidity=40,
+            light=100,
+            timestamp=datetime.now(timezone.utc),
+        )
+
+
+class DictBackend:
+    def __init__(self) -> None:
+        self.entries: dict[str, tuple[float, str]] = {}
+
+    async def get(self, key: str) -> tuple[float, str] | None:
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: str, stored_at: float, ttl: float) -> None:  # noqa: ARG002
+        self.entries[key] = (stored_at, value)
+
+
+def make_cache(clock: Clock, backend: CacheBackend | None = None) -> ReadingCache:
+    return ReadingCache(
+        ttl=2,
+        stale_ttl=30,
+        revalidate_timeout=0.05,
+        max_entries=8,
+        backend=backend,
+        clock=clock,
+    )
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache: LRUCache[str, int] = LRUCache(2)
+    cache.set("a", 1, 0)
+    cache.set("b", 2, 0)
+    assert cache.get("a") == (0, 1)
+    cache.set("c", 3, 0)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+
+def test_concurrent_misses_share_one_request() -> None:
+    clock = Clock()
+    cache = make_cache(clock)
+    upstream = Upstream(delay=0.01)
+
+    async def run() -> list[CoreIoTData]:
+        return await asyncio.gather(
+            *(cache.get("dev", "token", upstream) for _ in range(10))
+        )
+
+    readings = asyncio.run(run())
+    assert upstream.calls == 1
+    assert all(reading is readings[0] for reading in readings)
+    stats = cache.stats()
+    assert (stats.misses, stats.coalesced, stats.hits) == (10, 9, 0)
+
+
+def test_fresh_hits_and_token_scope() -> None:
+    clock = Clock()
+    cache = make_cache(clock)
+    upstream = Upstream()
+
+    async def run() -> None:
+        first = await cache.get("dev", "token", upstream)
+        clock.now += 1
+        assert await cache.get("dev", "token", upstream) is first
+        await cache.get("dev", "other-token", upstream)
+
+    asyncio.run(run())
+    assert upstream.calls == 2
+    assert cache.stats().hits == 1
+
+
+def test_stale_reading_served_while_upstream_is_slow() -> None:
+    clock = Clock()
+    cache = make_cache(clock)
+    upstream = Upstream()
+
+    async def run() -> None:
+        first = await cache.get("dev", "token", upstream)
+        clock.now += 5
+        upstream.delay = 0.2
+        assert await cache.get("dev", "token", upstream) is first
+        # The refresh finishes in the background
+        await asyncio.sleep(0.3)
+        refreshed = await cache.get("dev", "token", upstream)
+        assert refreshed.temperature == 2
+
+    asyncio.run(run())
+    assert upstream.calls == 2
+    assert cache.stats().stale_hits == 1
+
+
+def test_stale_reading_served_on_error_until_expired() -> None:
+    clock = Clock()
+    cache = make_cache(clock)
+    upstream = Upstream()
+
+    async def run() -> None:
+        first = await cache.get("dev", "token", upstream)
+        upstream.fail = True
+        clock.now += 10
+        assert await cache.get("dev", "token", upstream) is first
+        clock.now += 30
+        with pytest.raises(CoreIoTError):
+            await cache.get("dev", "token", upstream)
+
+    asyncio.run(run())
+    assert cache.stats().errors == 2
+
+
+def test_backend_shares_readings_between_caches() -> None:
+    clock = Clock()
+    backend = DictBackend()
+    upstream = Upstream()
+
+    async def run() -> None:
+        first = await make_cache(clock, backend).get("dev", "token", upstream)
+        other = make_cache(clock, backend)
+        reading = await other.get("dev", "token", upstream)
+        assert reading.temperature == first.temperature
+        assert other.stats().hits == 1
+
+    asyncio.run(run())
+    assert upstream.calls == 1
+
+
+def test_user_cache_serves_snapshots_until_the_user_changes(db: Session) -> None:
+    user_id = create_random_user(db).id
+    user_cache.clear()
+    hits = user_cache.hits
+    with Session(engine) as session:
+        assert user_cache.get(session, user_id) is not None
+    with Session(engine) as session:
+        cached = user_cache.get(session, user_id)
+        assert user_cache.hits == hits + 1
+        assert cached in session
+        assert cached.id == user_id
+
+    db_user = db.get(User, user_id)
+    assert db_user is not None
+    crud.update_user(
+        session=db, db_user=db_user, user_in=UserUpdate(full_name="Renamed")
+    )
+    with Session(engine) as session:
+        cached = user_cache.get(session, user_id)
+        assert cached is not None and cached.full_name == "Renamed"
+        assert user_cache.hits == hits + 1
+
+    db.delete(db_user)
+    db.commit()
+    with Session(engine) as session:
+        assert user_cache.get(session, user_id) is None
+
+
+def test_user_cache_expires_entries(db: Session) -> None:
+    user_id = create_random_user(db).id
+    clock = Clock()
+    cache = UserCache(ttl=10, max_entries=10, clock=clock)
+    with Session(engine) as session:
+        cache.get(session, user_id)
+        cache.get(session, user_id)
+        clock.now += 10
+        cache.get(session, user_id)
+    assert (cache.hits, cache.misses) == (1, 2)
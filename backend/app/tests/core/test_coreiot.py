@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.coreiot import CoreIoTClient, CoreIoTError
+
+
+def make_client(handler) -> CoreIoTClient:  # type: ignore[no-untyped-def]
+    return CoreIoTClient(
+        base_url="http://coreiot.test",
+        timeout=1,
+        max_connections=2,
+        max_concurrency=2,
+        retries=2,
+        backoff=0,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def test_get_latest_reading_retries_gateway_errors() -> None:
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(
+            200,
+            json={
+                "temperature": [{"ts": 1_700_000_000_000, "value": "21.5"}],
+                "humidity": [{"ts": 1_700_000_000_000, "value": "40"}],
+                "light": [{"ts": 1_700_000_000_000, "value": "120"}],
+            },
+        )
+
+    async def run() -> None:
+        client = make_client(handler)
+        try:
+            reading = await client.get_latest_reading("dev", access_token="tok")
+        finally:
+            await client.aclose()
+        assert reading.temperature == 21.5
+        assert reading.light == 120
+
+    asyncio.run(run())
+    assert len(calls) == 3
+    assert calls[0].headers["X-Authorization"] == "Bearer tok"
+
+
+def test_send_rpc_does_not_retry_error_responses() -> None:
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(504)
+
+    async def run() -> int:
+        client = make_client(handler)
+        try:
+            response = await client.send_rpc(
+                "dev", access_token="tok", method="setFanState", params=True
+            )
+        finally:
+            await client.aclose()
+        return response.status_code
+
+    assert asyncio.run(run()) == 504
+    assert len(calls) == 1
+
+
+def test_transport_errors_surface_as_coreiot_error() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("refused", request=request)
+
+    async def run() -> None:
+        client = make_client(handler)
+        try:
+            await client.get_telemetry("dev", access_token="tok")
+        finally:
+            await client.aclose()
+
+    with pytest.raises(CoreIoTError) as exc_info:
+        asyncio.run(run())
+    assert exc_info.value.status_code == 503
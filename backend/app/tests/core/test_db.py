@@ -0,0 +1,77 @@
+import uuid
+
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import USER_KEY, ReplicaRouter, db_router, engine
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_router(urls: list[str], clock: FakeClock, **kwargs: float) -> ReplicaRouter:
+    options = {"max_lag": 5.0, "check_interval": 1.0, "sticky_for": 10.0} | kwargs
+    return ReplicaRouter(urls, clock=clock, **options)
+
+
+def test_reads_go_to_replicas_that_are_checked_and_caught_up() -> None:
+    # The primary doubles as a replica that is never behind
+    clock = FakeClock()
+    router = make_router([str(settings.SQLALCHEMY_DATABASE_URI)], clock)
+    assert router.read_engine() is engine
+
+    router.refresh()
+    assert router.read_engine() is router.replicas[0]
+    assert router.async_read_engine() is router.async_replicas[0]
+    [stats] = router.stats()
+    assert stats.lag_seconds == 0 and stats.usable
+
+    # Checks that stopped coming in no longer vouch for the replica
+    clock.now += 3
+    assert router.read_engine() is engine
+
+    lagging = make_router([str(settings.SQLALCHEMY_DATABASE_URI)], clock, max_lag=-1)
+    lagging.refresh()
+    assert lagging.read_engine() is engine
+
+
+def test_unreachable_replica_falls_back_to_primary() -> None:
+    url = str(settings.SQLALCHEMY_DATABASE_URI).replace(
+        f":{settings.POSTGRES_PORT}/", ":1/"
+    )
+    router = make_router([url], FakeClock())
+    router.refresh()
+    assert router.read_engine() is engine
+    [stats] = router.stats()
+    assert stats.lag_seconds is None and not stats.usable
+
+
+def test_users_read_their_writes_from_the_primary() -> None:
+    clock = FakeClock()
+    router = make_router([str(settings.SQLALCHEMY_DATABASE_URI)], clock)
+    router.refresh()
+    writer, reader = uuid.uuid4(), uuid.uuid4()
+
+    router.wrote(writer)
+    assert router.read_engine(writer) is engine
+    assert router.read_engine(reader) is router.replicas[0]
+
+    clock.now += 1
+    router.refresh()
+    clock.now += 9
+    assert router.read_engine(writer) is router.replicas[0]
+
+
+def test_commits_of_user_sessions_are_remembered() -> None:
+    user_id = uuid.uuid4()
+    with Session(engine) as session:
+        session.commit()
+        assert not db_router.wrote_recently(user_id)
+        session.info[USER_KEY] = user_id
+        session.commit()
+    assert db_router.wrote_recently(user_id)
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+from sqlmodel import Session
+
+from app.core.forecast import (
+    Forecaster,
+    HoltState,
+    forecast_intervals,
+    forecaster,
+    holt_update,
+)
+from app.core.ingest import store_reading_arrays
+from app.models import METRICS
+from app.tests.utils.device import create_random_device, delete_device
+
+
+def make_forecaster(**kwargs: float) -> Forecaster:
+    options = {"warmup": 10, "persist_interval": 60, "max_devices": 100, **kwargs}
+    return Forecaster(alpha=forecaster.alpha, beta=forecaster.beta, **options)  # type: ignore[arg-type]
+
+
+def test_holt_update_follows_a_linear_trend() -> None:
+    ts_ms = np.arange(200) * 1000
+    state = holt_update(
+        HoltState(), ts_ms, 2.0 * np.arange(200) + 1, alpha=0.5, beta=0.1
+    )
+    assert state.count == 200
+    assert state.forecast() == pytest.approx(401, abs=1e-3)
+    assert state.forecast(5) == pytest.approx(409, abs=1e-3)
+    assert state.variance == pytest.approx(0, abs=1e-3)
+
+
+def test_holt_update_skips_readings_already_seen() -> None:
+    state = holt_update(
+        HoltState(), np.array([1, 2, 3]), np.array([1.0, 2.0, 3.0]), alpha=0.5, beta=0.1
+    )
+    again = holt_update(
+        state, np.array([2, 3]), np.array([50.0, 60.0]), alpha=0.5, beta=0.1
+    )
+    assert again == state
+    # One step at a time gives the same state as a batch
+    stepped = HoltState()
+    for ts, value in ((1, 1.0), (2, 2.0), (3, 3.0)):
+        stepped = holt_update(
+            stepped, np.array([ts]), np.array([value]), alpha=0.5, beta=0.1
+        )
+    assert stepped == state
+
+
+def test_forecast_intervals_widen_with_the_horizon() -> None:
+    states = [HoltState(10, 1, 4, 50, 0), HoltState(0, 0, 0, 50, 0)]
+    predicted, lower, upper = forecast_intervals(
+        states, 3, alpha=0.5, beta=0.1, confidence=0.95
+    )
+    assert predicted.tolist() == [[11, 12, 13], [0, 0, 0]]
+    assert lower[0, 0] == pytest.approx(11 - 1.96 * 2, abs=1e-2)
+    width = upper[0] - lower[0]
+    assert np.all(np.diff(width) > 0)
+    # No error seen yet, no uncertainty
+    assert np.array_equal(lower[1], upper[1])
+
+
+def test_forecaster_updates_on_commit_and_persists(db: Session) -> None:
+    device_id = create_random_device(db).id
+    start = 1_700_000_000_000
+    ts_ms = start + np.arange(50) * 1000
+    values = {metric: np.linspace(10, 20, 50) for metric in METRICS}
+
+    try:
+        store_reading_arrays(db, device_id, ts_ms, values)
+        db.rollback()
+        store_reading_arrays(
+            db, device_id, ts_ms[:40], {m: v[:40] for m, v in values.items()}
+        )
+        db.commit()
+        store_reading_arrays(
+            db, device_id, ts_ms[40:], {m: v[40:] for m, v in values.items()}
+        )
+        db.commit()
+
+        expected = holt_update(
+            HoltState(),
+            ts_ms,
+            values["temperature"],
+            alpha=forecaster.alpha,
+            beta=forecaster.beta,
+        )
+        state = forecaster.get_states(db, device_id)["temperature"]
+        assert state.count == 50
+        assert state.forecast() == pytest.approx(expected.forecast())
+        assert forecaster.predict(db, device_id, "temperature") == pytest.approx(
+            expected.forecast()
+        )
+
+        forecaster.flush()
+        reloaded = make_forecaster()
+        assert reloaded.get_states(db, device_id)["temperature"] == pytest.approx(state)
+    finally:
+        delete_device(db, device_id)
+
+
+def test_forecaster_needs_two_readings(db: Session) -> None:
+    device_id = create_random_device(db).id
+    values = {metric: np.array([1.0]) for metric in METRICS}
+    try:
+        store_reading_arrays(db, device_id, np.array([1_700_000_000_000]), values)
+        db.commit()
+        assert forecaster.predict(db, device_id, "light") is None
+    finally:
+        delete_device(db, device_id)
+
+
+def test_forecaster_reloads_states_written_elsewhere(db: Session) -> None:
+    device_id = create_random_device(db).id
+    ts_ms = 1_700_000_000_000 + np.arange(10) * 1000
+    values = {metric: np.arange(10, dtype=float) for metric in METRICS}
+    writer = make_forecaster(persist_interval=0)
+    reader = make_forecaster(persist_interval=0)
+
+    try:
+        store_reading_arrays(
+            db, device_id, ts_ms[:5], {m: v[:5] for m, v in values.items()}
+        )
+        db.commit()
+        writer.get_states(db, device_id)
+        assert reader.get_states(db, device_id)["humidity"].count == 5
+
+        store_reading_arrays(
+            db, device_id, ts_ms[5:], {m: v[5:] for m, v in values.items()}
+        )
+        db.commit()
+        writer.update(device_id, ts_ms[5:], {m: v[5:] for m, v in values.items()})
+        # Unchanged persisted version, the reader keeps what it has
+        assert reader.get_states(db, device_id)["humidity"].count == 5
+        writer.flush()
+        assert reader.get_states(db, device_id)["humidity"].count == 10
+    finally:
+        delete_device(db, device_id)
+
+
+def test_forecaster_evicts_least_recently_used_clean_states(db: Session) -> None:
+    devices = [create_random_device(db).id for _ in range(3)]
+    cache = make_forecaster(max_devices=2)
+    try:
+        for device_id in devices:
+            cache.get_states(db, device_id)
+        assert list(cache._models) == devices[1:]
+        cache.update(devices[1], np.array([1]), {m: np.array([1.0]) for m in METRICS})
+        cache.get_states(db, devices[2])
+        cache.get_states(db, devices[0])
+        # devices[1] is dirty so it stays even though least recently used
+        assert set(cache._models) == {devices[0], devices[1]}
+    finally:
+        for device_id in devices:
+            delete_device(db, device_id)
@@ -0,0 +1,41 @@
+import asyncio
+
+from app.core.hub import Hub, sse_event
+
+
+def test_publish_fans_out_to_topic_subscribers() -> None:
+    async def run() -> None:
+        hub = Hub()
+        first, second, other = (
+            hub.subscribe("a"),
+            hub.subscribe("a"),
+            hub.subscribe("b"),
+        )
+        assert hub.publish("a", "hello") == 2
+        assert await first.get() == "hello"
+        assert await second.get() == "hello"
+        assert other.queue.empty()
+        first.close()
+        second.close()
+        assert not hub.has_subscribers("a")
+        assert hub.publish("a", "nobody") == 0
+        assert hub.subscriber_count() == 1
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_drops_oldest_messages() -> None:
+    async def run() -> None:
+        hub = Hub(max_queue=2)
+        with hub.subscribe("a") as subscription:
+            for message in ["1", "2", "3"]:
+                hub.publish("a", message)
+            assert subscription.dropped == 1
+            assert [await subscription.get(), await subscription.get()] == ["2", "3"]
+        assert hub.subscriber_count("a") == 0
+
+    asyncio.run(run())
+
+
+def test_sse_event() -> None:
+    assert sse_event("reading", '{"a": 1}') == 'event: reading\ndata: {"a": 1}\n\n'
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+from sqlmodel import Session, delete, select
+
+from app import crud
+from app.core.coreiot import CoreIoTClient
+from app.core.hub import reading_hub
+from app.core.ingest import CoreIoTIngestor, reading_json, store_reading_arrays
+from app.models import (
+    METRICS,
+    AlarmCreate,
+    AlarmDeviceState,
+    CoreIoTData,
+    DeviceCreate,
+    Notification,
+)
+from app.tests.utils.coreiot import StubCoreIoT, stub_coreiot_server
+from app.tests.utils.device import create_random_device, delete_device
+from app.tests.utils.user import create_random_user
+
+DEVICE_ID = "00000000-0000-0000-0000-00000000c0de"
+
+
+def make_ingestor(stub: StubCoreIoT) -> CoreIoTIngestor:
+    client = CoreIoTClient(
+        base_url=stub.base_url,
+        timeout=1,
+        max_connections=2,
+        max_concurrency=2,
+        retries=0,
+        backoff=0,
+    )
+    return CoreIoTIngestor(
+        client=client,
+        device_ids=[DEVICE_ID],
+        poll_interval=0.01,
+        batch_size=1000,
+        flush_interval=60,
+        access_token="stub-token",
+    )
+
+
+async def wait_for(condition, timeout: float = 2.0) -> None:  # type: ignore[no-untyped-def]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_ingestor_caches_and_batches_readings(db: Session) -> None:
+    user = create_random_user(db)
+    alarm = crud.create_alarm(
+        session=db,
+        alarm_create=AlarmCreate(type="temperature", threshold_type="above", value=30),
+        user_id=user.id,
+    )
+    crud.create_device(
+        session=db,
+        device_in=DeviceCreate(id=uuid.UUID(DEVICE_ID), name="stub"),
+        user_id=user.id,
+    )
+
+    async def run(stub: StubCoreIoT) -> CoreIoTIngestor:
+        ingestor = make_ingestor(stub)
+        await ingestor.start()
+        try:
+            await wait_for(lambda: ingestor.get_latest(DEVICE_ID) is not None)
+            stub.set_reading(temperature=35.5)
+            await wait_for(
+                lambda: ingestor.get_latest(DEVICE_ID).temperature == 35.5  # type: ignore[union-attr]
+            )
+        finally:
+            await ingestor.stop()
+            await ingestor.client.aclose()
+        return ingestor
+
+    with stub_coreiot_server() as stub:
+        ingestor = asyncio.run(run(stub))
+        polls = len(stub.requests)
+
+    # Unchanged readings are cached but only stored once
+    assert polls > 2
+    assert stub.requests[0]["authorization"] == "Bearer stub-token"
+    latest = ingestor.get_latest(DEVICE_ID)
+    assert latest is not None and latest.temperature == 35.5
+
+    rows = db.exec(
+        select(CoreIoTData).where(CoreIoTData.timestamp >= latest.timestamp)
+    ).all()
+    assert [row.temperature for row in rows] == [35.5]
+
+    notifications = db.exec(
+        select(Notification).where(Notification.alarm_id == alarm.id)
+    ).all()
+    assert len(notifications) == 1
+    assert "above 30" in notifications[0].message
+
+    db.exec(delete(Notification).where(Notification.alarm_id == alarm.id))  # type: ignore
+    db.commit()
+    crud.delete_alarm(db, db_alarm=alarm)
+    delete_device(db, uuid.UUID(DEVICE_ID))
+
+
+def test_only_the_lock_holder_polls(db: Session) -> None:  # noqa: ARG001
+    async def run(stub: StubCoreIoT) -> None:
+        first, second = make_ingestor(stub), make_ingestor(stub)
+        await first.start()
+        await wait_for(lambda: first.polls(DEVICE_ID))
+        await second.start()
+        try:
+            await asyncio.sleep(0.1)
+            assert first.leading and not second.leading
+            assert not second.polls(DEVICE_ID)
+            # Stopping releases the lock rather than pooling its connection
+            await first.stop()
+            await wait_for(lambda: second.polls(DEVICE_ID))
+        finally:
+            await first.stop()
+            await second.stop()
+            await first.client.aclose()
+            await second.client.aclose()
+
+    with (
+        patch("app.core.ingest.LEADER_CHECK_SECONDS", 0.01),
+        stub_coreiot_server() as stub,
+    ):
+        asyncio.run(run(stub))
+
+
+def test_readings_relayed_by_the_leader_reach_streams() -> None:
+    async def run() -> None:
+        ingestor = CoreIoTIngestor(
+            client=CoreIoTClient(
+                base_url="http://coreiot.invalid",
+                timeout=1,
+                max_connections=1,
+                max_concurrency=1,
+                retries=0,
+                backoff=0,
+            ),
+            device_ids=[DEVICE_ID],
+            poll_interval=60,
+            batch_size=1000,
+            flush_interval=60,
+            relay=True,
+        )
+        reading = CoreIoTData(
+            temperature=21.5, humidity=40, light=100, timestamp=datetime(2024, 1, 1)
+        )
+        with reading_hub.subscribe(DEVICE_ID) as subscription:
+            ingestor.relayed(f"{DEVICE_ID} {reading_json(reading)}")
+            assert json.loads(await subscription.get())["temperature"] == 21.5
+            # Its own relayed readings are no longer new to the leader
+            ingestor.relayed(f"{DEVICE_ID} {reading_json(reading)}")
+            assert subscription.queue.empty()
+        latest = ingestor.get_latest(DEVICE_ID)
+        assert latest is not None and latest.temperature == 21.5
+        assert not ingestor._buffer
+        await ingestor.client.aclose()
+
+    asyncio.run(run())
+
+
+def test_alarms_only_see_linked_devices(db: Session) -> None:
+    user = create_random_user(db)
+    alarm = crud.create_alarm(
+        session=db,
+        alarm_create=AlarmCreate(type="light", threshold_type="above", value=500),
+        user_id=user.id,
+    )
+    linked = create_random_device(db, user_id=user.id)
+    other = create_random_device(db)
+    ts_ms = np.array([1_700_000_000_000])
+    values = {metric: np.array([1000.0]) for metric in METRICS}
+
+    try:
+        store_reading_arrays(db, other.id, ts_ms, values)
+        db.commit()
+        store_reading_arrays(db, linked.id, ts_ms, values)
+        db.commit()
+        notifications = db.exec(
+            select(Notification).where(Notification.alarm_id == alarm.id)
+        ).all()
+        assert len(notifications) == 1
+    finally:
+        db.exec(delete(Notification).where(Notification.alarm_id == alarm.id))  # type: ignore
+        db.commit()
+        crud.delete_alarm(db, db_alarm=alarm)
+        delete_device(db, linked.id)
+        delete_device(db, other.id)
+
+
+def test_sustained_breach_notifies_once(db: Session) -> None:
+    user = create_random_user(db)
+    alarm = crud.create_alarm(
+        session=db,
+        alarm_create=AlarmCreate(
+            type="humidity", threshold_type="below", value=20, hysteresis=5
+        ),
+        user_id=user.id,
+    )
+    device_id = create_random_device(db, user_id=user.id).id
+    start = 1_700_000_000_000
+
+    def store(offset: int, humidity: list[float]) -> None:
+        ts_ms = start + (offset + np.arange(len(humidity))) * 1000
+        values = {metric: np.full(len(humidity), 1.0) for metric in METRICS}
+        values["humidity"] = np.array(humidity)
+        store_reading_arrays(db, device_id, ts_ms, values)
+        db.commit()
+
+    try:
+        store(0, [30, 10, 12, 15])
+        store(4, [22, 10, 26, 10])
+        db.refresh(alarm)
+        notifications = db.exec(
+            select(Notification).where(Notification.alarm_id == alarm.id)
+        ).all()
+        # 22 is within the hysteresis band, 26 clears the alarm
+        assert len(notifications) == 2
+        assert alarm.is_firing
+        state = db.get(AlarmDeviceState, (alarm.id, device_id))
+        assert state is not None and state.is_firing and state.pending_since is None
+    finally:
+        db.exec(delete(Notification).where(Notification.alarm_id == alarm.id))  # type: ignore
+        db.commit()
+        crud.delete_alarm(db, db_alarm=alarm)
+        delete_device(db, device_id)
+
+
+def test_alarm_state_is_kept_per_device(db: Session) -> None:
+    user = create_random_user(db)
+    alarm = crud.create_alarm(
+        session=db,
+        alarm_create=AlarmCreate(type="temperature", threshold_type="above", value=30),
+        user_id=user.id,
+    )
+    first = create_random_device(db, user_id=user.id).id
+    second = create_random_device(db, user_id=user.id).id
+    start = 1_700_000_000_000
+
+    def store(device_id: uuid.UUID, offset: int, temperature: list[float]) -> int:
+        ts_ms = start + (offset + np.arange(len(temperature))) * 1000
+        values = {metric: np.full(len(temperature), 1.0) for metric in METRICS}
+        values["temperature"] = np.array(temperature)
+        store_reading_arrays(db, device_id, ts_ms, values)
+        db.commit()
+        return len(
+            db.exec(select(Notification).where(Notification.alarm_id == alarm.id)).all()
+        )
+
+    try:
+        assert store(first, 0, [35, 36]) == 1
+        # Normal readings of the second device neither clear the first one's
+        # excursion nor let it fire again
+        assert store(second, 0, [20, 21]) == 1
+        assert store(first, 2, [37, 38]) == 1
+        db.refresh(alarm)
+        assert alarm.is_firing
+
+        assert store(second, 2, [40]) == 2
+        store(first, 4, [10])
+        db.refresh(alarm)
+        assert alarm.is_firing
+        store(second, 3, [10])
+        db.refresh(alarm)
+        assert not alarm.is_firing
+        assert alarm.last_fired_at is not None
+    finally:
+        db.exec(delete(Notification).where(Notification.alarm_id == alarm.id))  # type: ignore
+        db.commit()
+        crud.delete_alarm(db, db_alarm=alarm)
+        delete_device(db, first)
+        delete_device(db, second)
+
+
+def test_devices_are_polled_with_their_users_tokens() -> None:
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    owners = {
+        first: (uuid.uuid4(), "first-token"),
+        second: (uuid.uuid4(), "second-token"),
+    }
+    loads = []
+
+    def token_provider() -> dict[str, tuple[uuid.UUID, str]]:
+        loads.append(1)
+        return owners
+
+    async def run(stub: StubCoreIoT) -> None:
+        ingestor = make_ingestor(stub)
+        ingestor.access_token = None
+        ingestor.token_provider = token_provider
+        try:
+            await asyncio.gather(
+                ingestor.poll_device(first), ingestor.poll_device(second)
+            )
+            # Devices without a linked user holding a token are not polled
+            assert await ingestor.poll_device(str(uuid.uuid4())) is None
+        finally:
+            await ingestor.client.aclose()
+
+    with stub_coreiot_server() as stub:
+        asyncio.run(run(stub))
+
+    tokens = {
+        device_id: request["authorization"]
+        for request in stub.requests
+        for device_id in (first, second)
+        if device_id in request["path"]
+    }
+    assert tokens == {first: "Bearer first-token", second: "Bearer second-token"}
+    assert len(stub.requests) == 2
+    assert len(loads) == 1
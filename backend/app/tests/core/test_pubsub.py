@@ -0,0 +1,34 @@
+import asyncio
+import json
+
+from app.core.hub import Hub
+from app.core.pubsub import MAX_PAYLOAD_BYTES, deliver, split_payloads
+
+
+def test_payloads_stay_under_notify_limit() -> None:
+    lines = [f"user-{i} " + "x" * 1000 for i in range(20)]
+    payloads = list(split_payloads(lines))
+    assert len(payloads) > 1
+    assert all(len(p.encode()) <= MAX_PAYLOAD_BYTES for p in payloads)
+    assert "\n".join(payloads).splitlines() == lines
+
+
+def test_deliver_routes_lines_to_user_topics() -> None:
+    async def run() -> None:
+        hub = Hub()
+        with hub.subscribe("alice") as alice, hub.subscribe("bob") as bob:
+            deliver('alice {"message": "a"}\nbob {"message": "b"}', hub)
+            assert json.loads(await alice.get()) == {"message": "a"}
+            assert json.loads(await bob.get()) == {"message": "b"}
+
+    asyncio.run(run())
+
+
+def test_publish_threadsafe_from_worker_thread() -> None:
+    async def run() -> None:
+        hub = Hub()
+        with hub.subscribe("alice") as alice:
+            await asyncio.to_thread(hub.publish_threadsafe, "alice", "hi")
+            assert await asyncio.wait_for(alice.get(), 1) == "hi"
+
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+import numpy as np
+from sqlmodel import Session
+
+from app.core.forecast import Forecaster, forecaster
+from app.core.ingest import store_reading_arrays
+from app.core.tuning import ALPHAS, BETAS, ForecastTuner, fit_parameters
+from app.models import METRICS
+from app.tests.utils.device import create_random_device, delete_device
+
+
+def test_fit_parameters_smooths_noise_and_follows_trends() -> None:
+    rng = np.random.default_rng(0)
+    assert fit_parameters(np.ones(10)) is None
+
+    alpha, beta = fit_parameters(10 + rng.normal(0, 1, 500))  # type: ignore[misc]
+    assert alpha in ALPHAS and beta in BETAS
+    assert alpha <= 0.2
+    # A random walk is best forecast by its latest value
+    alpha, _ = fit_parameters(np.cumsum(rng.normal(0, 1, 500)))  # type: ignore[misc]
+    assert alpha >= 0.8
+
+
+def test_tune_stores_parameters_once_per_interval(db: Session) -> None:
+    device_id = create_random_device(db).id
+    ts_ms = 1_700_000_000_000 + np.arange(100) * 1000
+    rng = np.random.default_rng(1)
+    values = {metric: np.cumsum(rng.normal(0, 1, 100)) for metric in METRICS}
+    tuner = ForecastTuner(interval=3600, window=100, max_workers=1, max_queue=10)
+    try:
+        store_reading_arrays(db, device_id, ts_ms, values)
+        db.commit()
+        assert tuner.tune(device_id, "temperature") is None
+        forecaster.get_states(db, device_id)
+        forecaster.flush()
+
+        params = tuner.tune(device_id, "temperature")
+        assert params == fit_parameters(values["temperature"])
+        assert tuner.tune(device_id, "temperature") is None
+        assert (device_id, "temperature") not in tuner._due()
+        assert (device_id, "humidity") in tuner._due()
+        assert tuner.submit(device_id, "humidity")
+        assert not tuner.submit(device_id, "humidity")
+
+        fresh = Forecaster(
+            alpha=forecaster.alpha,
+            beta=forecaster.beta,
+            warmup=10,
+            persist_interval=60,
+            max_devices=10,
+        )
+        assert fresh.get_params(db, device_id)["temperature"] == params
+        assert fresh.get_params(db, device_id)["humidity"] == (
+            forecaster.alpha,
+            forecaster.beta,
+        )
+    finally:
+        delete_device(db, device_id)
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core.hub import notification_hub
+from app.core.notifications import NotificationQueue, RetentionJob
+from app.models import Notification, NotificationArchive, NotificationCreate
+from app.tests.utils.user import create_random_user
+
+
+def test_create_notifications(db: Session) -> None:
+    user = create_random_user(db)
+    notifications = [
+        NotificationCreate(message=f"note {i}", user_id=user.id) for i in range(3)
+    ]
+    ids = crud.create_notifications(session=db, notifications=notifications)
+    db.commit()
+    assert len(set(ids)) == 3
+    stored = db.exec(select(Notification).where(col(Notification.id).in_(ids))).all()
+    assert sorted(n.message for n in stored) == ["note 0", "note 1", "note 2"]
+    assert all(n.user_id == user.id and not n.is_read for n in stored)
+    db.exec(delete(Notification).where(col(Notification.id).in_(ids)))  # type: ignore
+    db.commit()
+
+
+def test_create_notifications_empty(db: Session) -> None:
+    assert crud.create_notifications(session=db, notifications=[]) == []
+
+
+def test_notification_queue_batches_writes(db: Session) -> None:
+    user = create_random_user(db)
+    queue = NotificationQueue(batch_size=3, flush_interval=60, max_pending=10)
+
+    def stored() -> int:
+        return len(
+            db.exec(select(Notification).where(Notification.user_id == user.id)).all()
+        )
+
+    async def run() -> None:
+        await queue.start()
+        try:
+            queue.put([NotificationCreate(message="a", user_id=user.id)] * 2)
+            assert stored() == 0 and len(queue) == 2
+            queue.put([NotificationCreate(message="b", user_id=user.id)])
+            assert stored() == 3 and len(queue) == 0
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
+    db.exec(delete(Notification).where(Notification.user_id == user.id))  # type: ignore
+    db.commit()
+
+
+def test_create_notification_publishes_after_commit(db: Session) -> None:
+    user = create_random_user(db)
+
+    async def run() -> Notification:
+        with notification_hub.subscribe(str(user.id)) as subscription:
+            notification = crud.create_notification(
+                session=db,
+                notification_create=NotificationCreate(message="hot", user_id=user.id),
+            )
+            message = await asyncio.wait_for(subscription.get(), 1)
+        assert f'"id":"{notification.id}"' in message
+        return notification
+
+    notification = asyncio.run(run())
+    assert crud.delete_notification(db, notification.id, user.id)
+
+
+def test_set_based_read_and_delete_are_scoped_to_user(db: Session) -> None:
+    user = create_random_user(db)
+    other = create_random_user(db)
+    ids = crud.create_notifications(
+        session=db,
+        notifications=[NotificationCreate(message="n", user_id=user.id)] * 3,
+    )
+    db.commit()
+
+    assert crud.mark_notification_read(db, ids[0], other.id) is None
+    read = crud.mark_notification_read(db, ids[0], user.id)
+    assert read is not None and read.is_read
+    assert crud.mark_notifications_read(db, other.id, ids) == 0
+    assert crud.mark_notifications_read(db, user.id, ids[:2]) == 1
+    assert crud.count_unread_notifications(db, user.id) == 1
+    assert crud.mark_all_notifications_read(db, user.id) == 1
+    assert crud.count_unread_notifications(db, user.id) == 0
+
+    assert not crud.delete_notification(db, ids[0], other.id)
+    assert crud.delete_notification(db, ids[0], user.id)
+    assert crud.delete_notifications(db, user.id, ids) == 2
+
+
+def test_retention_job_archives_old_notifications_in_batches(db: Session) -> None:
+    user = create_random_user(db)
+    # Run the job as of ten years ago so only these rows are old enough
+    now = datetime.utcnow() - timedelta(days=3650)
+    old = [
+        Notification(message="old", user_id=user.id, created_at=now - timedelta(days=2))
+        for _ in range(5)
+    ]
+    recent = Notification(message="recent", user_id=user.id, created_at=now)
+    db.add_all([*old, recent])
+    db.commit()
+    old_ids = [n.id for n in old]
+
+    job = RetentionJob(retention_days=1, batch_size=2, interval=60, archive=True)
+    assert job.run_once(now=now) == 5
+    remaining = db.exec(
+        select(Notification).where(Notification.user_id == user.id)
+    ).all()
+    assert [n.message for n in remaining] == ["recent"]
+    archived = db.exec(
+        select(NotificationArchive).where(col(NotificationArchive.id).in_(old_ids))
+    ).all()
+    assert len(archived) == 5
+
+    db.exec(delete(NotificationArchive).where(col(NotificationArchive.id).in_(old_ids)))  # type: ignore
+    db.exec(delete(Notification).where(Notification.user_id == user.id))  # type: ignore
+    db.commit()
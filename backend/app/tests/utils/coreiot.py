@@ -0,0 +1,77 @@
+import json
+import threading
+from collections.abc import Generator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+class StubCoreIoT:
+    """
+    Minimal stand-in for the CoreIoT telemetry API, serving whatever reading
+    was last set through `set_reading`.
+    """
+
+    def __init__(self) -> None:
+        self.reading: dict[str, float] = {
+            "temperature": 25.0,
+            "humidity": 60.0,
+            "light": 300.0,
+        }
+        self.ts = 1_700_000_000_000
+        self.requests: list[dict[str, Any]] = []
+        self.base_url = ""
+
+    def set_reading(self, **values: float) -> None:
+        self.reading.update(values)
+        self.ts += 1000
+
+    def payload(self) -> dict[str, Any]:
+        return {
+            key: [{"ts": self.ts, "value": str(value)}]
+            for key, value in self.reading.items()
+        }
+
+
+@contextmanager
+def stub_coreiot_server() -> Generator[StubCoreIoT, None, None]:
+    stub = StubCoreIoT()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _record(self) -> None:
+            stub.requests.append(
+                {
+                    "method": self.command,
+                    "path": self.path,
+                    "authorization": self.headers.get("X-Authorization"),
+                }
+            )
+
+        def do_GET(self) -> None:
+            self._record()
+            body = json.dumps(stub.payload()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:
+            self._record()
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *_args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    stub.base_url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield stub
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,21 @@
+import uuid
+
+from sqlmodel import Session, delete
+
+from app import crud
+from app.models import Device, DeviceCreate
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_device(db: Session, user_id: uuid.UUID | None = None) -> Device:
+    if user_id is None:
+        user_id = create_random_user(db).id
+    device_in = DeviceCreate(id=uuid.uuid4(), name=random_lower_string())
+    return crud.create_device(session=db, device_in=device_in, user_id=user_id)
+
+
+def delete_device(db: Session, device_id: uuid.UUID) -> None:
+    # Readings, rollups and links go with it
+    db.exec(delete(Device).where(Device.id == device_id))  # type: ignore
+    db.commit()
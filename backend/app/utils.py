@@ -1,4 +1,8 @@
+import base64
+import hashlib
 import logging
+import re
+import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -6,8 +10,10 @@ from typing import Any
 
 import emails  # type: ignore
 import jwt
+from fastapi import Request, Response
 from jinja2 import Template
 from jwt.exceptions import InvalidTokenError
+from pydantic import BaseModel
 
 from app.core import security
 from app.core.config import settings
@@ -121,3 +127,52 @@ def verify_password_reset_token(token: str) -> str | None:
         return str(decoded_token["sub"])
     except InvalidTokenError:
         return None
+
+
+def encode_cursor(timestamp: datetime, id: uuid.UUID) -> str:
+    """
+    Opaque keyset pagination cursor for a (timestamp, id) position.
+    """
+    raw = f"{timestamp.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID] | None:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(timestamp), uuid.UUID(id)
+    except ValueError:
+        return None
+
+
+def encode_snapshot_cursor(snapshot: str) -> str:
+    """
+    Opaque cursor for a Postgres snapshot, "xmin:xmax:xip,...".
+    """
+    return base64.urlsafe_b64encode(snapshot.encode()).decode().rstrip("=")
+
+
+def decode_snapshot_cursor(cursor: str) -> str | None:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        snapshot = base64.urlsafe_b64decode(padded).decode()
+    except ValueError:
+        return None
+    if not re.fullmatch(r"\d+:\d+:(\d+(,\d+)*)?", snapshot):
+        return None
+    return snapshot
+
+
+def etag_response(request: Request, content: BaseModel) -> Response:
+    """
+    JSON response with an ETag, or an empty 304 when the client's
+    If-None-Match already has it, so unchanged polls transfer no body.
+    """
+    body = content.model_dump_json().encode()
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,101 @@
+"""
+Alarm evaluation cost: the former per-reading scan over every active alarm
+against the sorted index, both per reading (bisect) and for a whole batch
+(one NumPy pass). The scan is timed on a sample of readings and
+extrapolated, since it is quadratic in the sizes benchmarked here.
+
+    python benchmarks/alarm_engine.py --alarms 100000 --readings 10000
+"""
+
+import argparse
+import random
+import time
+import uuid
+
+import numpy as np
+
+from app.core.alarm_engine import AlarmIndex, AlarmRule
+from app.models import METRICS
+
+
+def scan(rules: list[AlarmRule], reading: dict[str, float]) -> int:
+    tripped = 0
+    for rule in rules:
+        value = reading[rule.type]
+        if rule.threshold_type == "above" and value > rule.value:
+            tripped += 1
+        elif rule.threshold_type == "below" and value < rule.value:
+            tripped += 1
+    return tripped
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alarms", type=int, default=100_000)
+    parser.add_argument("--readings", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--scan-sample", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    users = [uuid.uuid4() for _ in range(args.users)]
+    ranges = {"temperature": (15, 35), "humidity": (20, 90), "light": (0, 1000)}
+    rules = []
+    for _ in range(args.alarms):
+        metric = rng.choice(METRICS)
+        low, high = ranges[metric]
+        threshold_type = rng.choice(["above", "below"])
+        # Thresholds guard the edges of the normal range, as real alarms do
+        edge = high if threshold_type == "above" else low
+        value = edge + rng.uniform(-0.1, 0.1) * (high - low)
+        rules.append(
+            AlarmRule(uuid.uuid4(), rng.choice(users), metric, threshold_type, value)
+        )
+    np_rng = np.random.default_rng(0)
+    values = {
+        metric: np_rng.normal((low + high) / 2, (high - low) / 6, args.readings)
+        for metric, (low, high) in ranges.items()
+    }
+    readings = [
+        {metric: float(values[metric][i]) for metric in METRICS}
+        for i in range(args.readings)
+    ]
+
+    started = time.perf_counter()
+    index = AlarmIndex(rules)
+    build = time.perf_counter() - started
+
+    sample = readings[: args.scan_sample]
+    started = time.perf_counter()
+    scanned = sum(scan(rules, reading) for reading in sample)
+    scan_time = (time.perf_counter() - started) / len(sample) * args.readings
+
+    started = time.perf_counter()
+    bisected = sum(
+        len(index.tripped(metric, reading[metric]))
+        for reading in readings
+        for metric in METRICS
+    )
+    bisect_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    tripped = index.evaluate_batch(values)
+    batch_time = time.perf_counter() - started
+
+    checked = sum(
+        len(index.tripped(metric, reading[metric]))
+        for reading in sample
+        for metric in METRICS
+    )
+    assert checked == scanned, "index disagrees with the linear scan"
+    print(
+        f"{args.alarms} alarms x {args.readings} readings, {len(tripped.rules)} matches"
+    )
+    print(f"index build:          {build * 1000:10.1f} ms")
+    print(f"linear scan (extrap): {scan_time * 1000:10.1f} ms")
+    print(f"bisect per reading:   {bisect_time * 1000:10.1f} ms  ({bisected} matches)")
+    print(f"numpy batch:          {batch_time * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Per-request cost of authenticating a bearer token: decoding the JWT and
+loading the user with session.get, as every request used to, against
+serving the user from the in-memory cache.
+
+    python benchmarks/auth_user_cache.py --requests 5000
+"""
+
+import argparse
+from datetime import timedelta
+
+from sqlalchemy import event
+from sqlmodel import Session
+from utils import timed
+
+from app import crud
+from app.api.deps import get_user_from_token
+from app.core.cache import user_cache
+from app.core.config import settings
+from app.core.db import engine
+from app.core.security import create_access_token
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=settings.FIRST_SUPERUSER)
+        assert user is not None
+        token = create_access_token(user.id, expires_delta=timedelta(minutes=5))
+
+    queries = 0
+
+    def count(*_: object) -> None:
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+
+    def authenticate(cached: bool) -> None:
+        if not cached:
+            user_cache.clear()
+        # A session per request, as the SessionDep dependency opens
+        with Session(engine) as session:
+            get_user_from_token(session, token)
+
+    for name, cached in (("session.get", False), ("cached", True)):
+        queries = 0
+        ms = timed(lambda cached=cached: authenticate(cached), args.requests)
+        print(
+            f"{name:>12}: {ms * 1000:8.1f} µs median, "
+            f"{queries / args.requests:.2f} queries per request"
+        )
+
+
+if __name__ == "__main__":
+    main()
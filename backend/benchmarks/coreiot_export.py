@@ -0,0 +1,70 @@
+"""
+Throughput and peak memory of the /coreiot/export writers.
+
+Seeds `--rows` readings for a throwaway device, drains the same generator
+the endpoint streams from and reports rows/sec and the peak RSS of this
+process, which should stay flat as `--rows` grows.
+
+    python benchmarks/coreiot_export.py --rows 10000000 --format csv
+"""
+
+import argparse
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlmodel import Session
+from utils import delete_readings, peak_rss_mb, seed_readings
+
+from app import crud
+from app.core.db import engine
+from app.core.export import WRITERS
+from app.core.rollups import EPOCH
+from app.models import METRICS
+
+SEED_CHUNK = 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=list(WRITERS), default="ndjson")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    device_id = uuid.uuid4()
+    metrics = list(METRICS)
+    with Session(engine) as session:
+        try:
+            for start in range(0, args.rows, SEED_CHUNK):
+                seed_readings(
+                    session, device_id, start, min(start + SEED_CHUNK, args.rows)
+                )
+            rss_before = peak_rss_mb()
+
+            started = time.perf_counter()
+            size = 0
+            batches = crud.iter_readings(
+                session,
+                device_id=device_id,
+                start=EPOCH,
+                end=datetime.now(timezone.utc),
+                metrics=metrics,
+                batch_size=args.batch_size,
+            )
+            for chunk in WRITERS[args.format](batches, metrics):
+                size += len(chunk)
+            elapsed = time.perf_counter() - started
+        finally:
+            session.rollback()
+            delete_readings(session, device_id)
+
+    print(f"format:        {args.format}")
+    print(f"rows:          {args.rows}")
+    print(f"bytes:         {size}")
+    print(f"rows/sec:      {args.rows / elapsed:,.0f}")
+    print(f"peak RSS MB:   {peak_rss_mb():.1f} (before export {rss_before:.1f})")
+
+
+if __name__ == "__main__":
+    main()
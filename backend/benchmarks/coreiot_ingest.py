@@ -0,0 +1,81 @@
+"""
+Throughput of POST /coreiot/ingest: parsing plus vectorized validation of
+a JSON payload, then the COPY-based write with deduplication and rollups.
+
+    python benchmarks/coreiot_ingest.py --rows 100000 --requests 10
+"""
+
+import argparse
+import json
+import time
+import uuid
+
+from sqlmodel import Session
+from utils import create_device, delete_readings
+
+from app.core.db import engine
+from app.core.ingest import parse_bulk_readings, store_reading_arrays
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rows", type=int, default=100_000, help="readings per request"
+    )
+    parser.add_argument("--requests", type=int, default=5)
+    args = parser.parse_args()
+
+    device_id = uuid.uuid4()
+    base = int(time.time() * 1000) - args.rows * args.requests * 1000
+    parse_time = write_time = 0.0
+    inserted = 0
+    with Session(engine) as session:
+        create_device(session, device_id)
+        try:
+            for n in range(args.requests):
+                offset = base + n * args.rows * 1000
+                body = json.dumps(
+                    [
+                        {
+                            "ts": offset + i * 1000,
+                            "temperature": 21.5,
+                            "humidity": 40.0,
+                            "light": 300.0,
+                        }
+                        for i in range(args.rows)
+                    ]
+                ).encode()
+
+                started = time.perf_counter()
+                ts_ms, values = parse_bulk_readings(
+                    body, ndjson=False, max_readings=args.rows
+                )
+                parse_time += time.perf_counter() - started
+
+                started = time.perf_counter()
+                inserted += store_reading_arrays(
+                    session, device_id, ts_ms, values, alarms_on_latest_only=True
+                )
+                session.commit()
+                write_time += time.perf_counter() - started
+
+            # Re-sending the last request must not insert anything
+            started = time.perf_counter()
+            duplicates = store_reading_arrays(session, device_id, ts_ms, values)
+            session.commit()
+            dedup_time = time.perf_counter() - started
+        finally:
+            session.rollback()
+            delete_readings(session, device_id)
+
+    total = args.rows * args.requests
+    print(f"readings:            {total}")
+    print(f"inserted:            {inserted}")
+    print(f"parse+validate r/s:  {total / parse_time:,.0f}")
+    print(f"write r/s:           {total / write_time:,.0f}")
+    print(f"end-to-end r/s:      {total / (parse_time + write_time):,.0f}")
+    print(f"duplicate resend:    {duplicates} inserted in {dedup_time * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Latency of the /coreiot/daily-data and /coreiot/predict-next queries as the
+coreiotdata table grows.
+
+Rows are generated server side with one reading per second going back from
+now, for a throwaway device id, and removed again at the end.
+
+    python benchmarks/coreiot_queries.py --sizes 10000,1000000,50000000
+"""
+
+import argparse
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session
+from utils import delete_readings, seed_readings, timed
+
+from app import crud
+from app.core.db import engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    device_id = uuid.uuid4()
+    seeded = 0
+    print(f"{'rows':>12} {'daily-data ms':>14} {'daily rows':>11} {'predict ms':>11}")
+    with Session(engine) as session:
+        try:
+            for size in sizes:
+                seed_readings(session, device_id, seeded, size)
+                seeded = size
+
+                now = datetime.now(timezone.utc)
+                daily_rows = len(
+                    crud.get_readings_between(
+                        session,
+                        device_id=device_id,
+                        start=now - timedelta(days=1),
+                        end=now,
+                    )
+                )
+                daily_ms = timed(
+                    lambda now=now: crud.get_readings_between(
+                        session,
+                        device_id=device_id,
+                        start=now - timedelta(days=1),
+                        end=now,
+                    ),
+                    args.repeat,
+                )
+                predict_ms = timed(
+                    lambda: crud.get_latest_readings(
+                        session, device_id=device_id, limit=20
+                    ),
+                    args.repeat,
+                )
+                session.expunge_all()
+                print(
+                    f"{size:>12} {daily_ms:>14.2f} {daily_rows:>11} {predict_ms:>11.3f}"
+                )
+        finally:
+            delete_readings(session, device_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Load test of the live reading stream.
+
+`hub` mode measures the in-process fan-out alone: how long a published
+reading takes to reach N subscriber tasks, and the memory each holds.
+
+`http` mode opens N EventSource-style connections to a running backend's
+/coreiot/stream and reports how many it holds and, per reading, the spread
+between the first and the last connection receiving it.
+
+    python benchmarks/coreiot_stream.py hub --subscribers 10000
+    python benchmarks/coreiot_stream.py http --url http://localhost:8000 \\
+        --token <access token> --connections 1000 --seconds 30
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from utils import peak_rss_mb
+
+from app.core.hub import Hub
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return (
+        statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+    )
+
+
+async def hub_mode(args: argparse.Namespace) -> None:
+    hub = Hub()
+    received: list[float] = []
+    rss_before = peak_rss_mb()
+
+    async def consume(subscription) -> None:  # type: ignore[no-untyped-def]
+        for _ in range(args.messages):
+            sent = float(await subscription.get())
+            received.append(time.perf_counter() - sent)
+
+    subscriptions = [hub.subscribe("device") for _ in range(args.subscribers)]
+    tasks = [asyncio.create_task(consume(s)) for s in subscriptions]
+    await asyncio.sleep(0)
+    rss = peak_rss_mb() - rss_before
+    fanout = []
+    for _ in range(args.messages):
+        started = time.perf_counter()
+        hub.publish("device", repr(started))
+        fanout.append(time.perf_counter() - started)
+        await asyncio.sleep(args.interval)
+    await asyncio.gather(*tasks)
+
+    latencies = [s * 1000 for s in received]
+    print(f"{args.subscribers} subscribers, {args.messages} messages")
+    print(f"publish call:     {statistics.median(fanout) * 1000:8.2f} ms median")
+    print(
+        f"delivery latency: {percentile(latencies, 50):8.2f} ms p50, {percentile(latencies, 99):8.2f} ms p99"
+    )
+    print(f"memory:           {rss * 1024 / args.subscribers:8.2f} KiB per subscriber")
+
+
+async def http_mode(args: argparse.Namespace) -> None:
+    arrivals: dict[str, list[float]] = {}
+    connected = 0
+    limits = httpx.Limits(max_connections=args.connections)
+    timeout = httpx.Timeout(10, read=None)
+
+    async def listen(client: httpx.AsyncClient) -> None:
+        nonlocal connected
+        params = {"token": args.token}
+        async with client.stream("GET", "/api/v1/coreiot/stream", params=params) as r:
+            r.raise_for_status()
+            connected += 1
+            async for line in r.aiter_lines():
+                if line.startswith("data: "):
+                    arrivals.setdefault(line, []).append(time.perf_counter())
+
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=timeout
+    ) as client:
+        tasks = [asyncio.create_task(listen(client)) for _ in range(args.connections)]
+        await asyncio.sleep(args.seconds)
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    failed = [r for r in results if not isinstance(r, asyncio.CancelledError)]
+    spreads = [
+        (max(times) - min(times)) * 1000
+        for times in arrivals.values()
+        if len(times) == connected
+    ]
+    print(f"connections held: {connected} of {args.connections} ({len(failed)} failed)")
+    print(f"readings seen by every connection: {len(spreads)}")
+    if spreads:
+        print(
+            f"broadcast spread: {percentile(spreads, 50):8.1f} ms p50, {max(spreads):8.1f} ms max"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    modes = parser.add_subparsers(dest="mode", required=True)
+    hub = modes.add_parser("hub")
+    hub.add_argument("--subscribers", type=int, default=10_000)
+    hub.add_argument("--messages", type=int, default=20)
+    hub.add_argument("--interval", type=float, default=0.05)
+    http = modes.add_parser("http")
+    http.add_argument("--url", default="http://localhost:8000")
+    http.add_argument("--token", required=True)
+    http.add_argument("--connections", type=int, default=1000)
+    http.add_argument("--seconds", type=float, default=30)
+    args = parser.parse_args()
+    asyncio.run(hub_mode(args) if args.mode == "hub" else http_mode(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Load test of a database-backed route served on a sync session, holding a
+threadpool thread per request as the routes used to, against the same
+query on an AsyncSession through run_sync.
+
+Both routes count the unread notifications of the first superuser and
+authenticate like the real ones. Run it against a seeded database:
+
+    python benchmarks/db_async_load.py --requests 5000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import timedelta
+
+import httpx
+from fastapi import FastAPI
+from sqlmodel import Session
+
+from app import crud
+from app.api.deps import AsyncCurrentUser, AsyncSessionDep, CurrentUser, SessionDep
+from app.core.config import settings
+from app.core.db import async_engine, engine, pool_stats
+from app.core.security import create_access_token
+
+bench_app = FastAPI()
+
+
+@bench_app.get("/sync")
+def sync_route(session: SessionDep, current_user: CurrentUser) -> int:
+    return crud.count_unread_notifications(session, current_user.id)
+
+
+@bench_app.get("/async")
+async def async_route(session: AsyncSessionDep, current_user: AsyncCurrentUser) -> int:
+    return await session.run_sync(crud.count_unread_notifications, current_user.id)
+
+
+async def load(
+    path: str, token: str, requests: int, concurrency: int
+) -> tuple[float, list[float]]:
+    transport = httpx.ASGITransport(app=bench_app)
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies: list[float] = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one() -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                r = await client.get(path, headers=headers)
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    return requests / elapsed, latencies
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=settings.FIRST_SUPERUSER)
+        assert user is not None
+    token = create_access_token(user.id, expires_delta=timedelta(minutes=10))
+
+    for path, db_engine in (("/sync", engine), ("/async", async_engine)):
+        # Warm up the pool and the user cache
+        await load(path, token, 100, args.concurrency)
+        rate, latencies = await load(path, token, args.requests, args.concurrency)
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        print(
+            f"{path:>6}: {rate:7.0f} req/s, p50 {statistics.median(latencies) * 1000:6.1f} ms, "
+            f"p99 {p99 * 1000:6.1f} ms, pool {pool_stats(db_engine)}"
+        )
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
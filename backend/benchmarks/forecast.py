@@ -0,0 +1,63 @@
+"""
+CPU cost of keeping next-value predictions current: refitting a
+LinearRegression on the latest 20 readings, as /predict-next used to,
+against one online Holt update per reading.
+
+Refitting after every reading is what keeping the old model fresh would
+take; the old code refit once a minute per user instead, trading CPU for
+stale predictions.
+
+    python benchmarks/forecast.py --readings 20000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.linear_model import LinearRegression
+
+from app.core.forecast import HoltState, holt_update
+
+WINDOW = 20
+
+
+def refit(series: np.ndarray) -> float:
+    predicted = 0.0
+    for end in range(WINDOW, len(series)):
+        values = series[end - WINDOW : end].reshape(-1, 1)
+        model = LinearRegression().fit(np.arange(WINDOW).reshape(-1, 1), values)
+        predicted = model.predict(np.array([[WINDOW]]))[0][0]
+    return predicted
+
+
+def online(series: np.ndarray) -> float:
+    state = HoltState()
+    ts_ms = np.arange(len(series))
+    for i in range(len(series)):
+        state = holt_update(
+            state, ts_ms[i : i + 1], series[i : i + 1], alpha=0.5, beta=0.1
+        )
+    return state.forecast()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readings", type=int, default=20_000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    series = 25 + np.cumsum(rng.normal(0, 0.05, args.readings))
+
+    for name, fn, count in (
+        ("refit", refit, args.readings - WINDOW),
+        ("online", online, args.readings),
+    ):
+        started = time.process_time()
+        predicted = fn(series)
+        cpu = time.process_time() - started
+        print(
+            f"{name:>7}: {cpu / count * 1e6:9.2f} µs CPU per reading, next {predicted:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
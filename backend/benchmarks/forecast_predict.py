@@ -0,0 +1,82 @@
+"""
+Latency of /predict-next: loading a joblib model from disk and querying
+the latest 20 readings on every request, as the endpoint used to, against
+the forecaster's in-memory states, with and without the once per persist
+interval version check.
+
+    python benchmarks/forecast_predict.py --requests 2000
+"""
+
+import argparse
+import os
+import tempfile
+import uuid
+
+import joblib
+import numpy as np
+from sklearn.linear_model import LinearRegression
+from sqlmodel import Session
+from utils import delete_readings, seed_readings, timed
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.forecast import Forecaster
+
+WINDOW = 20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    device_id = uuid.uuid4()
+    path = os.path.join(tempfile.mkdtemp(), "model.pkl")
+    joblib.dump(
+        LinearRegression().fit(np.arange(WINDOW).reshape(-1, 1), np.arange(WINDOW)),
+        path,
+    )
+    cached = Forecaster(
+        alpha=settings.FORECAST_ALPHA,
+        beta=settings.FORECAST_BETA,
+        warmup=settings.FORECAST_WARMUP_READINGS,
+        persist_interval=3600,
+        max_devices=settings.FORECAST_MAX_DEVICES,
+    )
+    revalidated = Forecaster(
+        alpha=settings.FORECAST_ALPHA,
+        beta=settings.FORECAST_BETA,
+        warmup=settings.FORECAST_WARMUP_READINGS,
+        persist_interval=0,
+        max_devices=settings.FORECAST_MAX_DEVICES,
+    )
+
+    def from_disk() -> None:
+        model = joblib.load(path)
+        data = crud.get_latest_readings(session, device_id=device_id, limit=WINDOW)
+        model.predict(np.array([[len(data)]]))
+
+    with Session(engine) as session:
+        seed_readings(session, device_id, 0, 10_000)
+        try:
+            cached.predict(session, device_id, "temperature")
+            revalidated.predict(session, device_id, "temperature")
+            for name, fn in (
+                ("joblib + query", from_disk),
+                (
+                    "revalidated",
+                    lambda: revalidated.predict(session, device_id, "temperature"),
+                ),
+                (
+                    "in memory",
+                    lambda: cached.predict(session, device_id, "temperature"),
+                ),
+            ):
+                print(f"{name:>15}: {timed(fn, args.requests) * 1000:9.1f} µs median")
+        finally:
+            delete_readings(session, device_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Event loop lag of an API worker while forecast parameters are tuned:
+fitting in a thread of the worker, where the NumPy loop holds the GIL
+between small array operations, against fitting in a process pool.
+
+    python benchmarks/forecast_tuning.py --fits 20 --window 1000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from app.core.tuning import fit_parameters
+
+
+async def lag_while_fitting(
+    executor: Executor, series: np.ndarray, fits: int
+) -> list[float]:
+    loop = asyncio.get_running_loop()
+    lags: list[float] = []
+    done = False
+
+    async def probe() -> None:
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    task = asyncio.create_task(probe())
+    for _ in range(fits):
+        await loop.run_in_executor(executor, fit_parameters, series)
+    done = True
+    await task
+    return lags
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fits", type=int, default=20)
+    parser.add_argument("--window", type=int, default=1000)
+    args = parser.parse_args()
+    series = np.cumsum(np.random.default_rng(0).normal(0, 1, args.window))
+
+    started = time.process_time()
+    fit_parameters(series)
+    print(f"one fit: {(time.process_time() - started) * 1000:.1f} ms CPU")
+
+    for name, executor in (
+        ("thread", ThreadPoolExecutor(1)),
+        (
+            "process",
+            ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")),
+        ),
+    ):
+        with executor:
+            # Warm up the worker so process start-up is not measured
+            executor.submit(fit_parameters, series[:10]).result()
+            lags = (
+                np.array(asyncio.run(lag_while_fitting(executor, series, args.fits)))
+                * 1000
+            )
+        print(
+            f"{name:>8}: loop lag p50 {np.percentile(lags, 50):.2f} ms, "
+            f"p99 {np.percentile(lags, 99):.2f} ms, max {lags.max():.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
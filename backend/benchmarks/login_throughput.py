@@ -0,0 +1,82 @@
+"""
+Login throughput under concurrent load, and the latency another request
+sees meanwhile, with passwords checked in the hashing process pool or,
+as before, in threads of the web worker.
+
+    python benchmarks/login_throughput.py --logins 200 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.core.config import settings
+from app.core.security import password_hasher
+from app.main import app
+
+
+async def run(logins: int, concurrency: int) -> tuple[float, list[float], int]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        url = f"{settings.API_V1_STR}/login/access-token"
+        data = {
+            "username": settings.FIRST_SUPERUSER,
+            "password": settings.FIRST_SUPERUSER_PASSWORD,
+        }
+        semaphore = asyncio.Semaphore(concurrency)
+        rejected = 0
+        latencies: list[float] = []
+        done = False
+
+        async def login() -> None:
+            nonlocal rejected
+            async with semaphore:
+                r = await client.post(url, data=data)
+                rejected += r.status_code == 503
+
+        async def probe() -> None:
+            while not done:
+                started = time.perf_counter()
+                await client.get(f"{settings.API_V1_STR}/utils/health-check/")
+                latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done = True
+        await probe_task
+    return logins / elapsed, latencies, rejected
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    for name in ("thread", "process pool"):
+        if name == "process pool":
+            await password_hasher.start()
+            # Warm up the worker processes
+            await asyncio.gather(
+                *(
+                    password_hasher.hash("warmup")
+                    for _ in range(password_hasher.max_workers)
+                )
+            )
+        rate, latencies, rejected = await run(args.logins, args.concurrency)
+        print(
+            f"{name:>12}: {rate:6.1f} logins/s, {rejected} rejected, other requests "
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+            f"max {max(latencies) * 1000:.1f} ms"
+        )
+    await password_hasher.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""
+Cost of notification bulk operations as a user's history grows: marking
+everything read row by row through the ORM, as crud used to, against one
+set-based UPDATE, and pruning old notifications in retention batches.
+
+    python benchmarks/notification_bulk.py --sizes 1000,10000,100000
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlmodel import Session, delete, select
+
+from app import crud
+from app.core.db import engine
+from app.core.notifications import RetentionJob
+from app.models import Notification, User, UserCreate
+
+SEED_SQL = text(
+    """
+    INSERT INTO notification (id, user_id, message, is_read, created_at)
+    SELECT gen_random_uuid(), :user_id, 'Temperature is above 30 (actual: 31)', false,
+           :start + make_interval(secs => g)
+    FROM generate_series(1, :count) AS g
+    """
+)
+
+
+def seed(session: Session, user: User, count: int, start: datetime) -> None:
+    session.execute(SEED_SQL, {"user_id": user.id, "count": count, "start": start})
+    session.commit()
+    session.execute(text("ANALYZE notification"))
+
+
+def row_by_row_read_all(session: Session, user: User) -> None:
+    for notification in session.exec(
+        select(Notification).where(Notification.user_id == user.id)
+    ):
+        notification.is_read = True
+        session.add(notification)
+    session.commit()
+
+
+def timed(fn) -> float:  # type: ignore[no-untyped-def]
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        user = crud.create_user(
+            session=session,
+            user_create=UserCreate(
+                email="notification-bulk-bench@example.com", password="benchmark"
+            ),
+        )
+        # Far in the past so the retention run only sees these rows
+        start = datetime(2000, 1, 1)
+        job = RetentionJob(
+            retention_days=1, batch_size=args.batch_size, interval=0, archive=False
+        )
+        print(f"{'rows':>8} {'row-by-row':>12} {'set-based':>12} {'retention':>12}")
+        try:
+            for size in map(int, args.sizes.split(",")):
+                seed(session, user, size, start)
+                row_by_row = timed(lambda: row_by_row_read_all(session, user))
+                session.execute(
+                    text("UPDATE notification SET is_read = false WHERE user_id = :u"),
+                    {"u": user.id},
+                )
+                session.commit()
+                set_based = timed(
+                    lambda: crud.mark_all_notifications_read(session, user.id)
+                )
+                pruned = timed(lambda: job.run_once(now=start + timedelta(days=365)))
+                print(
+                    f"{size:>8} {row_by_row:>10.1f}ms {set_based:>10.1f}ms {pruned:>10.1f}ms"
+                )
+        finally:
+            session.exec(delete(Notification).where(Notification.user_id == user.id))  # type: ignore
+            session.exec(delete(User).where(User.id == user.id))  # type: ignore
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
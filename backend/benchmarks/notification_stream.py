@@ -0,0 +1,103 @@
+"""
+Push delivery of notifications to 10k concurrent per-user subscribers on
+one node.
+
+Every subscriber is a task waiting on its own user topic, as an open
+/notifications/stream does. Notifications are published to random users,
+either straight to the hub or, with --backplane, through pg_notify and the
+LISTEN connection every worker runs, and the time to reach the subscriber
+is recorded.
+
+    python benchmarks/notification_stream.py --subscribers 10000 --notifications 2000
+    python benchmarks/notification_stream.py --backplane
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+
+from sqlalchemy import text
+from utils import peak_rss_mb
+
+from app.core.db import engine
+from app.core.hub import Hub
+from app.core.pubsub import CHANNEL, NotificationListener, deliver
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    hub = Hub()
+    users = [str(uuid.uuid4()) for _ in range(args.subscribers)]
+    latencies: list[float] = []
+    remaining = args.notifications
+    done = asyncio.Event()
+
+    async def subscriber(user_id: str) -> None:
+        nonlocal remaining
+        with hub.subscribe(user_id) as subscription:
+            async for message in subscription:
+                latencies.append(time.time() - float(message))
+                remaining -= 1
+                if remaining == 0:
+                    done.set()
+
+    rss_before = peak_rss_mb()
+    tasks = [asyncio.create_task(subscriber(user_id)) for user_id in users]
+    await asyncio.sleep(0.1)
+    rss = peak_rss_mb() - rss_before
+
+    listener = None
+    if args.backplane:
+        url = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        listener = NotificationListener(url, hub)
+        await listener.start()
+        await asyncio.sleep(1)
+
+    started = time.perf_counter()
+    for _ in range(args.notifications):
+        line = f"{random.choice(users)} {time.time()!r}"
+        if listener is None:
+            deliver(line, hub)
+        else:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": CHANNEL, "payload": line},
+                )
+        await asyncio.sleep(0)
+    await asyncio.wait_for(done.wait(), 30)
+    elapsed = time.perf_counter() - started
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if listener is not None:
+        await listener.stop()
+
+    latencies_ms = sorted(s * 1000 for s in latencies)
+    p99 = latencies_ms[int(len(latencies_ms) * 0.99) - 1]
+    print(
+        f"{args.subscribers} subscribers, {args.notifications} notifications"
+        f" ({'backplane' if listener else 'in-process'})"
+    )
+    print(f"throughput:       {args.notifications / elapsed:10.0f} notifications/s")
+    print(
+        f"delivery latency: {statistics.median(latencies_ms):10.2f} ms p50, {p99:.2f} ms p99"
+    )
+    print(f"memory:           {rss * 1024 / args.subscribers:10.2f} KiB per subscriber")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--notifications", type=int, default=2_000)
+    parser.add_argument("--backplane", action="store_true")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
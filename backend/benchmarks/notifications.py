@@ -0,0 +1,63 @@
+"""
+Notification write throughput: one add/commit/refresh per notification, as
+crud.create_notification does, against crud.create_notifications writing a
+whole batch with one INSERT ... RETURNING.
+
+    python benchmarks/notifications.py --count 5000 --batch-sizes 10,100,1000
+"""
+
+import argparse
+import time
+
+from sqlmodel import Session, delete
+
+from app import crud
+from app.core.db import engine
+from app.models import Notification, NotificationCreate, User, UserCreate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--batch-sizes", default="10,100,1000")
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        user = crud.create_user(
+            session=session,
+            user_create=UserCreate(
+                email="notifications-bench@example.com", password="benchmark"
+            ),
+        )
+        notes = [
+            NotificationCreate(
+                message=f"Temperature is above 30 (actual: {i})", user_id=user.id
+            )
+            for i in range(args.count)
+        ]
+        try:
+            started = time.perf_counter()
+            for note in notes:
+                crud.create_notification(session=session, notification_create=note)
+            elapsed = time.perf_counter() - started
+            print(f"one per commit:   {args.count / elapsed:10.0f} notifications/s")
+
+            for batch_size in map(int, args.batch_sizes.split(",")):
+                started = time.perf_counter()
+                for start in range(0, args.count, batch_size):
+                    crud.create_notifications(
+                        session=session, notifications=notes[start : start + batch_size]
+                    )
+                    session.commit()
+                elapsed = time.perf_counter() - started
+                print(
+                    f"batches of {batch_size:<5} {args.count / elapsed:10.0f} notifications/s"
+                )
+        finally:
+            session.exec(delete(Notification).where(Notification.user_id == user.id))  # type: ignore
+            session.exec(delete(User).where(User.id == user.id))  # type: ignore
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
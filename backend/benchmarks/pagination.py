@@ -0,0 +1,95 @@
+"""
+Latency of page 1 and page 1000 of the /items listing, paged with OFFSET
+as the route used to against the (created_at, id) cursor, and of the exact
+count of every item against its estimate from pg_class.reltuples.
+
+    python benchmarks/pagination.py --items 200000 --limit 100 --page 1000
+"""
+
+import argparse
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlmodel import Session, func, select
+from utils import timed
+
+from app import crud
+from app.core.db import engine
+from app.models import Item
+
+USER_SQL = text(
+    """
+    INSERT INTO "user" (id, email, is_active, is_superuser, hashed_password, created_at)
+    VALUES (:user_id, :email, true, false, '', now() AT TIME ZONE 'UTC')
+    """
+)
+
+ITEMS_SQL = text(
+    """
+    INSERT INTO item (id, title, owner_id, created_at)
+    SELECT gen_random_uuid(), 'benchmark ' || g, :user_id,
+           now() AT TIME ZONE 'UTC' - make_interval(secs => g)
+    FROM generate_series(1, :items) AS g
+    """
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    user_id = uuid.uuid4()
+    with Session(engine) as session:
+        session.execute(
+            USER_SQL, {"user_id": user_id, "email": f"{user_id}@example.com"}
+        )
+        session.execute(ITEMS_SQL, {"user_id": user_id, "items": args.items})
+        session.commit()
+        session.execute(text("ANALYZE item"))
+        try:
+            for page in (1, args.page):
+                skip = (page - 1) * args.limit
+                after = None
+                if skip:
+                    last = crud.get_items_page(
+                        session, owner_id=user_id, skip=skip - 1, limit=1
+                    )[0]
+                    after = (last.created_at, last.id)
+
+                def offset(skip: int = skip) -> None:
+                    crud.get_items_page(
+                        session, owner_id=user_id, skip=skip, limit=args.limit
+                    )
+
+                def cursor(after: tuple[datetime, uuid.UUID] | None = after) -> None:
+                    crud.get_items_page(
+                        session, owner_id=user_id, after=after, limit=args.limit
+                    )
+
+                print(
+                    f"page {page:>5}: offset {timed(offset, args.repeat):8.2f} ms, "
+                    f"cursor {timed(cursor, args.repeat):8.2f} ms median"
+                )
+
+            def exact() -> None:
+                session.exec(select(func.count()).select_from(Item)).one()
+
+            print(
+                f"count: exact {timed(exact, args.repeat):8.2f} ms, "
+                f"estimate {timed(lambda: crud.estimate_count(session, Item), args.repeat):8.2f} ms median"
+            )
+        finally:
+            # Their items cascade
+            session.execute(
+                text('DELETE FROM "user" WHERE id = :user_id'), {"user_id": user_id}
+            )
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
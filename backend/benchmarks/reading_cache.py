@@ -0,0 +1,82 @@
+"""
+Upstream calls and latency of on-demand latest readings with and without the
+reading cache, for N concurrent users polling one device through a stub
+CoreIoT that answers after a fixed delay.
+
+    python benchmarks/reading_cache.py --users 200 --seconds 10 --delay 0.15
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timezone
+
+from app.core.cache import ReadingCache
+from app.models import CoreIoTData
+
+
+class Upstream:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> CoreIoTData:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return CoreIoTData(
+            temperature=25, humidity=40, light=100, timestamp=datetime.now(timezone.utc)
+        )
+
+
+async def poll(fetch, seconds: float, interval: float, latencies: list[float]) -> None:  # type: ignore[no-untyped-def]
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await fetch()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def run(args: argparse.Namespace, cached: bool) -> None:
+    upstream = Upstream(args.delay)
+    cache = ReadingCache(ttl=2, stale_ttl=30, revalidate_timeout=0.05, max_entries=1024)
+    if cached:
+
+        async def fetch() -> CoreIoTData:
+            return await cache.get("device", "token", upstream)
+    else:
+        fetch = upstream
+    latencies: list[float] = []
+    await asyncio.gather(
+        *(
+            poll(fetch, args.seconds, args.interval, latencies)
+            for _ in range(args.users)
+        )
+    )
+    p50, p99 = (
+        statistics.quantiles(latencies, n=100)[49],
+        statistics.quantiles(latencies, n=100)[98],
+    )
+    label = "cached" if cached else "direct"
+    print(
+        f"{label}: {len(latencies)} requests, {upstream.calls} upstream calls, "
+        f"p50 {p50:.1f}ms, p99 {p99:.1f}ms"
+    )
+    if cached:
+        print(f"  {cache.stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--delay", type=float, default=0.15)
+    args = parser.parse_args()
+    asyncio.run(run(args, cached=False))
+    asyncio.run(run(args, cached=True))
+
+
+if __name__ == "__main__":
+    main()
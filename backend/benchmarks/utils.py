@@ -0,0 +1,71 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+"""
+
+import resource
+import statistics
+import time
+import uuid
+from collections.abc import Callable
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+DEVICE_SQL = text(
+    """
+    INSERT INTO device (id, name, created_at)
+    VALUES (:device_id, 'benchmark', now() AT TIME ZONE 'UTC')
+    ON CONFLICT (id) DO NOTHING
+    """
+)
+
+SEED_SQL = text(
+    """
+    INSERT INTO coreiotdata (id, device_id, temperature, humidity, light, timestamp)
+    SELECT gen_random_uuid(), :device_id, 20 + random() * 10, 40 + random() * 30,
+           random() * 1000, now() - make_interval(secs => g)
+    FROM generate_series(:start, :stop - 1) AS g
+    """
+)
+
+
+def create_device(session: Session, device_id: uuid.UUID) -> None:
+    session.execute(DEVICE_SQL, {"device_id": device_id})
+    session.commit()
+
+
+def seed_readings(
+    session: Session, device_id: uuid.UUID, start: int, stop: int
+) -> None:
+    """
+    Insert readings number `start` to `stop` of a device, one per second
+    going back from now.
+    """
+    session.execute(DEVICE_SQL, {"device_id": device_id})
+    session.execute(SEED_SQL, {"device_id": device_id, "start": start, "stop": stop})
+    session.commit()
+    session.execute(text("ANALYZE coreiotdata"))
+
+
+def delete_readings(session: Session, device_id: uuid.UUID) -> None:
+    # Readings and rollups cascade
+    session.execute(
+        text("DELETE FROM device WHERE id = :device_id"), {"device_id": device_id}
+    )
+    session.commit()
+
+
+def timed(fn: Callable[[], object], repeat: int) -> float:
+    """
+    Median wall time of `fn` in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -9,7 +9,7 @@ import {
   Spinner,
 } from "@chakra-ui/react";
 import { FiBell, FiCheckCircle, FiInbox } from "react-icons/fi";
-import { useNotifications } from "../../hooks/useNotifications";
+import { useNotificationStream, useNotifications, useUnreadCount } from "../../hooks/useNotifications";
 
 // function timeAgo(date: Date) {
 //   const now = new Date();
@@ -28,28 +28,28 @@ import { useNotifications } from "../../hooks/useNotifications";
 // }
 
 export default function NotificationBell() {
-  const { data: notifications = [], isLoading, refetch } = useNotifications();
+  const { data: notifications = [], isLoading, reload } = useNotifications();
+  const { data: unreadCount = 0, refetch: refetchUnreadCount } = useUnreadCount();
+  useNotificationStream();
   const [tab, setTab] = useState<"all" | "unread" | "action">("all");
   const unread = notifications.filter(n => !n.is_read);
   const requiresAction = notifications.filter(n => n.message.toLowerCase().includes("action"));
   const [animate, setAnimate] = useState(false);
-  const prevUnread = useRef(unread.length);
+  const prevUnread = useRef(unreadCount);
 
   // Animate bell when new notification arrives
   useEffect(() => {
-    if (unread.length > prevUnread.current) {
+    if (unreadCount > prevUnread.current) {
       setAnimate(true);
       setTimeout(() => setAnimate(false), 700);
     }
-    prevUnread.current = unread.length;
-  }, [unread.length]);
+    prevUnread.current = unreadCount;
+  }, [unreadCount]);
 
-  useEffect(() => {
-    const interval = setInterval(() => {
-      refetch();
-    }, 1500); // 1.5 seconds
-    return () => clearInterval(interval);
-  }, [refetch]);
+  function refetch() {
+    reload();
+    refetchUnreadCount();
+  }
 
   async function markAllRead() {
     await fetch(`http://localhost:8000/api/v1/notifications/read-all`, {
@@ -141,7 +141,7 @@ export default function NotificationBell() {
           >
             <FiBell size={24} />
           </IconButton>
-          {unread.length > 0 && (
+          {unreadCount > 0 && (
             <Box
               as="span"
               position="absolute"
@@ -186,7 +186,7 @@ export default function NotificationBell() {
         >
           <Box px={5} pt={4} pb={2} borderBottom="1px solid #e2e8f0" display="flex" alignItems="center" justifyContent="space-between">
             <Text fontWeight="bold">Notifications ({notifications.length})</Text>
-            {unread.length > 0 && (
+            {unreadCount > 0 && (
               <Button size="xs" variant="ghost" colorScheme="teal" onClick={markAllRead}>
                 Mark all read
               </Button>
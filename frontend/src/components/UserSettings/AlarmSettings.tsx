@@ -23,6 +23,9 @@ export default function AlarmSettings() {
     threshold_type: "above",
     value: "",
     is_active: true,
+    hysteresis: "0",
+    min_duration_seconds: "0",
+    cooldown_seconds: "0",
   })
 
   function handleChange(e: any) {
@@ -37,12 +40,23 @@ export default function AlarmSettings() {
       threshold_type: alarm.threshold_type,
       value: alarm.value,
       is_active: alarm.is_active,
+      hysteresis: String(alarm.hysteresis),
+      min_duration_seconds: String(alarm.min_duration_seconds),
+      cooldown_seconds: String(alarm.cooldown_seconds),
     })
   }
 
   function stopEdit() {
     setEditing(null)
-    setForm({ type: "temperature", threshold_type: "above", value: "", is_active: true })
+    setForm({
+      type: "temperature",
+      threshold_type: "above",
+      value: "",
+      is_active: true,
+      hysteresis: "0",
+      min_duration_seconds: "0",
+      cooldown_seconds: "0",
+    })
   }
 
   async function handleSubmit(e: any) {
@@ -50,7 +64,12 @@ export default function AlarmSettings() {
     const token = localStorage.getItem("access_token")
     let url = "http://localhost:8000/api/v1/alarms"
     let method = "POST"
-    let body: any = { ...form, value: parseFloat(form.value) }
+    const timing = {
+      hysteresis: parseFloat(form.hysteresis) || 0,
+      min_duration_seconds: parseInt(form.min_duration_seconds) || 0,
+      cooldown_seconds: parseInt(form.cooldown_seconds) || 0,
+    }
+    let body: any = { ...form, ...timing, value: parseFloat(form.value) }
     if (editing) {
       url = `http://localhost:8000/api/v1/alarms/${editing.id}`
       method = "PATCH"
@@ -60,6 +79,7 @@ export default function AlarmSettings() {
       if (form.threshold_type !== undefined) body.threshold_type = form.threshold_type
       if (form.value !== undefined) body.value = parseFloat(form.value)
       if (form.is_active !== undefined) body.is_active = form.is_active
+      Object.assign(body, timing)
     }
     const res = await fetch(url, {
       method,
@@ -110,6 +130,18 @@ export default function AlarmSettings() {
             <label>Value</label>
             <Input name="value" type="number" value={form.value} onChange={handleChange} required step="any" />
           </Box>
+          <Box w="100px">
+            <label>Hysteresis</label>
+            <Input name="hysteresis" type="number" value={form.hysteresis} onChange={handleChange} min={0} step="any" />
+          </Box>
+          <Box w="100px">
+            <label>Hold (s)</label>
+            <Input name="min_duration_seconds" type="number" value={form.min_duration_seconds} onChange={handleChange} min={0} step={1} />
+          </Box>
+          <Box w="100px">
+            <label>Cooldown (s)</label>
+            <Input name="cooldown_seconds" type="number" value={form.cooldown_seconds} onChange={handleChange} min={0} step={1} />
+          </Box>
           <Box display="flex" alignItems="center" w="120px">
             <label style={{ marginBottom: 0, marginRight: 8 }}>Active</label>
             <input type="checkbox" name="is_active" checked={form.is_active} onChange={handleChange} />
@@ -141,7 +173,9 @@ export default function AlarmSettings() {
                   <Table.Cell textTransform="capitalize">{alarm.threshold_type}</Table.Cell>
                   <Table.Cell>{alarm.value}</Table.Cell>
                   <Table.Cell>
-                    {alarm.is_active ? (
+                    {alarm.is_firing ? (
+                      <Badge colorScheme="orange">Firing</Badge>
+                    ) : alarm.is_active ? (
                       <Badge colorScheme="green">Active</Badge>
                     ) : (
                       <Badge colorScheme="red">Inactive</Badge>
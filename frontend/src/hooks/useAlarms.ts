@@ -8,6 +8,11 @@ export interface Alarm {
   threshold_type: string
   value: number
   is_active: boolean
+  hysteresis: number
+  min_duration_seconds: number
+  cooldown_seconds: number
+  is_firing: boolean
+  last_fired_at: string | null
   user_id: string
   created_at: string
   updated_at: string
@@ -1,7 +1,12 @@
-import { useQuery } from "@tanstack/react-query"
+import { useEffect } from "react"
+import { useQuery, useQueryClient } from "@tanstack/react-query"
 import axios from "axios"
 import { isLoggedIn } from "./useAuth"
 
+const API_URL = "http://localhost:8000/api/v1/notifications"
+// How many notifications the bell keeps once new ones are merged in
+const MAX_NOTIFICATIONS = 200
+
 export interface Notification {
   id: string
   message: string
@@ -11,25 +16,88 @@ export interface Notification {
   created_at: Date
 }
 
+interface NotificationFeed {
+  items: Notification[]
+  cursor: string | null
+}
+
+function authHeaders() {
+  const token = localStorage.getItem("access_token")
+  if (!token) {
+    throw new Error("Not authenticated")
+  }
+  return { Authorization: `Bearer ${token}` }
+}
+
 export function useNotifications() {
-  return useQuery<Notification[]>({
+  const queryClient = useQueryClient()
+  const query = useQuery<NotificationFeed>({
     queryKey: ["notifications"],
     queryFn: async () => {
-      const token = localStorage.getItem("access_token")
-      if (!token) {
-        throw new Error("Not authenticated")
-      }
-      const response = await axios.get<{ data: Notification[] }>(
-        "http://localhost:8000/api/v1/notifications",
+      // After the first page only ask for what is newer than the cursor,
+      // an unchanged feed is answered with an empty page or a 304
+      const previous = queryClient.getQueryData<NotificationFeed>(["notifications"])
+      const response = await axios.get<{ data: Notification[]; cursor: string | null }>(
+        API_URL,
         {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
+          params: previous?.cursor ? { since: previous.cursor } : { limit: 50 },
+          headers: authHeaders(),
           withCredentials: true,
         }
       )
-      return response.data.data
+      if (!previous?.cursor) {
+        return { items: response.data.data, cursor: response.data.cursor }
+      }
+      if (response.data.data.length === 0) {
+        return previous
+      }
+      // One that committed late can be older than ones already shown
+      return {
+        items: [...previous.items, ...response.data.data]
+          .sort((a, b) => (a.created_at < b.created_at ? 1 : a.created_at > b.created_at ? -1 : 0))
+          .slice(0, MAX_NOTIFICATIONS),
+        cursor: response.data.cursor,
+      }
     },
+    // New notifications are pushed by useNotificationStream, this only
+    // catches up on ones missed while it was reconnecting
+    refetchInterval: 60000,
     enabled: isLoggedIn(),
   })
-} 
\ No newline at end of file
+  // Read state changes are not part of the since-feed, start over after them
+  const reload = () => queryClient.resetQueries({ queryKey: ["notifications"] })
+  return { ...query, data: query.data?.items, reload }
+}
+
+export function useUnreadCount() {
+  return useQuery<number>({
+    queryKey: ["notifications-unread-count"],
+    queryFn: async () => {
+      const response = await axios.get<{ count: number }>(`${API_URL}/unread-count`, {
+        headers: authHeaders(),
+        withCredentials: true,
+      })
+      return response.data.count
+    },
+    refetchInterval: 60000,
+    enabled: isLoggedIn(),
+  })
+}
+
+export function useNotificationStream() {
+  const queryClient = useQueryClient()
+  useEffect(() => {
+    const token = localStorage.getItem("access_token")
+    if (!token) {
+      return
+    }
+    const source = new EventSource(`${API_URL}/stream?token=${encodeURIComponent(token)}`)
+    source.addEventListener("notification", () => {
+      // Fetching past the cursor picks up the new notification and keeps
+      // the feed's cursor in step
+      queryClient.invalidateQueries({ queryKey: ["notifications"] })
+      queryClient.invalidateQueries({ queryKey: ["notifications-unread-count"] })
+    })
+    return () => source.close()
+  }, [queryClient])
+}
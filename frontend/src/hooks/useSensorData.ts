@@ -1,4 +1,5 @@
-import { useQuery, useMutation } from "@tanstack/react-query"
+import { useEffect, useState } from "react"
+import { QueryClient, useQuery, useMutation, useQueryClient } from "@tanstack/react-query"
 import axios from "axios"
 import { isLoggedIn } from "./useAuth"
 
@@ -15,31 +16,6 @@ interface ChartDataPoint {
   unit: string
 }
 
-export function useSensorData(type: 'temperature' | 'humidity' | 'light') {
-  return useQuery({
-    queryKey: ['coreiot-data', type],
-    queryFn: async () => {
-      const token = localStorage.getItem('access_token')
-      if (!token) {
-        throw new Error('Not authenticated')
-      }
-      
-      const response = await axios.get<CoreIoTData>('http://localhost:8000/api/v1/coreiot/coreiot-data', {
-        headers: {
-          Authorization: `Bearer ${token}`
-        }
-      })
-      return {
-        value: response.data[type],
-        timestamp: response.data.timestamp,
-        unit: type === 'temperature' ? '°C' : type === 'humidity' ? '%' : 'lux'
-      }
-    },
-    refetchInterval: 1000, // Refetch every 1 second
-    enabled: isLoggedIn()
-  })
-} 
-
 export function useDailySensorData(type: 'temperature' | 'humidity' | 'light') {
   return useQuery({
     queryKey: ['coreiot-daily-data', type],
@@ -70,31 +46,135 @@ export function useDailySensorData(type: 'temperature' | 'humidity' | 'light') {
   })
 } 
 
-export function usePredictNextMetric(type: 'temperature' | 'humidity' | 'light') {
+interface MetricForecast {
+  metric: 'temperature' | 'humidity' | 'light'
+  count: number
+  last_timestamp: string
+  predicted: number[]
+  lower: number[]
+  upper: number[]
+}
+
+interface Forecast {
+  steps: number
+  confidence: number
+  data: MetricForecast[]
+}
+
+// Forecasts of every metric in one request, shared by the metric hooks below
+export function useForecast(steps = 1) {
   return useQuery({
-    queryKey: ['coreiot-predict-next', type],
+    queryKey: ['coreiot-forecast', steps],
     queryFn: async () => {
       const token = localStorage.getItem('access_token')
       if (!token) {
         throw new Error('Not authenticated')
       }
-      const response = await axios.get<{ predicted_next: number }>('http://localhost:8000/api/v1/coreiot/predict-next', {
-        params: { type },
+      const response = await axios.get<Forecast>('http://localhost:8000/api/v1/coreiot/forecast', {
+        params: { steps },
         headers: {
           Authorization: `Bearer ${token}`
         }
       })
-      return {
-        value: response.data.predicted_next,
-        unit: type === 'temperature' ? '°C' : type === 'humidity' ? '%' : 'lux'
-      }
+      return response.data
     },
     refetchInterval: 1000, // Refetch every 1 second
     enabled: isLoggedIn()
   })
-} 
+}
+
+export function usePredictNextMetric(type: 'temperature' | 'humidity' | 'light') {
+  const query = useForecast()
+  const forecast = query.data?.data.find(f => f.metric === type)
+  const data = forecast && {
+    value: forecast.predicted[0],
+    lower: forecast.lower[0],
+    upper: forecast.upper[0],
+    unit: type === 'temperature' ? '°C' : type === 'humidity' ? '%' : 'lux'
+  }
+  const error = query.error ?? (query.data && !forecast ? new Error('Not enough data to predict') : null)
+  return { ...query, data, error }
+}
+
+const API_URL = 'http://localhost:8000/api/v1/coreiot'
+
+// One EventSource shared by every mounted component, readings are pushed by
+// the server as the backend polls CoreIoT instead of being polled from here
+let liveSource: EventSource | null = null
+let liveSubscribers = 0
+let liveRetry: ReturnType<typeof setTimeout> | null = null
+// Whether the stream is up, the readings are polled while it is not
+let liveConnected = true
+const liveListeners = new Set<(connected: boolean) => void>()
+
+// Polling interval while the stream is down, and how long to wait before
+// reopening a stream the server refused (a 503 is not retried by the browser)
+const POLL_INTERVAL = 5000
+const STREAM_RETRY_INTERVAL = 30000
+
+function setLiveConnected(connected: boolean) {
+  liveConnected = connected
+  liveListeners.forEach(listener => listener(connected))
+}
+
+function openLiveSource(queryClient: QueryClient, token: string) {
+  liveSource = new EventSource(`${API_URL}/stream?token=${encodeURIComponent(token)}`)
+  liveSource.addEventListener('open', () => {
+    if (!liveConnected) {
+      // Catch up on what was missed while polling
+      queryClient.invalidateQueries({ queryKey: ['coreiot-data'] })
+    }
+    setLiveConnected(true)
+  })
+  liveSource.addEventListener('reading', (event) => {
+    queryClient.setQueryData(['coreiot-data'], JSON.parse((event as MessageEvent).data))
+  })
+  liveSource.addEventListener('error', () => {
+    setLiveConnected(false)
+    if (liveSource?.readyState === EventSource.CLOSED) {
+      liveSource = null
+      liveRetry = setTimeout(() => {
+        liveRetry = null
+        if (liveSubscribers > 0 && !liveSource) {
+          openLiveSource(queryClient, token)
+        }
+      }, STREAM_RETRY_INTERVAL)
+    }
+  })
+}
+
+function useLiveReadings() {
+  const queryClient = useQueryClient()
+  const [connected, setConnected] = useState(liveConnected)
+  useEffect(() => {
+    const token = localStorage.getItem('access_token')
+    if (!token) {
+      return
+    }
+    liveListeners.add(setConnected)
+    if (!liveSource && !liveRetry) {
+      openLiveSource(queryClient, token)
+    }
+    liveSubscribers += 1
+    return () => {
+      liveListeners.delete(setConnected)
+      liveSubscribers -= 1
+      if (liveSubscribers === 0) {
+        liveSource?.close()
+        liveSource = null
+        if (liveRetry) {
+          clearTimeout(liveRetry)
+          liveRetry = null
+        }
+        liveConnected = true
+      }
+    }
+  }, [queryClient])
+  return connected
+}
 
 export function useAllSensorData() {
+  const connected = useLiveReadings()
   return useQuery({
     queryKey: ['coreiot-data'],
     queryFn: async () => {
@@ -102,17 +182,29 @@ export function useAllSensorData() {
       if (!token) {
         throw new Error('Not authenticated')
       }
-      const response = await axios.get<CoreIoTData>('http://localhost:8000/api/v1/coreiot/coreiot-data', {
+      const response = await axios.get<CoreIoTData>(`${API_URL}/coreiot-data`, {
         headers: {
           Authorization: `Bearer ${token}`
         }
       })
       return response.data
     },
-    refetchInterval: 1000, // Refetch every 1 second
+    // Kept up to date by the stream, polled while it is down
+    staleTime: connected ? Infinity : 0,
+    refetchInterval: connected ? false : POLL_INTERVAL,
     enabled: isLoggedIn()
   })
-} 
+}
+
+export function useSensorData(type: 'temperature' | 'humidity' | 'light') {
+  const query = useAllSensorData()
+  const data = query.data && {
+    value: query.data[type],
+    timestamp: query.data.timestamp,
+    unit: type === 'temperature' ? '°C' : type === 'humidity' ? '%' : 'lux'
+  }
+  return { ...query, data }
+}
 
 export function useControlFan() {
   return useMutation({
@@ -101,7 +101,7 @@ function IoT() {
                     {isSensorLoading ? "Loading..." : `${temperature}°C`}
                   </Text>
                   <Text color="gray.600" fontSize="md">
-                    {isPredictedTemperatureLoading ? "Predicting..." : predictedTemperatureError ? "Prediction unavailable" : predictedTemperature ? `Next: ${predictedTemperature.value.toFixed(2)}${predictedTemperature.unit}` : null}
+                    {isPredictedTemperatureLoading ? "Predicting..." : predictedTemperatureError ? "Prediction unavailable" : predictedTemperature ? `Next: ${predictedTemperature.value.toFixed(2)}${predictedTemperature.unit} (±${((predictedTemperature.upper - predictedTemperature.lower) / 2).toFixed(2)})` : null}
                   </Text>
                   <Text color="gray.500" fontSize="sm">
                     Last updated: {isSensorLoading ? "..." : new Date(lastUpdated || "").toLocaleTimeString()}
@@ -133,7 +133,7 @@ function IoT() {
                     {isSensorLoading ? "Loading..." : `${humidity}%`}
                   </Text>
                   <Text color="gray.600" fontSize="md">
-                    {isPredictedHumidityLoading ? "Predicting..." : predictedHumidityError ? "Prediction unavailable" : predictedHumidity ? `Next: ${predictedHumidity.value.toFixed(2)}${predictedHumidity.unit}` : null}
+                    {isPredictedHumidityLoading ? "Predicting..." : predictedHumidityError ? "Prediction unavailable" : predictedHumidity ? `Next: ${predictedHumidity.value.toFixed(2)}${predictedHumidity.unit} (±${((predictedHumidity.upper - predictedHumidity.lower) / 2).toFixed(2)})` : null}
                   </Text>
                   <Text color="gray.500" fontSize="sm">
                     Last updated: {isSensorLoading ? "..." : new Date(lastUpdated || "").toLocaleTimeString()}
@@ -154,7 +154,7 @@ function IoT() {
                     {isSensorLoading ? "Loading..." : `${light} lux`} 
                   </Text>
                   <Text color="gray.600" fontSize="md">
-                    {isPredictedLightLoading ? "Predicting..." : predictedLightError ? "Prediction unavailable" : predictedLight ? `Next: ${predictedLight.value.toFixed(2)} ${predictedLight.unit}` : null}
+                    {isPredictedLightLoading ? "Predicting..." : predictedLightError ? "Prediction unavailable" : predictedLight ? `Next: ${predictedLight.value.toFixed(2)} ${predictedLight.unit} (±${((predictedLight.upper - predictedLight.lower) / 2).toFixed(2)})` : null}
                   </Text>
                   <Text color="gray.500" fontSize="sm">
                     Last updated: {isSensorLoading ? "..." : new Date(lastUpdated || "").toLocaleTimeString()}